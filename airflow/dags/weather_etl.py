@@ -1,200 +1,262 @@
 from airflow import DAG
+from airflow.decorators import task, task_group
 from airflow.operators.python import PythonOperator
-from airflow.operators.bash import BashOperator
 from datetime import datetime, timedelta
-import requests
-import json
 import logging
 import os
-import psycopg2
-from dotenv import load_dotenv
 
-# Load environment variables
-load_dotenv()
+# The scheduler re-imports this file every few seconds, so it only builds the DAG:
+# the pipeline modules (and requests, psycopg2, dotenv, ...) are imported inside
+# the task callables, and .env is loaded when a task runs. test_dag_parse.py
+# keeps an eye on the parse time.
 
-def load_weather_to_raw_table(**kwargs):
+# Read at parse time, so it must be set in the scheduler's environment (not only in .env).
+# plan_city_shards splits the API rate limit by the same number.
+MAX_PARALLEL_SHARDS = int(os.getenv("WEATHER_MAX_PARALLEL_SHARDS", 16))
+
+def load_task_env():
+    """Loads .env into the task's environment (credentials, tuning knobs)."""
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+def load_weather_to_raw_table(manifest=None, **kwargs):
     """
-    Loads weather data from XCom into PostgreSQL.
+    Loads the staged weather data of one shard into PostgreSQL.
     
     This function:
-    1. Pulls the extracted weather data from the 'extract_weather_data' task using XCom.
-    2. Connects to the PostgreSQL database using credentials from environment variables.
-    3. Ensures the schema 'raw' and table 'weather_data' exist.
-    4. Inserts each weather record into the table.
-    5. Commits the transaction and closes the connection.
+    1. Receives the staging manifest from the shard's 'extract_weather_data' task
+       (passed through XCom) and streams the records from the staged file it points to.
+    2. Borrows a connection from the shared pool (weather_pipeline/db.py).
+    3. Ensures the schema 'raw' and tables 'weather_data' / 'weather_observations' exist.
+    4. Bulk loads the records (COPY into a staging table + one set-based merge per batch).
+    5. Commits the transaction and returns the connection to the pool.
+    6. Records the loaded observations in the observation cache.
     
     Args:
+        manifest (dict): Manifest returned by extract_weather_from_api.
         **kwargs: Airflow context arguments.
     """
-    ti = kwargs['ti']
-    weather_data_list = ti.xcom_pull(task_ids='extract_weather_data')
-    
-    if not weather_data_list:
+    if not manifest or not manifest.get("row_count"):
         logging.info("No weather data to load.")
         return
 
-    # Database connection parameters
-    db_user = os.getenv("POSTGRES_USER")
-    db_password = os.getenv("POSTGRES_PASSWORD")
-    db_host = os.getenv("POSTGRES_HOST")
-    db_port = os.getenv("POSTGRES_PORT")
-    db_name = os.getenv("POSTGRES_DB")
-    
-    conn = None
+    from weather_pipeline.metrics import export_metrics, track_stage
+
+    load_task_env()
     try:
-        # Context manager for automatic connection handling? 
-        # psycopg2 connection can be used as context manager for transaction, 
-        # but closing connection needs to be explicit or via `with psycopg2.connect() ... as conn:`
-        
-        logging.info("Connecting to PostgreSQL...")
-        conn = psycopg2.connect(
-            user=db_user,
-            password=db_password,
-            host=db_host,
-            port=db_port,
-            database=db_name
-        )
-        
-        # Open a cursor to perform database operations
-        with conn.cursor() as cur:
-            # Create Schema and Table if they ensure idempotency of setup
-            logging.info("Ensuring schema and table exist...")
-            cur.execute("CREATE SCHEMA IF NOT EXISTS raw;")
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS raw.weather_data (
-                    id SERIAL PRIMARY KEY,
-                    city_name TEXT NOT NULL,
-                    api_response JSONB NOT NULL,
-                    api_call_timestamp TIMESTAMP NOT NULL,
-                    ingestion_timestamp TIMESTAMP NOT NULL,
-                    UNIQUE(city_name, api_call_timestamp) 
-                );
-            """)
-            # Checks for duplicate entries based on city and api_call_timestamp
-            
-            logging.info(f"Inserting {len(weather_data_list)} records...")
-            inserted_count = 0
-            
-            for data in weather_data_list:
-                metadata = data.get("_metadata", {})
-                city_name = metadata.get("city_name")
-                api_call_timestamp = metadata.get("api_call_timestamp")
-                ingestion_timestamp = metadata.get("ingestion_timestamp")
-                
-                # Convert dict to JSON string for JSONB
-                api_response_json = json.dumps(data)
-                
-                # Parameterized query to prevent SQL injection
-                # ON CONFLICT DO NOTHING ensures idempotency if we re-run the extraction 
-                # for the same timestamp (which XCom might pass if re-run downstream only)
-                insert_query = """
-                    INSERT INTO raw.weather_data 
-                    (city_name, api_response, api_call_timestamp, ingestion_timestamp)
-                    VALUES (%s, %s, %s, %s)
-                    ON CONFLICT (city_name, api_call_timestamp) DO NOTHING;
-                """
-                
-                cur.execute(insert_query, (
-                    city_name, 
-                    api_response_json, 
-                    api_call_timestamp, 
-                    ingestion_timestamp
-                ))
-                
-                # Check if a row was actually inserted
-                if cur.rowcount > 0:
-                    inserted_count += 1
+        with track_stage("load"):
+            _load_manifest(manifest)
+    finally:
+        # Every task runs in its own process, so its metrics are exported when it ends
+        export_metrics(kwargs["ti"].task_id, kwargs["ti"].map_index)
+
+def _load_manifest(manifest):
+    """Loads one staged batch file; see load_weather_to_raw_table."""
+    from weather_pipeline.cache import ObservationCache
+    from weather_pipeline.db import connection
+    from weather_pipeline.load import bulk_load_records
+    from weather_pipeline.metrics import DB_ROUND_TRIPS
+    from weather_pipeline.schema import ensure_raw_schema
+    from weather_pipeline.staging import iter_staged_records
+
+    # The connection comes from the shared pool (bounded, health-checked, with a
+    # statement timeout); it is rolled back and returned when the block ends.
+    with connection() as conn:
+        try:
+            # Open a cursor to perform database operations
+            with conn.cursor() as cur:
+                # Create the schema and tables from sql/init_db.sql if they are missing.
+                # That file is the single definition of the raw tables (including the
+                # UNIQUE(city_name, api_call_timestamp) constraint ON CONFLICT relies on).
+                logging.info("Ensuring schema and tables exist...")
+                ensure_raw_schema(cur)
+                DB_ROUND_TRIPS.labels("schema").inc()
+
+            # COPY the records into a temp staging table and merge them with one
+            # set-based INSERT ... ON CONFLICT DO NOTHING per batch, instead of one
+            # round trip per row. ON CONFLICT keeps re-runs idempotent.
+            # The staged file is verified against its checksum only once it has been read
+            # completely, which happens before we commit.
+            logging.info(f"Bulk loading {manifest['row_count']} records from {manifest['path']}...")
+            inserted_count, skipped_count = bulk_load_records(conn, iter_staged_records(manifest))
 
             conn.commit()
-            logging.info(f"Successfully inserted {inserted_count} new records.")
-            
-    except Exception as e:
-        logging.error(f"Error loading data to PostgreSQL: {e}")
-        if conn:
-            conn.rollback()
-        raise e
-    finally:
-        if conn:
-            conn.close()
-            logging.info("PostgreSQL connection closed.")
+            logging.info(f"Successfully inserted {inserted_count} new records ({skipped_count} already present).")
+        except Exception as e:
+            logging.error(f"Error loading data to PostgreSQL: {e}")
+            raise
 
-def extract_weather_from_api(**kwargs):
+    # Only remember observations once they are safely committed, so a failed
+    # load never causes the next run to drop a reading we don't have yet.
+    with ObservationCache.from_env().transaction() as cache:
+        for data in iter_staged_records(manifest, verify=False):
+            metadata = data.get("_metadata", {})
+            cache.record(metadata.get("city_name"), metadata.get("api_call_timestamp"))
+
+def plan_city_shards(**kwargs):
     """
-    Extracts weather data from WeatherStack API for a list of cities.
+    Picks the cities to poll in this run and splits them into shards.
+    
+    The freshness scheduler spends this run's share of the monthly API quota
+    (WEATHERSTACK_MONTHLY_QUOTA) on the cities most likely to have a new reading,
+    weighted by the `priority` column of the cities seed. Without a quota every
+    city is polled. The quota is charged by the extract tasks (and the streaming
+    service) with the calls they actually send, not here.
+    
+    Each shard becomes one mapped instance of the 'city_shard' task group, so
+    shards extract and load in parallel and independently of each other.
+    Shard size/count are configured with WEATHER_SHARD_SIZE / WEATHER_SHARD_COUNT.
+    
+    Shards extract in separate processes, so each one is given its share of
+    WEATHERSTACK_RATE_LIMIT_RPS: together, the shards that run at the same time
+    (at most WEATHER_MAX_PARALLEL_SHARDS) stay under the plan's cap.
+    
+    Returns:
+        list: One {"index": i, "cities": [...], "rate_limit_rps": r} dict per shard.
+    """
+    from weather_pipeline.cache import ObservationCache
+    from weather_pipeline.cities import load_cities, load_city_priorities, plan_shards
+    from weather_pipeline.extract import get_extract_settings, split_rate_limit
+    from weather_pipeline.freshness import FreshnessScheduler
+
+    load_task_env()
+    cities = load_cities()
+    with FreshnessScheduler.from_env().transaction() as scheduler:
+        selected = scheduler.select(
+            cities, load_city_priorities(), cache=ObservationCache.from_env(),
+            min_refresh_seconds=get_extract_settings()["min_refresh_seconds"]
+        )
+    shards = plan_shards(selected)
+    settings = get_extract_settings()
+    shard_rps = split_rate_limit(
+        settings["rate_limit_rps"], len(shards), MAX_PARALLEL_SHARDS, settings["stream_rate_limit_rps"]
+    )
+    for shard in shards:
+        shard["rate_limit_rps"] = shard_rps
+    logging.info(
+        f"Planned {len(shards)} shards for {len(selected)} of {len(cities)} cities "
+        f"(rate limit {shard_rps or 'unlimited'} req/s per shard)."
+    )
+    return shards
+
+def extract_weather_from_api(shard=None, **kwargs):
+    """
+    Extracts weather data from WeatherStack API for the cities of one shard.
     
     This function:
     1. Retrieves the API key from the environment.
-    2. Iterates through a predefined list of cities.
-    3. Makes a GET request to the WeatherStack API for each city.
-    4. collecting the standardized JSON response and metadata.
-    5. Returns the list of weather data to be pushed to XCom.
+    2. Fetches every city of the shard concurrently through a bounded thread pool, throttled
+       by a token bucket so we stay under the plan's requests-per-second cap.
+    3. Streams each standardized JSON response and metadata into a compressed
+       NDJSON staging file as it arrives (failed cities are skipped).
+    4. Returns the staging manifest (path, row count, checksum, time range) for XCom.
+    
+    Concurrency is configured with WEATHER_EXTRACT_CONCURRENCY; the rate limit is
+    the shard's share of WEATHERSTACK_RATE_LIMIT_RPS (see plan_city_shards).
     
     Args:
+        shard (dict): {"index": i, "cities": [...], "rate_limit_rps": r} planned by plan_city_shards.
         **kwargs: Airflow context arguments.
         
     Returns:
-        list: A list of dictionaries containing weather data and metadata for each city.
+        dict: Manifest of the staged batch file.
     """
+    from weather_pipeline.metrics import export_metrics, track_stage
+    from weather_pipeline.staging import cleanup_staging
+
+    load_task_env()
     api_key = os.getenv("WEATHERSTACK_API_KEY")
     if not api_key:
         logging.error("WEATHERSTACK_API_KEY not found in environment variables.")
         # We raise an error here to fail the task if the configuration is missing
         raise ValueError("WEATHERSTACK_API_KEY not found.")
 
-    cities = ["London", "New York", "Tokyo", "Mumbai", "Sydney"]
-    weather_data_list = []
+    # Drop staged batches that are past the retention window
+    cleanup_staging()
+
+    try:
+        with track_stage("extract"):
+            manifest = _extract_to_staging(shard, api_key)
+    finally:
+        export_metrics(kwargs["ti"].task_id, kwargs["ti"].map_index)
+
+    # XCom (Cross-Communication) is used to pass messages or small amounts of data 
+    # between tasks. The responses themselves stay in the staging file; only the
+    # small manifest is pushed to XCom with the key 'return_value'.
+    logging.info(f"Extracted data for {manifest['row_count']} cities into {manifest['path']}.")
+    return manifest
+
+def _extract_to_staging(shard, api_key):
+    """Fetches the cities of one shard into a staging file and returns its manifest."""
+    from contextlib import closing
+
+    from weather_pipeline.cache import ObservationCache
+    from weather_pipeline.extract import iter_city_weather
+    from weather_pipeline.freshness import charge_quota
+    from weather_pipeline.staging import StagingWriter
+
+    # Errors are handled per city inside iter_city_weather, so a single failing
+    # city never fails the whole batch. The observation cache skips cities whose
+    # reading cannot have changed yet and drops observations we already loaded.
+    # The calls sent are charged to the monthly quota even if this attempt fails
+    # (closing() ends the fetch before the error propagates), so Airflow retries
+    # are paid for too.
+    fetched = iter_city_weather(shard["cities"], api_key, cache=ObservationCache.from_env(),
+                                rate_limit_rps=shard.get("rate_limit_rps"), charge_calls=charge_quota)
+    with closing(fetched), StagingWriter(prefix=f"shard{shard['index']:04d}") as writer:
+        for data in fetched:
+            writer.write(data)
+        return writer.close()
+
+def transform_with_dbt(**kwargs):
+    """
+    Runs the dbt project in-process, doing only what changed since the last run.
     
-    base_url = "http://api.weatherstack.com/current"
+    This function (see weather_pipeline/transform.py):
+    1. Parses the dbt project once and reuses the manifest for every command.
+    2. Seeds only the seed files whose checksum changed.
+    3. Runs and tests only the models downstream of new raw rows or re-seeded files.
+    4. Generates the docs only when model definitions changed.
     
-    for city in cities:
-        try:
-            logging.info(f"Fetching weather data for {city}...")
-            params = {
-                "access_key": api_key,
-                "query": city
-            }
-            
-            # Use a timeout to ensure the task doesn't hang indefinitely
-            response = requests.get(base_url, params=params, timeout=10)
-            
-            # Check for HTTP errors (e.g., 401 Unauthorized, 404 Not Found)
-            response.raise_for_status()
-            
-            data = response.json()
-            
-            # Check for API-specific errors (WeatherStack returns 200 even for some errors)
-            if "error" in data:
-                logging.error(f"API Error for {city}: {data['error']['info']}")
-                continue
-
-            # Add metadata
-            # We add timestamps to track when the data was generated vs when we ingested it.
-            # This is crucial for debugging data freshness and lineage issues.
-            current_time = datetime.utcnow().isoformat()
-            data["_metadata"] = {
-                "city_name": city,
-                "api_call_timestamp": current_time,
-                "ingestion_timestamp": current_time,
-                "status_code": response.status_code
-            }
-            
-            weather_data_list.append(data)
-            logging.info(f"Successfully fetched data for {city}.")
-            
-        except requests.exceptions.RequestException as e:
-            # We handle errors per city to prevent a single failure (e.g., one city's API call failing)
-            # from failing the entire task. This ensures we collect as much data as possible.
-            logging.error(f"Error fetching data for {city}: {e}")
-            continue
-        except Exception as e:
-            logging.error(f"Unexpected error for {city}: {e}")
-            continue
+    Trigger the DAG with {"full_refresh": true} as config to reload the seeds,
+    rebuild every model from scratch and regenerate the docs.
+    
+    Args:
+        **kwargs: Airflow context arguments.
+    """
+    from weather_pipeline.metrics import export_metrics, track_stage
+    from weather_pipeline.transform import run_transform
 
-    # XCom (Cross-Communication) is used to pass messages or small amounts of data 
-    # between tasks. Here we return the list of data, which Airflow automatically 
-    # pushes to XCom with the key 'return_value'.
-    logging.info(f"Extracted data for {len(weather_data_list)} cities.")
-    return weather_data_list
+    load_task_env()
+    full_refresh = bool(kwargs["dag_run"].conf.get("full_refresh"))
+    try:
+        with track_stage("transform"):
+            run_transform(full_refresh=full_refresh)
+    finally:
+        export_metrics(kwargs["ti"].task_id, kwargs["ti"].map_index)
+
+def export_marts_to_parquet(**kwargs):
+    """
+    Appends the fact rows added by this run to the partitioned Parquet dataset.
+    
+    Runs after the dbt tests passed, so only validated rows are exported. Readers
+    (dashboard, analysts) query the files instead of the warehouse; see
+    weather_pipeline/export.py.
+    
+    Args:
+        **kwargs: Airflow context arguments.
+    """
+    from weather_pipeline.db import connection
+    from weather_pipeline.export import export_facts
+    from weather_pipeline.metrics import export_metrics, track_stage
+
+    load_task_env()
+    try:
+        with track_stage("export"), connection() as conn:
+            export_facts(conn)
+    finally:
+        export_metrics(kwargs["ti"].task_id, kwargs["ti"].map_index)
 
 def task_failure_callback(context):
     """
@@ -206,6 +268,13 @@ def task_failure_callback(context):
     execution_date = context.get('execution_date')
     
     logging.error(f"Task {task_id} failed in DAG {dag_id} for execution date {execution_date}.")
+
+    from weather_pipeline.metrics import TASK_FAILURES, export_metrics
+
+    load_task_env()
+    TASK_FAILURES.labels(task_id).inc()
+    # Replaces the file the task exported itself, adding the failure count
+    export_metrics(task_id, task_instance.map_index)
     
     # Email notification setup (commented out as requested)
     # from airflow.utils.email import send_email
@@ -226,71 +295,63 @@ with DAG(
     default_args=default_args,
     description="A simple ETL pipeline for weather data (WeatherStack)",
     schedule_interval="@hourly",
-    start_date=datetime.now() - timedelta(days=1),
+    # Static: a start date computed from now() changes the DAG on every parse
+    start_date=datetime(2024, 1, 1),
     catchup=False,
+    # One run at a time: plan_city_shards splits the API rate limit between the
+    # shards of a single run, so overlapping runs (a manual trigger, a slow run
+    # meeting the next hourly one) would multiply the request rate
+    max_active_runs=1,
     tags=['weather', 'etl', 'production'],
 ) as dag:
 
-    extract_weather_data = PythonOperator(
-        task_id='extract_weather_data',
-        python_callable=extract_weather_from_api,
+    plan_shards_task = PythonOperator(
+        task_id='plan_city_shards',
+        python_callable=plan_city_shards,
         provide_context=True
     )
-    
-    # We handle errors per city in the extract task to allow partial success,
-    # but if the entire task fails (e.g. API key missing), the callback will trigger.
 
-    load_to_postgres = PythonOperator(
-        task_id='load_to_postgres',
-        python_callable=load_weather_to_raw_table,
-        provide_context=True
-    )
+    # Dynamic task mapping: one instance of this group per shard. Inside a mapped
+    # task group, each load only waits for the extract of its *own* shard, so a
+    # slow shard never blocks the others from loading.
 
-    # dbt Tasks using BashOperator
-    # We use BashOperator because dbt is a CLI (Command Line Interface) tool 
-    # and this is the standard, most flexible way to run it in Airflow.
-    # It allows us to pass arguments directly to the dbt command.
-    
-    # dbt seed: Loads CSV files (from dbt/seeds) into the database as tables.
-    # This is used for static reference data like our list of cities.
-    dbt_seed = BashOperator(
-        task_id='dbt_seed',
-        bash_command='cd /opt/dbt && dbt seed --profiles-dir /opt/dbt',
-        dag=dag
-    )
+    @task_group(group_id='city_shard')
+    def process_city_shard(shard):
+        manifest = task(
+            task_id='extract_weather_data',
+            max_active_tis_per_dagrun=MAX_PARALLEL_SHARDS
+        )(extract_weather_from_api)(shard=shard)
 
-    # dbt run: Executes the SQL models (staging and marts) in the correct dependency order.
-    # It materializes views and tables in the database.
-    dbt_run = BashOperator(
-        task_id='dbt_run',
-        bash_command='cd /opt/dbt && dbt run --profiles-dir /opt/dbt',
-        dag=dag
-    )
+        # We handle errors per city in the extract task to allow partial success,
+        # but if the entire task fails (e.g. API key missing), the callback will trigger.
+
+        task(
+            task_id='load_to_postgres',
+            max_active_tis_per_dagrun=MAX_PARALLEL_SHARDS
+        )(load_weather_to_raw_table)(manifest=manifest)
+
+    city_shards = process_city_shard.expand(shard=plan_shards_task.output)
 
-    # dbt test: Runs data quality tests defined in schema.yml (e.g., unique, not_null).
-    # If any test fails, this task will fail, stopping the pipeline and preventing bad data 
-    # from downstream usage. Ideally, this should alert the data team.
-    dbt_test = BashOperator(
-        task_id='dbt_test',
-        bash_command='cd /opt/dbt && dbt test --profiles-dir /opt/dbt',
-        dag=dag
+    # dbt runs in-process in a single task: one interpreter start, one project
+    # parse, and only the seeds, models, tests and docs affected by what changed.
+    # If a model or test fails, this task fails, stopping the pipeline and preventing
+    # bad data from downstream usage. Ideally, this should alert the data team.
+    dbt_transform = PythonOperator(
+        task_id='dbt_transform',
+        python_callable=transform_with_dbt
     )
 
-    # dbt docs generate: Generates documentation website for the models.
-    # Optional task, often run at the end.
-    dbt_docs_generate = BashOperator(
-        task_id='dbt_docs_generate',
-        bash_command='cd /opt/dbt && dbt docs generate --profiles-dir /opt/dbt',
-        dag=dag
+    # Parquet export of the tested facts, so analytical scans stay off Postgres
+    export_parquet = PythonOperator(
+        task_id='export_parquet',
+        python_callable=export_marts_to_parquet
     )
 
 
     # Task Dependencies:
-    # 1. Extract data from API
-    # 2. Load data to Postgres raw table
-    # 3. Run dbt seed (load static data)
-    # 4. Run dbt transformation models
-    # 5. Test data quality
-    # 6. Generate documentation (optional/non-blocking)
+    # 1. Plan city shards from the seed
+    # 2. Per shard, in parallel: extract data from API, then load it to the Postgres raw table
+    # 3. Seed, transform, test and document with dbt (only what changed)
+    # 4. Export the new facts to Parquet
     
-    extract_weather_data >> load_to_postgres >> dbt_seed >> dbt_run >> dbt_test >> dbt_docs_generate
+    city_shards >> dbt_transform >> export_parquet
@@ -0,0 +1,52 @@
+from airflow import DAG
+from airflow.operators.python import PythonOperator
+from datetime import datetime, timedelta
+import logging
+
+# Imports and .env loading happen in the task, not at parse time (see weather_etl.py)
+
+def maintain_raw_partitions(**kwargs):
+    """
+    Keeps the monthly partitions of the raw tables in shape.
+    
+    This function:
+    1. Connects to the PostgreSQL database using credentials from environment variables.
+    2. Pre-creates the partitions of the next WEATHER_PARTITION_MONTHS_AHEAD months,
+       so rows never pile up in the DEFAULT partition.
+    3. Drops (or detaches) partitions older than WEATHER_RAW_RETENTION_MONTHS.
+    
+    Args:
+        **kwargs: Airflow context arguments.
+    """
+    from dotenv import load_dotenv
+
+    from weather_pipeline.db import connection
+    from weather_pipeline.partitions import maintain_partitions
+
+    load_dotenv()
+    with connection() as conn:
+        summary = maintain_partitions(conn)
+        logging.info(f"Partition maintenance finished: {summary}")
+
+default_args = {
+    'owner': 'airflow',
+    'retries': 3,
+    'retry_delay': timedelta(minutes=5),
+    'email_on_failure': False,
+}
+
+with DAG(
+    dag_id="weather_partition_maintenance",
+    default_args=default_args,
+    description="Creates future and drops expired partitions of the raw weather tables",
+    schedule_interval="@daily",
+    start_date=datetime(2024, 1, 1),
+    catchup=False,
+    tags=['weather', 'maintenance'],
+) as dag:
+
+    # Daily is plenty: partitions are monthly and created several months ahead
+    maintain_partitions_task = PythonOperator(
+        task_id='maintain_raw_partitions',
+        python_callable=maintain_raw_partitions
+    )
@@ -0,0 +1,6 @@
+"""
+Shared building blocks for the weather ETL DAGs.
+
+The modules in this package hold the extract/load logic so the DAG files
+stay small and only describe *how* tasks are wired together.
+"""
@@ -0,0 +1,187 @@
+"""
+Observation-aware cache of the last WeatherStack reading seen per city.
+
+WeatherStack refreshes `current` conditions less often than we poll, so the
+same observation is often returned several runs in a row. The cache remembers,
+per city, the API's own observation time so that:
+- cities whose last observation is still recent can skip the HTTP call, and
+- responses carrying an observation we already loaded are never re-inserted.
+
+Entries expire after a TTL and the least recently used ones are evicted once
+the cache is full. The cache is persisted as a small JSON file between runs.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from weather_pipeline.statefile import locked, read_json, write_text
+
+DEFAULT_CACHE_PATH = "/opt/airflow/data/observation_cache.json"
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 50000
+# Skip the HTTP call if the cached observation is younger than this (0 = always call)
+DEFAULT_MIN_REFRESH_SECONDS = 30 * 60
+
+
+def get_observation_time(data):
+    """
+    Derives the UTC time at which WeatherStack measured the `current` block.
+
+    `current.observation_time` is a UTC wall-clock time without a date
+    (e.g. "12:14 PM"). The date comes from `location.localtime_epoch`, which
+    is the location's *local* time encoded as an epoch, so it is shifted back
+    by `location.utc_offset` first.
+
+    Args:
+        data (dict): A WeatherStack `current` response.
+
+    Returns:
+        datetime | None: Naive UTC datetime, or None if the response has no timing info.
+    """
+    location = data.get("location") or {}
+    current = data.get("current") or {}
+
+    epoch = location.get("localtime_epoch")
+    if epoch is None:
+        return None
+
+    reference = datetime.utcfromtimestamp(int(epoch))
+    try:
+        reference -= timedelta(hours=float(location.get("utc_offset") or 0))
+    except (TypeError, ValueError):
+        pass
+
+    observation_time = current.get("observation_time")
+    if not observation_time:
+        return reference.replace(second=0, microsecond=0)
+
+    try:
+        clock = datetime.strptime(observation_time.strip(), "%I:%M %p")
+    except ValueError:
+        return reference.replace(second=0, microsecond=0)
+
+    observed = reference.replace(hour=clock.hour, minute=clock.minute, second=0, microsecond=0)
+    # An observation taken before midnight UTC but read after it belongs to the previous day
+    if observed > reference + timedelta(minutes=1):
+        observed -= timedelta(days=1)
+    return observed
+
+
+class ObservationCache:
+    """
+    TTL + LRU cache of `city -> last observation`, persisted as JSON.
+
+    Args:
+        path (str): JSON file holding the cache between runs.
+        ttl_seconds (float): Entries not refreshed for this long are dropped.
+        max_entries (int): Least recently used entries are evicted beyond this size.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl_seconds=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """
+        Builds a cache from WEATHER_CACHE_PATH / WEATHER_CACHE_TTL_SECONDS / WEATHER_CACHE_MAX_ENTRIES
+        and loads the persisted entries.
+        """
+        cache = cls(
+            path=os.getenv("WEATHER_CACHE_PATH", DEFAULT_CACHE_PATH),
+            ttl_seconds=float(os.getenv("WEATHER_CACHE_TTL_SECONDS", DEFAULT_TTL_SECONDS)),
+            max_entries=int(os.getenv("WEATHER_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+        )
+        cache.load()
+        return cache
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _expire(self, now):
+        expired = [city for city, entry in self._entries.items()
+                   if now - entry["cached_at"] > self.ttl_seconds]
+        for city in expired:
+            del self._entries[city]
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def load(self):
+        """
+        Reads the cache file; a missing or corrupt file simply means an empty cache.
+        """
+        entries = read_json(self.path, {}, label="observation cache")
+
+        with self._lock:
+            # The file is written oldest-first, so insertion order restores the LRU order
+            self._entries = OrderedDict(entries)
+            self._expire(time.time())
+
+    def save(self):
+        """
+        Atomically writes the cache file (write to a temp file, then rename).
+        """
+        with self._lock:
+            self._expire(time.time())
+            payload = json.dumps(self._entries)
+        write_text(self.path, payload)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Reload, modify and save the cache while holding an exclusive file lock,
+        so concurrent tasks updating the same cache file don't lose each other's entries.
+        """
+        with locked(self.path):
+            self.load()
+            yield self
+            self.save()
+
+    def get(self, city):
+        with self._lock:
+            entry = self._entries.get(city)
+            if entry is None:
+                return None
+            if time.time() - entry["cached_at"] > self.ttl_seconds:
+                del self._entries[city]
+                return None
+            self._entries.move_to_end(city)
+            return entry
+
+    def should_skip_fetch(self, city, min_refresh_seconds=DEFAULT_MIN_REFRESH_SECONDS, now=None):
+        """
+        True if the last observation for `city` is recent enough that WeatherStack
+        will most likely return the very same reading.
+        """
+        if min_refresh_seconds <= 0:
+            return False
+        entry = self.get(city)
+        if entry is None:
+            return False
+        now = now or datetime.utcnow()
+        observed_at = datetime.fromisoformat(entry["observed_at"])
+        return (now - observed_at).total_seconds() < min_refresh_seconds
+
+    def is_unchanged(self, city, observed_at):
+        """
+        True if `observed_at` is the observation we already recorded for `city`.
+        """
+        entry = self.get(city)
+        return entry is not None and entry["observed_at"] == observed_at
+
+    def record(self, city, observed_at):
+        """
+        Remembers `observed_at` (ISO string) as the latest observation for `city`.
+        """
+        with self._lock:
+            self._entries[city] = {"observed_at": observed_at, "cached_at": time.time()}
+            self._entries.move_to_end(city)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
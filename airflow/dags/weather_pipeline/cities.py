@@ -0,0 +1,82 @@
+"""
+City universe and sharding for the extract/load tasks.
+
+The list of cities comes from the dbt seed (`dbt/seeds/cities.csv`), which is
+also what `dim_cities` is built from, so there is a single place to add a city.
+"""
+import csv
+import math
+import os
+
+DEFAULT_CITIES_SEED = "/opt/dbt/seeds/cities.csv"
+DEFAULT_SHARD_SIZE = 500
+DEFAULT_PRIORITY = 1.0
+
+
+def load_cities(path=None):
+    """
+    Reads the city names from the cities seed.
+
+    Args:
+        path (str, optional): Seed CSV. Defaults to WEATHER_CITIES_SEED.
+
+    Returns:
+        list[str]: City names in seed order, without duplicates.
+    """
+    path = path or os.getenv("WEATHER_CITIES_SEED", DEFAULT_CITIES_SEED)
+    with open(path, newline="") as f:
+        names = [row["city_name"].strip() for row in csv.DictReader(f) if row.get("city_name")]
+    # dict.fromkeys keeps the first occurrence and the seed order
+    return list(dict.fromkeys(names))
+
+
+def load_city_priorities(path=None):
+    """
+    Reads the per-city polling weights from the optional `priority` column of the seed.
+
+    Missing or invalid values count as DEFAULT_PRIORITY; 0 means "never poll".
+
+    Returns:
+        dict[str, float]: City name to priority.
+    """
+    path = path or os.getenv("WEATHER_CITIES_SEED", DEFAULT_CITIES_SEED)
+    priorities = {}
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            name = (row.get("city_name") or "").strip()
+            if not name or name in priorities:
+                continue
+            try:
+                priorities[name] = max(0.0, float(row.get("priority") or DEFAULT_PRIORITY))
+            except ValueError:
+                priorities[name] = DEFAULT_PRIORITY
+    return priorities
+
+
+def plan_shards(cities, shard_size=None, shard_count=None):
+    """
+    Splits the cities into shards of roughly equal size.
+
+    `shard_count` (WEATHER_SHARD_COUNT) wins when set; otherwise the number of
+    shards is derived from `shard_size` (WEATHER_SHARD_SIZE).
+
+    Args:
+        cities (list[str]): City names.
+        shard_size (int, optional): Target number of cities per shard.
+        shard_count (int, optional): Exact number of shards to produce.
+
+    Returns:
+        list[dict]: One `{"index": i, "cities": [...]}` per non-empty shard.
+    """
+    if not cities:
+        return []
+
+    shard_size = shard_size or int(os.getenv("WEATHER_SHARD_SIZE", DEFAULT_SHARD_SIZE))
+    shard_count = shard_count or int(os.getenv("WEATHER_SHARD_COUNT", 0))
+    if shard_count <= 0:
+        shard_count = math.ceil(len(cities) / max(1, shard_size))
+    shard_count = max(1, min(shard_count, len(cities)))
+
+    # Striding (cities[i::n]) spreads consecutive seed rows over all shards,
+    # so shards stay balanced even if the seed is sorted by region.
+    return [{"index": i, "cities": cities[i::shard_count]} for i in range(shard_count)]
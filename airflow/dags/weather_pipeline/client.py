@@ -0,0 +1,303 @@
+"""
+Reusable WeatherStack API client.
+
+Used by the DAG and by `test_api.py` so both share one implementation of:
+- a pooled keep-alive HTTP session (no new TCP connection per city),
+- retries of idempotent failures with jittered exponential backoff,
+- mapping of WeatherStack's HTTP-200-with-`error` responses to typed exceptions.
+"""
+import logging
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from weather_pipeline.metrics import API_PAYLOAD_BYTES, API_REQUEST_SECONDS, API_RETRIES
+
+DEFAULT_BASE_URL = "http://api.weatherstack.com"
+DEFAULT_TIMEOUT = 10
+DEFAULT_POOL_SIZE = 10
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.5
+DEFAULT_MAX_BACKOFF = 30
+
+# HTTP statuses worth retrying: throttling and transient server-side failures
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class WeatherStackError(Exception):
+    """Base class for every error raised by the WeatherStack client."""
+
+
+class WeatherStackAPIError(WeatherStackError):
+    """
+    The API answered (usually with HTTP 200) but the body contains an `error` block.
+
+    Attributes:
+        code (int): WeatherStack error code, e.g. 104.
+        error_type (str): Machine-readable type, e.g. "usage_limit_reached".
+        info (str): Human-readable explanation from the API.
+    """
+
+    retryable = False
+
+    def __init__(self, code=None, error_type=None, info=None):
+        self.code = code
+        self.error_type = error_type
+        self.info = info
+        super().__init__(f"[{code}] {error_type}: {info}")
+
+
+class InvalidAccessKeyError(WeatherStackAPIError):
+    """Missing, invalid or inactive access key (codes 101, 102)."""
+
+
+class UsageLimitError(WeatherStackAPIError):
+    """The monthly request volume of the plan has been reached (code 104)."""
+
+
+class FeatureNotSupportedError(WeatherStackAPIError):
+    """The plan does not support the requested feature, e.g. bulk queries (code 105)."""
+
+
+class LocationNotFoundError(WeatherStackAPIError):
+    """The query was empty or did not match a location (codes 601, 615)."""
+
+
+class RateLimitError(WeatherStackAPIError):
+    """Too many requests in a short period (code 429); safe to retry."""
+
+    retryable = True
+
+
+API_ERROR_CLASSES = {
+    101: InvalidAccessKeyError,
+    102: InvalidAccessKeyError,
+    104: UsageLimitError,
+    105: FeatureNotSupportedError,
+    429: RateLimitError,
+    601: LocationNotFoundError,
+    615: LocationNotFoundError,
+}
+
+
+def raise_for_api_error(data):
+    """
+    Raises the matching WeatherStackAPIError subclass if `data` is an error body.
+
+    Args:
+        data (dict): Decoded JSON response.
+    """
+    if isinstance(data, dict) and "error" in data:
+        error = data.get("error") or {}
+        code = error.get("code")
+        error_class = API_ERROR_CLASSES.get(code, WeatherStackAPIError)
+        raise error_class(code=code, error_type=error.get("type"), info=error.get("info"))
+
+
+class WeatherStackClient:
+    """
+    Thread-safe WeatherStack client backed by a pooled keep-alive session.
+
+    Args:
+        api_key (str, optional): Access key. Defaults to WEATHERSTACK_API_KEY.
+        base_url (str, optional): API root. Defaults to WEATHERSTACK_BASE_URL or the public API.
+        timeout (float): Per-request timeout in seconds.
+        pool_size (int): Connections kept alive per host; size it to the extract concurrency.
+        max_retries (int): Retries after the first attempt for retryable failures.
+        backoff_factor (float): Base delay in seconds for exponential backoff.
+        max_backoff (float): Upper bound for a single backoff delay.
+        rate_limiter (TokenBucket, optional): Acquired once per HTTP attempt, retries included.
+
+    Attributes:
+        calls_sent (int): Calls charged to the plan's monthly quota so far: one per
+            HTTP attempt (retries included), one per location for bulk requests.
+    """
+
+    def __init__(
+        self,
+        api_key=None,
+        base_url=None,
+        timeout=DEFAULT_TIMEOUT,
+        pool_size=DEFAULT_POOL_SIZE,
+        max_retries=DEFAULT_MAX_RETRIES,
+        backoff_factor=DEFAULT_BACKOFF_FACTOR,
+        max_backoff=DEFAULT_MAX_BACKOFF,
+        rate_limiter=None,
+    ):
+        self.api_key = api_key or os.getenv("WEATHERSTACK_API_KEY")
+        if not self.api_key:
+            raise InvalidAccessKeyError(code=101, error_type="missing_access_key",
+                                        info="WEATHERSTACK_API_KEY not found.")
+        self.base_url = (base_url or os.getenv("WEATHERSTACK_BASE_URL", DEFAULT_BASE_URL)).rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.rate_limiter = rate_limiter
+        # Cleared by get_current_bulk once the plan turns out not to support bulk queries
+        self.bulk_supported = True
+        self.calls_sent = 0
+        self._calls_lock = threading.Lock()
+
+        # Retries are handled in `_get` (so API-level errors can be retried too);
+        # the adapter only manages the connection pool. pool_block=True keeps the
+        # number of open sockets bounded even if more threads than `pool_size` call us.
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0, pool_block=True)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self.session.close()
+
+    def _backoff(self, attempt, retry_after=None):
+        """
+        Full-jitter exponential backoff: a random delay in [0, min(max, base * 2^attempt)].
+
+        Randomising the whole interval spreads retries from many workers apart,
+        which avoids synchronized retry storms against the API.
+        """
+        if retry_after is not None:
+            return min(self.max_backoff, retry_after)
+        return random.uniform(0, min(self.max_backoff, self.backoff_factor * (2 ** attempt)))
+
+    def _get(self, endpoint, params, cost=1):
+        """
+        GET with retries. Every WeatherStack endpoint we use is a read, so retrying is safe.
+
+        Args:
+            cost (int): Quota calls one attempt counts for (the number of locations of a bulk query).
+
+        Returns:
+            dict: Decoded JSON body (already checked for an `error` block).
+        """
+        url = f"{self.base_url}/{endpoint}"
+        params = {"access_key": self.api_key, **params}
+
+        attempt = 0
+        while True:
+            retry_after = None
+            try:
+                if self.rate_limiter is not None:
+                    self.rate_limiter.acquire()
+                # Counted before sending: a request that times out may still have reached the API
+                with self._calls_lock:
+                    self.calls_sent += cost
+
+                started = time.perf_counter()
+                try:
+                    response = self.session.get(url, params=params, timeout=self.timeout)
+                except requests.exceptions.RequestException:
+                    API_REQUEST_SECONDS.labels("transport_error").observe(time.perf_counter() - started)
+                    raise
+                API_REQUEST_SECONDS.labels(
+                    "ok" if response.ok else f"http_{response.status_code}"
+                ).observe(time.perf_counter() - started)
+                API_PAYLOAD_BYTES.inc(len(response.content))
+
+                if response.status_code in RETRYABLE_STATUS_CODES and attempt < self.max_retries:
+                    header = response.headers.get("Retry-After")
+                    retry_after = float(header) if header and header.isdigit() else None
+                    raise requests.exceptions.HTTPError(
+                        f"{response.status_code} returned by WeatherStack", response=response
+                    )
+
+                # Check for HTTP errors (e.g., 401 Unauthorized, 404 Not Found)
+                response.raise_for_status()
+
+                data = response.json()
+                # WeatherStack returns 200 even for some errors
+                raise_for_api_error(data)
+                return data
+
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout,
+                    requests.exceptions.HTTPError,
+                    RateLimitError) as e:
+                retryable = (
+                    not isinstance(e, requests.exceptions.HTTPError)
+                    or e.response is None
+                    or e.response.status_code in RETRYABLE_STATUS_CODES
+                )
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt, retry_after)
+                attempt += 1
+                API_RETRIES.inc()
+                logging.warning(
+                    f"WeatherStack request failed ({e}); retry {attempt}/{self.max_retries} in {delay:.2f}s."
+                )
+                time.sleep(delay)
+
+    def get_current(self, query):
+        """
+        Fetches current conditions for a location.
+
+        Args:
+            query (str): City name (or any location WeatherStack accepts).
+
+        Returns:
+            dict: The decoded API response.
+
+        Raises:
+            WeatherStackAPIError: For error bodies (see the subclasses for common codes).
+            requests.exceptions.RequestException: For transport or HTTP failures after retries.
+        """
+        return self._get("current", {"query": query})
+
+    def get_current_bulk(self, queries):
+        """
+        Fetches current conditions for several locations in one request.
+
+        WeatherStack's bulk mode (paid plans) takes the locations separated by
+        semicolons and answers with one entry per location, in request order.
+        A failing location only fails its own entry.
+
+        Args:
+            queries (list[str]): Locations; must not contain ";".
+
+        Returns:
+            list: One item per query: the decoded response, or the
+            WeatherStackAPIError for that location.
+
+        Raises:
+            ValueError: If a query contains ";" (it would split into two locations
+                and shift every later entry of the response).
+            FeatureNotSupportedError: If the plan does not support bulk queries.
+            WeatherStackAPIError / requests.exceptions.RequestException: If the whole request fails.
+        """
+        invalid = [query for query in queries if ";" in query]
+        if invalid:
+            raise ValueError(f"Bulk queries must not contain ';': {invalid}")
+        try:
+            # Every location of a bulk query counts as one call of the quota
+            data = self._get("current", {"query": ";".join(queries)}, cost=len(queries))
+        except FeatureNotSupportedError:
+            self.bulk_supported = False
+            raise
+        if len(queries) == 1 and isinstance(data, dict):
+            return [data]
+        if not isinstance(data, list) or len(data) != len(queries):
+            raise WeatherStackAPIError(
+                error_type="unexpected_bulk_response",
+                info=f"Expected {len(queries)} entries, got {len(data) if isinstance(data, list) else type(data).__name__}."
+            )
+
+        results = []
+        for entry in data:
+            try:
+                raise_for_api_error(entry)
+                results.append(entry)
+            except WeatherStackAPIError as e:
+                results.append(e)
+        return results
@@ -0,0 +1,228 @@
+"""
+Shared PostgreSQL access for the DAG tasks, services and validation scripts.
+
+Every caller reads the same connection settings (`get_connection_params`) and
+gets the same per-session statement timeout. Code that opens connections
+repeatedly in one process should borrow them from the process-wide pool
+(`connection()` / `get_pool()`), which:
+- is thread-safe and bounded: at most WEATHER_DB_POOL_MAX connections per
+  process; extra borrowers wait instead of opening more,
+- health-checks connections before handing them out again (closed, broken
+  or idle-for-long connections are pinged and replaced),
+- is re-created after a fork, so a pool is never shared between processes.
+
+To go through PgBouncer (see docker-compose.yml), point WEATHER_DB_HOST /
+WEATHER_DB_PORT at it; POSTGRES_HOST / POSTGRES_PORT stay the direct address
+used by dbt and Airflow. PgBouncer must run in session pooling mode: the
+loader relies on session state (temp tables, SET statement_timeout).
+"""
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions, pool
+
+DEFAULT_POOL_MIN = 1
+DEFAULT_POOL_MAX = 5
+DEFAULT_STATEMENT_TIMEOUT_MS = 300000
+# Connections idle for longer than this are pinged before being reused
+DEFAULT_HEALTH_CHECK_SECONDS = 30
+DEFAULT_ACQUIRE_TIMEOUT = 30
+
+
+def get_connection_params(**overrides):
+    """
+    Connection settings from the environment.
+
+    WEATHER_DB_HOST / WEATHER_DB_PORT (e.g. PgBouncer) take precedence over
+    POSTGRES_HOST / POSTGRES_PORT.
+
+    Args:
+        **overrides: psycopg2.connect keyword arguments that take precedence,
+            e.g. database="weather_bench".
+
+    Returns:
+        dict: Keyword arguments for psycopg2.connect.
+    """
+    params = {
+        "user": os.getenv("POSTGRES_USER", "airflow"),
+        "password": os.getenv("POSTGRES_PASSWORD", "airflow"),
+        "host": os.getenv("WEATHER_DB_HOST") or os.getenv("POSTGRES_HOST", "localhost"),
+        "port": os.getenv("WEATHER_DB_PORT") or os.getenv("POSTGRES_PORT", "5432"),
+        "database": os.getenv("POSTGRES_DB", "weather_db"),
+        "connect_timeout": int(os.getenv("WEATHER_DB_CONNECT_TIMEOUT", 10)),
+    }
+    params.update(overrides)
+    return params
+
+
+def get_statement_timeout_ms():
+    """Per-statement timeout applied to every session (WEATHER_DB_STATEMENT_TIMEOUT_MS; 0 disables it)."""
+    return int(os.getenv("WEATHER_DB_STATEMENT_TIMEOUT_MS", DEFAULT_STATEMENT_TIMEOUT_MS))
+
+
+def configure_session(conn, statement_timeout_ms=None):
+    """
+    Applies the session settings with SET, which (unlike startup options)
+    also works through PgBouncer.
+    """
+    if statement_timeout_ms is None:
+        statement_timeout_ms = get_statement_timeout_ms()
+    with conn.cursor() as cur:
+        cur.execute("SET statement_timeout = %s;", (int(statement_timeout_ms),))
+    conn.commit()
+
+
+def connect(**overrides):
+    """
+    Opens a dedicated (unpooled) connection, e.g. for command-line tools and worker processes.
+
+    Args:
+        **overrides: psycopg2.connect keyword arguments that take precedence.
+
+    Returns:
+        psycopg2.extensions.connection: A new connection (caller closes it).
+    """
+    conn = psycopg2.connect(**get_connection_params(**overrides))
+    configure_session(conn)
+    return conn
+
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool with health-checked reuse.
+
+    Args:
+        minconn (int): Connections opened up front.
+        maxconn (int): Upper bound of open connections.
+        statement_timeout_ms (int, optional): Session statement timeout; defaults to the env setting.
+        health_check_seconds (float): Idle time after which a connection is pinged before reuse.
+        acquire_timeout (float): Seconds to wait for a free connection before raising.
+        **params: psycopg2.connect keyword arguments; defaults to `get_connection_params()`.
+    """
+
+    def __init__(self, minconn=DEFAULT_POOL_MIN, maxconn=DEFAULT_POOL_MAX, statement_timeout_ms=None,
+                 health_check_seconds=DEFAULT_HEALTH_CHECK_SECONDS, acquire_timeout=DEFAULT_ACQUIRE_TIMEOUT,
+                 **params):
+        self.statement_timeout_ms = statement_timeout_ms
+        self.health_check_seconds = health_check_seconds
+        self.acquire_timeout = acquire_timeout
+        # ThreadedConnectionPool raises when exhausted; the semaphore makes borrowers wait instead
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._pool = pool.ThreadedConnectionPool(minconn, maxconn, **(params or get_connection_params()))
+        self._configured = set()
+        self._last_used = {}
+        self._lock = threading.Lock()
+        self.pid = os.getpid()
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        if time.monotonic() - self._last_used.get(id(conn), 0) < self.health_check_seconds:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def acquire(self):
+        """
+        Borrows a healthy connection; give it back with `release`.
+
+        Raises:
+            psycopg2.pool.PoolError: If no connection frees up within `acquire_timeout`.
+        """
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise pool.PoolError(f"No database connection available after {self.acquire_timeout}s.")
+        try:
+            while True:
+                conn = self._pool.getconn()
+                if self._is_healthy(conn):
+                    break
+                logging.warning("Discarding a broken pooled database connection.")
+                self._forget(conn)
+                self._pool.putconn(conn, close=True)
+
+            with self._lock:
+                configured = id(conn) in self._configured
+            if not configured:
+                configure_session(conn, self.statement_timeout_ms)
+                with self._lock:
+                    self._configured.add(id(conn))
+            return conn
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn):
+        """Returns a connection; an unfinished transaction is rolled back first."""
+        close = conn.closed != 0
+        if not close and conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                close = True
+        if close:
+            self._forget(conn)
+        else:
+            with self._lock:
+                self._last_used[id(conn)] = time.monotonic()
+        self._pool.putconn(conn, close=close)
+        self._slots.release()
+
+    def _forget(self, conn):
+        with self._lock:
+            self._configured.discard(id(conn))
+            self._last_used.pop(id(conn), None)
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrows a connection for the duration of the block.
+
+        The caller commits; anything uncommitted when the block ends is rolled back.
+        """
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def closeall(self):
+        self._pool.closeall()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    The process-wide pool, sized by WEATHER_DB_POOL_MIN / WEATHER_DB_POOL_MAX.
+
+    Connections must not cross a fork, so a forked process (e.g. an Airflow
+    task) builds its own pool on first use.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.pid != os.getpid():
+            _pool = ConnectionPool(
+                minconn=int(os.getenv("WEATHER_DB_POOL_MIN", DEFAULT_POOL_MIN)),
+                maxconn=int(os.getenv("WEATHER_DB_POOL_MAX", DEFAULT_POOL_MAX)),
+            )
+        return _pool
+
+
+@contextmanager
+def connection():
+    """Borrows a connection from the process-wide pool (see ConnectionPool.connection)."""
+    with get_pool().connection() as conn:
+        yield conn
@@ -0,0 +1,379 @@
+"""
+Incremental Parquet export of the weather marts for analytical readers.
+
+Dashboards and ad-hoc analysis should not scan `staging.fact_weather` on the
+Postgres container that ingestion writes to. After each transform, the fact
+rows added since the previous export (by `weather_id`) are joined with their
+city and hour attributes and appended to a Hive-partitioned Parquet dataset:
+
+    <root>/city=<city name>/date=<YYYY-MM-DD>/part-<first id>-<last id>.parquet
+    <root>/_manifest.json
+
+- rows are streamed from a server-side cursor `batch_rows` at a time, so
+  Python never holds more than one batch,
+- partitions that collected `compact_min_files` small files are rewritten as a
+  single file,
+- `_manifest.json` lists every file with its row count and id range per
+  partition; readers use it (or `manifest_files`) to prune partitions without
+  listing directories. Files not in the manifest (from an interrupted export)
+  are deleted by the next export.
+
+Rows are exported once. New rows are found by `weather_id` above the previous
+export's watermark. A fact row committed late with a lower id is picked up by the
+models' lookback (`incremental_lookback_hours`). The export re-reads the rows
+ingested within the same window (`lookback_hours`) before its previous
+ingestion watermark. It drops the ids the manifest's file ranges show as
+already written, checking the ids of those files, and exports the rest.
+
+    python -m weather_pipeline.export [--rebuild]
+"""
+import argparse
+import logging
+import os
+import shutil
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from urllib.parse import quote
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from weather_pipeline.statefile import locked, read_json, write_json
+
+DEFAULT_EXPORT_DIR = "/opt/airflow/data/export/fact_weather"
+DEFAULT_BATCH_ROWS = 50000
+DEFAULT_COMPACT_MIN_FILES = 24
+# Same window as the dbt models' incremental_lookback_hours
+DEFAULT_LOOKBACK_HOURS = 3
+MANIFEST_NAME = "_manifest.json"
+
+# Column order and types of the files; the query casts to match, so every file
+# has the same schema even when a batch is all NULL in some column. The
+# observation date is not stored in the files: it is the `date` partition key.
+EXPORT_SCHEMA = pa.schema([
+    ("weather_id", pa.int64()),
+    ("city_id", pa.int32()),
+    ("city_name", pa.string()),
+    ("country", pa.string()),
+    ("latitude", pa.float64()),
+    ("longitude", pa.float64()),
+    ("time_key", pa.int64()),
+    ("api_call_timestamp", pa.timestamp("us")),
+    ("hour", pa.int16()),
+    ("day_of_week", pa.int16()),
+    ("is_weekend", pa.bool_()),
+    ("temperature", pa.float64()),
+    ("feels_like", pa.float64()),
+    ("humidity", pa.int32()),
+    ("pressure", pa.int32()),
+    ("wind_speed", pa.float64()),
+    ("wind_direction", pa.string()),
+    ("precipitation", pa.float64()),
+    ("cloud_cover", pa.int32()),
+    ("uv_index", pa.int32()),
+    ("visibility", pa.int32()),
+    ("weather_description", pa.string()),
+    ("ingestion_timestamp", pa.timestamp("us")),
+])
+
+EXPORT_QUERY = """
+    SELECT
+        f.weather_id::bigint, f.city_id::integer, c.city_name::text, c.country::text,
+        c.latitude::float8, c.longitude::float8,
+        f.time_key::bigint, f.api_call_timestamp, t.hour::smallint,
+        t.day_of_week::smallint, t.is_weekend,
+        f.temperature::float8, f.feels_like::float8, f.humidity::integer, f.pressure::integer,
+        f.wind_speed::float8, f.wind_direction::text, f.precipitation::float8,
+        f.cloud_cover::integer, f.uv_index::integer, f.visibility::integer,
+        f.weather_description::text, f.ingestion_timestamp,
+        t.date
+    FROM staging.fact_weather f
+    JOIN staging.dim_cities c ON c.city_id = f.city_id
+    JOIN staging.dim_time t ON t.time_key = f.time_key
+    WHERE (f.weather_id > %(since)s AND f.weather_id <= %(until)s)
+        -- Late commits below the id watermark, within the models' lookback window
+        OR (f.weather_id <= %(since)s
+            AND f.ingestion_timestamp > %(ingested_since)s::timestamp - make_interval(hours => %(lookback_hours)s))
+    ORDER BY f.weather_id
+"""
+
+
+def get_export_settings():
+    """
+    Reads the export knobs from the environment.
+
+    Returns:
+        dict: root, batch_rows, compact_min_files and lookback_hours.
+    """
+    return {
+        "root": os.getenv("WEATHER_EXPORT_DIR", DEFAULT_EXPORT_DIR),
+        "batch_rows": max(1, int(os.getenv("WEATHER_EXPORT_BATCH_ROWS", DEFAULT_BATCH_ROWS))),
+        "compact_min_files": max(2, int(os.getenv("WEATHER_EXPORT_COMPACT_MIN_FILES", DEFAULT_COMPACT_MIN_FILES))),
+        "lookback_hours": max(0, int(os.getenv("WEATHER_EXPORT_LOOKBACK_HOURS", DEFAULT_LOOKBACK_HOURS))),
+    }
+
+
+def partition_key(city_name, date):
+    """Relative directory of a partition, Hive style (`city=<url-quoted>/date=YYYY-MM-DD`)."""
+    return f"city={quote(city_name, safe='')}/date={date.isoformat()}"
+
+
+def read_manifest(root):
+    """Returns the dataset manifest, or an empty one if nothing was exported yet."""
+    # A corrupt manifest must not silently restart the export from scratch
+    empty = {"watermark": 0, "ingested_watermark": None, "rows": 0, "partitions": {}}
+    return read_json(os.path.join(root, MANIFEST_NAME), empty, ignore_errors=False)
+
+
+def manifest_files(root, cities=None, start_date=None, end_date=None):
+    """
+    Parquet files of the partitions matching the filters, from the manifest.
+
+    Args:
+        root (str): Dataset root.
+        cities (iterable[str], optional): Only these cities.
+        start_date, end_date (str, optional): Inclusive ISO date range.
+
+    Returns:
+        list[str]: Absolute file paths, e.g. for `pyarrow.parquet.ParquetDataset` or DuckDB.
+    """
+    cities = set(cities) if cities is not None else None
+    paths = []
+    for partition in read_manifest(root)["partitions"].values():
+        if cities is not None and partition["city"] not in cities:
+            continue
+        if (start_date and partition["date"] < start_date) or (end_date and partition["date"] > end_date):
+            continue
+        paths.extend(os.path.join(root, file["path"]) for file in partition["files"])
+    return paths
+
+
+class ParquetExporter:
+    """
+    Appends new fact rows to the partitioned Parquet dataset.
+
+    Args:
+        root (str): Dataset root directory.
+        batch_rows (int): Rows fetched from Postgres (and held in memory) at a time.
+        compact_min_files (int): Files in a partition that trigger its compaction.
+        lookback_hours (int): Window before the previous ingestion watermark that is
+            re-read for rows committed late with a lower id.
+    """
+
+    def __init__(self, root=DEFAULT_EXPORT_DIR, batch_rows=DEFAULT_BATCH_ROWS,
+                 compact_min_files=DEFAULT_COMPACT_MIN_FILES, lookback_hours=DEFAULT_LOOKBACK_HOURS):
+        self.root = root
+        self.batch_rows = batch_rows
+        self.compact_min_files = compact_min_files
+        self.lookback_hours = lookback_hours
+        self.manifest = None
+        # weather_ids of already exported files, read while checking late rows
+        self._file_ids = {}
+
+    @classmethod
+    def from_env(cls):
+        return cls(**get_export_settings())
+
+    @contextmanager
+    def transaction(self):
+        """Loads the manifest under an exclusive lock and saves it when the block succeeds."""
+        with locked(os.path.join(self.root, MANIFEST_NAME)):
+            self.manifest = read_manifest(self.root)
+            yield self
+            self._save_manifest()
+
+    def _save_manifest(self):
+        self.manifest["rows"] = sum(p["rows"] for p in self.manifest["partitions"].values())
+        self.manifest["updated_at"] = datetime.utcnow().isoformat()
+        self.manifest["columns"] = EXPORT_SCHEMA.names
+        write_json(os.path.join(self.root, MANIFEST_NAME), self.manifest, indent=2, sort_keys=True)
+
+    def remove_orphans(self):
+        """Deletes Parquet files the manifest does not list (left by an interrupted export)."""
+        listed = {file["path"] for p in self.manifest["partitions"].values() for file in p["files"]}
+        removed = 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                path = os.path.relpath(os.path.join(dirpath, name), self.root)
+                if name.endswith((".parquet", ".parquet.tmp")) and path not in listed:
+                    os.remove(os.path.join(self.root, path))
+                    removed += 1
+        if removed:
+            logging.warning(f"Removed {removed} Parquet files missing from the manifest.")
+
+    def export(self, conn):
+        """
+        Exports the fact rows added since the last export (and the ones committed
+        late within the lookback window), then compacts full partitions.
+
+        Args:
+            conn: Open psycopg2 connection.
+
+        Returns:
+            dict: rows exported (late ones included), late rows, files written,
+                partitions compacted and the new watermark.
+        """
+        self.remove_orphans()
+        self._file_ids = {}
+        since = self.manifest["watermark"]
+        ingested_since = self.manifest.get("ingested_watermark")
+        with conn.cursor() as cur:
+            cur.execute("SELECT COALESCE(MAX(weather_id), 0), MAX(ingestion_timestamp) FROM staging.fact_weather;")
+            until, ingested_until = cur.fetchone()
+
+        rows = late = files = 0
+        # Named cursor: Postgres keeps the result and sends it batch_rows at a time
+        with conn.cursor(name="weather_parquet_export") as cur:
+            cur.itersize = self.batch_rows
+            cur.execute(EXPORT_QUERY, {
+                "since": since, "until": until,
+                "ingested_since": ingested_since, "lookback_hours": self.lookback_hours,
+            })
+            while True:
+                batch = cur.fetchmany(self.batch_rows)
+                if not batch:
+                    break
+                batch_files, batch_rows, batch_late = self._write_batch(batch, since)
+                files += batch_files
+                rows += batch_rows
+                late += batch_late
+        conn.commit()
+
+        self.manifest["watermark"] = max(since, until)
+        if ingested_until is not None:
+            self.manifest["ingested_watermark"] = ingested_until.isoformat()
+        compacted = self.compact()
+        logging.info(f"Exported {rows} fact rows ({late} committed late) into {files} files "
+                     f"(weather_id {since}..{until}); compacted {compacted} partitions.")
+        return {"rows": rows, "late_rows": late, "files": files, "compacted": compacted,
+                "watermark": self.manifest["watermark"]}
+
+    def _is_exported(self, key, weather_id):
+        """Whether a file of partition `key` already holds `weather_id`."""
+        partition = self.manifest["partitions"].get(key)
+        if partition is None:
+            return False
+        for file in partition["files"]:
+            if not file["min_weather_id"] <= weather_id <= file["max_weather_id"]:
+                continue
+            # Files of a partition interleave, so a matching range is not proof: check the ids
+            ids = self._file_ids.get(file["path"])
+            if ids is None:
+                ids = set(pq.read_table(os.path.join(self.root, file["path"]), columns=["weather_id"])
+                          .column("weather_id").to_pylist())
+                self._file_ids[file["path"]] = ids
+            if weather_id in ids:
+                return True
+        return False
+
+    def _write_batch(self, batch, since):
+        """
+        Writes one fetched batch as one file per partition it touches.
+
+        Rows at or below the id watermark `since` come from the lookback window
+        and are only written if no exported file holds them yet.
+
+        Returns:
+            tuple[int, int, int]: files written, rows written, late rows among them.
+        """
+        columns = EXPORT_SCHEMA.names
+        city_index = columns.index("city_name")
+        by_partition = defaultdict(list)
+        late = 0
+        for row in batch:
+            # The query returns the partition date after the file columns
+            city, date = row[city_index], row[-1]
+            if row[0] <= since:
+                if self._is_exported(partition_key(city, date), row[0]):
+                    continue
+                late += 1
+            by_partition[(city, date)].append(row)
+
+        for (city, date), rows in by_partition.items():
+            table = pa.Table.from_pydict(
+                {name: [row[i] for row in rows] for i, name in enumerate(columns)}, schema=EXPORT_SCHEMA
+            )
+            first_id, last_id = rows[0][0], rows[-1][0]
+            self._add_file(city, date, f"part-{first_id}-{last_id}.parquet", table)
+        return len(by_partition), sum(len(rows) for rows in by_partition.values()), late
+
+    def _add_file(self, city, date, name, table):
+        key = partition_key(city, date)
+        os.makedirs(os.path.join(self.root, key), exist_ok=True)
+        path = f"{key}/{name}"
+        tmp_path = os.path.join(self.root, f"{path}.tmp")
+        pq.write_table(table, tmp_path, compression="zstd")
+        os.replace(tmp_path, os.path.join(self.root, path))
+
+        ids = table.column("weather_id")
+        partition = self.manifest["partitions"].setdefault(
+            key, {"city": city, "date": date.isoformat(), "rows": 0, "files": []}
+        )
+        partition["files"].append({
+            "path": path, "rows": table.num_rows,
+            "min_weather_id": pc.min(ids).as_py(), "max_weather_id": pc.max(ids).as_py(),
+        })
+        partition["rows"] += table.num_rows
+
+    def compact(self):
+        """
+        Rewrites each partition holding `compact_min_files` or more files as a single file.
+
+        The old files are deleted only after the manifest pointing at the new one is saved.
+
+        Returns:
+            int: Partitions compacted.
+        """
+        compacted = 0
+        for key, partition in list(self.manifest["partitions"].items()):
+            if len(partition["files"]) < self.compact_min_files:
+                continue
+            old_paths = [file["path"] for file in partition["files"]]
+            table = pa.concat_tables(
+                pq.read_table(os.path.join(self.root, path), schema=EXPORT_SCHEMA) for path in old_paths
+            ).sort_by("weather_id")
+
+            partition["files"], partition["rows"] = [], 0
+            ids = table.column("weather_id")
+            name = f"part-{pc.min(ids).as_py()}-{pc.max(ids).as_py()}-compacted.parquet"
+            self._add_file(partition["city"], datetime.fromisoformat(partition["date"]).date(), name, table)
+            self._save_manifest()
+            for path in old_paths:
+                if path != partition["files"][0]["path"]:
+                    os.remove(os.path.join(self.root, path))
+            compacted += 1
+        return compacted
+
+
+def export_facts(conn, exporter=None):
+    """Runs one incremental export with the settings from the environment."""
+    exporter = exporter or ParquetExporter.from_env()
+    with exporter.transaction():
+        return exporter.export(conn)
+
+
+def main():
+    from dotenv import load_dotenv
+
+    from weather_pipeline.db import connect
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    parser = argparse.ArgumentParser(description="Export new weather facts to partitioned Parquet.")
+    parser.add_argument("--rebuild", action="store_true", help="Delete the dataset and export everything again.")
+    args = parser.parse_args()
+
+    exporter = ParquetExporter.from_env()
+    if args.rebuild and os.path.isdir(exporter.root):
+        shutil.rmtree(exporter.root)
+    conn = connect()
+    try:
+        print(export_facts(conn, exporter))
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+"""
+Concurrent extraction of current weather conditions from the WeatherStack API.
+
+Cities are fetched by a bounded thread pool, so wall-clock time scales with
+ceil(cities / concurrency) instead of the number of cities. A token bucket
+shared by the workers keeps the request rate under the caller's cap (a DAG
+shard's share of the plan's requests-per-second cap, see split_rate_limit),
+and every city is fetched in isolation so one failure never fails the whole
+batch. An optional observation cache lets unchanged readings skip the
+HTTP call and the insert.
+"""
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import requests
+
+from weather_pipeline.cache import DEFAULT_MIN_REFRESH_SECONDS, get_observation_time
+from weather_pipeline.client import FeatureNotSupportedError, WeatherStackAPIError, WeatherStackClient
+from weather_pipeline.metrics import API_ERRORS, CITY_FETCH_SECONDS
+from weather_pipeline.ratelimit import TokenBucket
+
+# Defaults can be overridden through environment variables (see README)
+DEFAULT_CONCURRENCY = 8
+DEFAULT_RATE_LIMIT_RPS = 5.0
+DEFAULT_TIMEOUT = 10
+# Locations per request; 1 disables bulk queries (they need a paid plan)
+DEFAULT_BULK_SIZE = 1
+
+
+def get_extract_settings():
+    """
+    Reads the extraction tuning knobs from the environment.
+
+    Returns:
+        dict: concurrency, rate_limit_rps (0 disables rate limiting), timeout,
+            min_refresh_seconds (cache age below which a city is not re-fetched) and
+            bulk_size (cities per bulk request; 1 sends one request per city).
+    """
+    return {
+        "concurrency": max(1, int(os.getenv("WEATHER_EXTRACT_CONCURRENCY", DEFAULT_CONCURRENCY))),
+        "rate_limit_rps": float(os.getenv("WEATHERSTACK_RATE_LIMIT_RPS", DEFAULT_RATE_LIMIT_RPS)),
+        "timeout": float(os.getenv("WEATHERSTACK_TIMEOUT", DEFAULT_TIMEOUT)),
+        "min_refresh_seconds": float(os.getenv("WEATHER_CACHE_MIN_REFRESH_SECONDS", DEFAULT_MIN_REFRESH_SECONDS)),
+        "bulk_size": max(1, int(os.getenv("WEATHERSTACK_BULK_SIZE", DEFAULT_BULK_SIZE))),
+        # Part of rate_limit_rps reserved for the streaming service (0: not running)
+        "stream_rate_limit_rps": float(os.getenv("WEATHER_STREAM_RATE_LIMIT_RPS", 0)),
+    }
+
+
+def split_rate_limit(rate_limit_rps, shard_count, max_parallel_shards, reserved_rps=0.0):
+    """
+    Splits the plan's requests-per-second cap between concurrently running shards.
+
+    Every shard extracts in its own task process with its own token bucket, so
+    each one gets an equal share of what is left after `reserved_rps` (the
+    streaming service's share): with at most `max_parallel_shards` of them
+    running at once, their combined rate stays under `rate_limit_rps`. This
+    holds for one DAG run; the DAG sets max_active_runs=1 so runs never overlap.
+
+    Args:
+        rate_limit_rps (float): Plan cap; 0 disables rate limiting.
+        shard_count (int): Number of planned shards.
+        max_parallel_shards (int): Shards Airflow runs at the same time.
+        reserved_rps (float): Part of the cap used by other clients.
+
+    Returns:
+        float: Per-shard cap (0 when rate limiting is disabled).
+    """
+    if rate_limit_rps <= 0:
+        return 0.0
+    available = rate_limit_rps - reserved_rps
+    if available <= 0:
+        raise ValueError(
+            f"WEATHER_STREAM_RATE_LIMIT_RPS ({reserved_rps}) leaves nothing of "
+            f"WEATHERSTACK_RATE_LIMIT_RPS ({rate_limit_rps}) for the DAG."
+        )
+    return available / max(1, min(shard_count, max_parallel_shards))
+
+
+def stamp_metadata(data, city):
+    """
+    Adds the `_metadata` block the loader relies on to an API response.
+
+    Returns:
+        dict: `data`, modified in place.
+    """
+    # We add timestamps to track when the data was generated vs when we ingested it.
+    # This is crucial for debugging data freshness and lineage issues.
+    # api_call_timestamp is the API's own observation time, so re-reading an unchanged
+    # observation maps to the same (city_name, api_call_timestamp) key and is deduplicated.
+    current_time = datetime.utcnow().isoformat()
+    observed_at = get_observation_time(data)
+    data["_metadata"] = {
+        "city_name": city,
+        "api_call_timestamp": observed_at.isoformat() if observed_at else current_time,
+        "request_timestamp": current_time,
+        "ingestion_timestamp": current_time,
+        # Non-2xx responses raise inside the client, so only successes reach this point
+        "status_code": 200
+    }
+    return data
+
+
+def fetch_city_weather(client, city):
+    """
+    Fetches the current weather for a single city.
+
+    Errors are logged and swallowed so the caller can keep going with the
+    remaining cities.
+
+    Args:
+        client (WeatherStackClient): Shared, pooled API client.
+        city (str): City name passed as the WeatherStack `query`.
+
+    Returns:
+        dict | None: The API response with a `_metadata` block, or None on failure.
+    """
+    started = time.perf_counter()
+    try:
+        logging.info(f"Fetching weather data for {city}...")
+        data = client.get_current(city)
+        CITY_FETCH_SECONDS.labels("ok").observe(time.perf_counter() - started)
+
+        # Add metadata
+        stamp_metadata(data, city)
+
+        logging.info(f"Successfully fetched data for {city}.")
+        return data
+
+    except WeatherStackAPIError as e:
+        logging.error(f"API Error for {city}: {e.info}")
+        API_ERRORS.labels(e.error_type or "api_error").inc()
+        CITY_FETCH_SECONDS.labels("error").observe(time.perf_counter() - started)
+        return None
+    except requests.exceptions.RequestException as e:
+        API_ERRORS.labels(type(e).__name__).inc()
+        CITY_FETCH_SECONDS.labels("error").observe(time.perf_counter() - started)
+        # We handle errors per city to prevent a single failure (e.g., one city's API call failing)
+        # from failing the entire task. This ensures we collect as much data as possible.
+        logging.error(f"Error fetching data for {city}: {e}")
+        return None
+    except Exception as e:
+        logging.error(f"Unexpected error for {city}: {e}")
+        API_ERRORS.labels("unexpected").inc()
+        CITY_FETCH_SECONDS.labels("error").observe(time.perf_counter() - started)
+        return None
+
+
+def fetch_city_batch(client, cities):
+    """
+    Fetches several cities with one bulk request.
+
+    Entries that failed inside the bulk response or could not be processed
+    (e.g. malformed `location`/`current` blocks), or the whole batch if the bulk
+    request itself failed, are retried with one request per city, so one bad
+    entry never fails the other cities of the batch.
+
+    Args:
+        client (WeatherStackClient): Shared, pooled API client.
+        cities (list[str]): Cities of the batch.
+
+    Returns:
+        list[dict]: Successful responses, each with a `_metadata` block.
+    """
+    # ";" separates the locations of a bulk query, so such names go on their own
+    single = [city for city in cities if ";" in city]
+    if single:
+        logging.warning(f"Fetching {len(single)} cities with ';' in their name one by one: {single}")
+        cities = [city for city in cities if ";" not in city]
+    if not client.bulk_supported or not cities:
+        entries = [None] * len(cities)
+    else:
+        started = time.perf_counter()
+        try:
+            logging.info(f"Fetching weather data for {len(cities)} cities in one bulk request...")
+            entries = client.get_current_bulk(cities)
+        except FeatureNotSupportedError as e:
+            logging.warning(f"Bulk queries are not supported by this plan ({e.info}); using per-city requests.")
+            entries = [None] * len(cities)
+        except (WeatherStackAPIError, requests.exceptions.RequestException) as e:
+            logging.warning(f"Bulk request for {len(cities)} cities failed ({e}); using per-city requests.")
+            entries = [None] * len(cities)
+        elapsed = time.perf_counter() - started
+
+    results = []
+    for city, entry in zip(cities + single, entries + [None] * len(single)):
+        if isinstance(entry, dict):
+            try:
+                results.append(stamp_metadata(entry, city))
+                CITY_FETCH_SECONDS.labels("ok").observe(elapsed)
+                continue
+            except Exception as e:
+                logging.error(f"Malformed bulk entry for {city} ({e!r}); retrying on its own.")
+                API_ERRORS.labels("malformed_entry").inc()
+                CITY_FETCH_SECONDS.labels("error").observe(elapsed)
+        elif isinstance(entry, WeatherStackAPIError):
+            logging.warning(f"Bulk entry for {city} failed ({entry.info}); retrying on its own.")
+        data = fetch_city_weather(client, city)
+        if data is not None:
+            results.append(data)
+    return results
+
+
+def iter_city_weather(cities, api_key, concurrency=None, rate_limit_rps=None, timeout=None, cache=None,
+                      bulk_size=None, charge_calls=None):
+    """
+    Fetches the current weather for many cities concurrently, yielding each
+    response as soon as it arrives.
+
+    This function:
+    1. Skips cities whose cached observation is too recent to have changed.
+    2. Builds a token bucket shared by all workers (unless rate limiting is disabled).
+    3. Submits one fetch per city (or per batch of `bulk_size` cities) to a bounded thread pool.
+    4. Yields the successful responses in completion order, dropping responses
+       whose observation is already in the cache.
+    5. Reports the calls actually sent (retries and per-city fallbacks included)
+       to `charge_calls`, also when the iteration fails or is closed early.
+
+    Args:
+        cities (list[str]): City names to fetch.
+        api_key (str): WeatherStack access key.
+        concurrency (int, optional): Maximum number of requests in flight.
+        rate_limit_rps (float, optional): Requests-per-second cap; 0 disables it.
+        timeout (float, optional): Per-request timeout in seconds.
+        cache (ObservationCache, optional): Last observation per city; read-only here,
+            the loader records new observations once they are committed.
+        bulk_size (int, optional): Cities per bulk request; 1 disables bulk queries.
+        charge_calls (callable, optional): Called once with the number of calls sent,
+            e.g. `freshness.charge_quota`.
+
+    Yields:
+        dict: Successful API responses, each with a `_metadata` block.
+    """
+    settings = get_extract_settings()
+    concurrency = concurrency or settings["concurrency"]
+    rate_limit_rps = settings["rate_limit_rps"] if rate_limit_rps is None else rate_limit_rps
+    timeout = timeout or settings["timeout"]
+    bulk_size = bulk_size or settings["bulk_size"]
+
+    if cache is not None:
+        fetch_list = [city for city in cities
+                      if not cache.should_skip_fetch(city, settings["min_refresh_seconds"])]
+        if len(fetch_list) < len(cities):
+            logging.info(f"Skipping {len(cities) - len(fetch_list)} cities with a recent cached observation.")
+        cities = fetch_list
+    if not cities:
+        return
+
+    rate_limiter = TokenBucket(rate_limit_rps) if rate_limit_rps > 0 else None
+    batches = [cities[i:i + bulk_size] for i in range(0, len(cities), bulk_size)]
+    workers = max(1, min(concurrency, len(batches)))
+    # One keep-alive connection per worker, so requests never wait on the pool
+    client = WeatherStackClient(api_key, timeout=timeout, pool_size=workers, rate_limiter=rate_limiter)
+
+    logging.info(
+        f"Extracting {len(cities)} cities in {len(batches)} requests with concurrency={workers}, "
+        f"rate_limit={rate_limit_rps or 'unlimited'} req/s."
+    )
+
+    unchanged = 0
+    try:
+        # Threads are a good fit here: the work is almost entirely waiting on the network,
+        # and requests releases the GIL while it does.
+        with client, ThreadPoolExecutor(max_workers=workers, thread_name_prefix="weather-extract") as pool:
+            if bulk_size > 1:
+                futures = [pool.submit(fetch_city_batch, client, batch) for batch in batches]
+            else:
+                futures = [pool.submit(fetch_city_weather, client, city) for city in cities]
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # Fetches isolate their own failures; this only guards the shard against a bug in them
+                    logging.error(f"A fetch failed unexpectedly, skipping its cities: {e!r}")
+                    API_ERRORS.labels("unexpected").inc()
+                    continue
+                for data in (result if isinstance(result, list) else [result]):
+                    if data is None:
+                        continue
+                    metadata = data["_metadata"]
+                    if cache is not None and cache.is_unchanged(metadata["city_name"],
+                                                                metadata["api_call_timestamp"]):
+                        unchanged += 1
+                        continue
+                    yield data
+    finally:
+        if charge_calls is not None and client.calls_sent:
+            charge_calls(client.calls_sent)
+
+    if unchanged:
+        logging.info(f"Dropped {unchanged} unchanged observations.")
+
+
+def extract_cities(cities, api_key, **kwargs):
+    """
+    Same as `iter_city_weather`, collected into a list.
+
+    Returns:
+        list: Successful API responses, each with a `_metadata` block.
+    """
+    return list(iter_city_weather(cities, api_key, **kwargs))
@@ -0,0 +1,218 @@
+"""
+Quota-aware freshness scheduling: which cities to poll in this run.
+
+WeatherStack plans have a hard monthly call quota. Instead of one call per
+city per run, every run gets a share of the quota that is left this month,
+spread evenly over the runs remaining until the month ends. The budget is
+spent on the cities that gain the most freshness per call.
+
+For each city the scheduler learns how often its observation changes (an
+exponentially weighted average of the gaps between new observations seen in
+the observation cache). Assuming changes arrive at that rate, the chance that
+a city has a new reading since we last polled it is
+
+    p = 1 - exp(-time_since_last_poll / change_interval)
+
+and the value of polling it is `priority * p`, with the priority taken from
+the `priority` column of `dbt/seeds/cities.csv`. Every call costs the same,
+so taking the highest-value cities up to the budget maximises the expected
+weighted freshness of the run. Cities never polled have p = 1.
+
+Usage is what the API was actually sent, not what was planned: extract shards
+and the streaming service count their calls (retries and per-city fallbacks
+included) and charge them with `charge_quota` once they are done, so the next
+run's budget is computed from the real remainder.
+
+State (per-city learning and this month's usage) is a small JSON file next to
+the observation cache.
+"""
+import calendar
+import logging
+import math
+import os
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from weather_pipeline.cache import DEFAULT_MIN_REFRESH_SECONDS
+from weather_pipeline.statefile import locked, read_json, write_json
+
+DEFAULT_STATE_PATH = "/opt/airflow/data/freshness_state.json"
+# Seconds between two DAG runs (the DAG is hourly)
+DEFAULT_RUN_INTERVAL_SECONDS = 3600
+# Assumed gap between new observations until a city has been observed twice
+DEFAULT_CHANGE_SECONDS = 3600
+# Weight of the newest gap in the change-interval average
+CHANGE_SMOOTHING = 0.3
+
+
+class FreshnessScheduler:
+    """
+    Picks the cities to poll in a run within the monthly call quota.
+
+    Args:
+        path (str): JSON state file.
+        monthly_quota (int): Calls allowed per calendar month; 0 disables the budget
+            (every city is polled, as before).
+        run_interval_seconds (float): Time between two runs, used to count the runs left.
+        default_change_seconds (float): Change interval assumed for cities without history.
+    """
+
+    def __init__(self, path=DEFAULT_STATE_PATH, monthly_quota=0, run_interval_seconds=DEFAULT_RUN_INTERVAL_SECONDS,
+                 default_change_seconds=DEFAULT_CHANGE_SECONDS):
+        self.path = path
+        self.monthly_quota = monthly_quota
+        self.run_interval_seconds = run_interval_seconds
+        self.default_change_seconds = default_change_seconds
+        self.month = None
+        self.used = 0
+        self.cities = {}
+
+    @classmethod
+    def from_env(cls):
+        """
+        Builds a scheduler from WEATHER_SCHEDULER_STATE / WEATHERSTACK_MONTHLY_QUOTA /
+        WEATHER_RUN_INTERVAL_SECONDS.
+        """
+        return cls(
+            path=os.getenv("WEATHER_SCHEDULER_STATE", DEFAULT_STATE_PATH),
+            monthly_quota=int(os.getenv("WEATHERSTACK_MONTHLY_QUOTA", 0)),
+            run_interval_seconds=float(os.getenv("WEATHER_RUN_INTERVAL_SECONDS", DEFAULT_RUN_INTERVAL_SECONDS)),
+        )
+
+    def load(self):
+        """Reads the state file; a missing or corrupt file means no history."""
+        state = read_json(self.path, {}, label="scheduler state")
+        self.month = state.get("month")
+        self.used = state.get("used", 0)
+        self.cities = state.get("cities", {})
+
+    def save(self):
+        """Atomically writes the state file."""
+        write_json(self.path, {"month": self.month, "used": self.used, "cities": self.cities})
+
+    @contextmanager
+    def transaction(self):
+        """Load, modify and save the state under an exclusive file lock."""
+        with locked(self.path):
+            self.load()
+            yield self
+            self.save()
+
+    def _start_month(self, now):
+        """Resets the usage when `now` is in a new calendar month."""
+        month = f"{now:%Y-%m}"
+        if self.month != month:
+            self.month = month
+            self.used = 0
+
+    def charge(self, calls, now=None):
+        """
+        Adds calls that were sent to the API to this month's usage.
+
+        Args:
+            calls (int): Calls sent, e.g. `WeatherStackClient.calls_sent`.
+            now (datetime, optional): Naive UTC time the calls were made.
+        """
+        self._start_month(now or datetime.utcnow())
+        self.used += calls
+
+    def run_budget(self, now):
+        """
+        Calls this run may spend: what is left of the quota, spread over the runs left this month.
+
+        Returns:
+            int | None: None when no quota is configured.
+        """
+        if self.monthly_quota <= 0:
+            return None
+        month_end = datetime(now.year, now.month, calendar.monthrange(now.year, now.month)[1]) + timedelta(days=1)
+        runs_left = max(1, math.ceil((month_end - now).total_seconds() / self.run_interval_seconds))
+        remaining = max(0, self.monthly_quota - self.used)
+        # Rounding up spends leftover calls instead of stranding them; it can never exceed `remaining`
+        return math.ceil(remaining / runs_left)
+
+    def learn(self, city, observed_at):
+        """
+        Updates a city's change interval from the latest observation time we loaded.
+
+        Args:
+            observed_at (str): ISO observation time, e.g. from the observation cache.
+        """
+        state = self.cities.setdefault(city, {})
+        previous = state.get("observed_at")
+        if previous and observed_at > previous:
+            gap = (datetime.fromisoformat(observed_at) - datetime.fromisoformat(previous)).total_seconds()
+            average = state.get("change_seconds", gap)
+            state["change_seconds"] = CHANGE_SMOOTHING * gap + (1 - CHANGE_SMOOTHING) * average
+        state["observed_at"] = observed_at
+
+    def score(self, city, priority, now):
+        """Expected weighted freshness gained by polling `city` now."""
+        state = self.cities.get(city, {})
+        polled_at = state.get("polled_at")
+        if not polled_at:
+            return priority
+        age = max(0.0, (now - datetime.fromisoformat(polled_at)).total_seconds())
+        change_seconds = max(1.0, state.get("change_seconds", self.default_change_seconds))
+        return priority * (1 - math.exp(-age / change_seconds))
+
+    def select(self, cities, priorities, cache=None, now=None, min_refresh_seconds=DEFAULT_MIN_REFRESH_SECONDS):
+        """
+        Chooses the cities to poll in this run.
+
+        Nothing is charged to the quota here: the extract charges the calls it
+        actually sends (see `charge_quota`).
+
+        Args:
+            cities (list[str]): City universe (seed order).
+            priorities (dict[str, float]): Weights from the seed; missing cities weigh 1.
+            cache (ObservationCache, optional): Source of the latest observation per city.
+                Cities the extract would skip as too recent are not given budget.
+            now (datetime, optional): Naive UTC time of the run.
+            min_refresh_seconds (float): Same threshold as the extract's cache skip.
+
+        Returns:
+            list[str]: Selected cities, in seed order.
+        """
+        now = now or datetime.utcnow()
+        self._start_month(now)
+
+        candidates = []
+        for city in cities:
+            if cache is not None:
+                entry = cache.get(city)
+                if entry is not None:
+                    self.learn(city, entry["observed_at"])
+                if cache.should_skip_fetch(city, min_refresh_seconds, now):
+                    continue
+            candidates.append(city)
+
+        scores = {city: self.score(city, priorities.get(city, 1.0), now) for city in candidates}
+        ranked = sorted((city for city in candidates if scores[city] > 0), key=scores.get, reverse=True)
+        budget = self.run_budget(now)
+        chosen = set(ranked if budget is None else ranked[:budget])
+
+        for city in chosen:
+            self.cities.setdefault(city, {})["polled_at"] = now.isoformat()
+
+        logging.info(
+            f"Scheduled {len(chosen)} of {len(cities)} cities "
+            f"(budget {'unlimited' if budget is None else budget}, "
+            f"{self.used}/{self.monthly_quota or 'unlimited'} calls used in {self.month})."
+        )
+        return [city for city in cities if city in chosen]
+
+
+def charge_quota(calls, now=None):
+    """
+    Charges `calls` sent to the API to the monthly usage in the scheduler state.
+
+    Safe to call from several processes at once (extract shards, the streaming
+    service): the update happens under the state file's lock.
+    """
+    if calls <= 0:
+        return
+    with FreshnessScheduler.from_env().transaction() as scheduler:
+        scheduler.charge(calls, now)
+        logging.info(f"Charged {calls} API calls ({scheduler.used}/{scheduler.monthly_quota or 'unlimited'} "
+                     f"used in {scheduler.month}).")
@@ -0,0 +1,205 @@
+"""
+Bulk loading of extracted weather records into raw.weather_data.
+
+Instead of one INSERT round trip per record, records are streamed with
+`COPY ... FROM STDIN` into a temporary staging table and merged into the raw
+table with a single set-based `INSERT ... SELECT ... ON CONFLICT DO NOTHING`
+per batch. Batching keeps memory bounded for very large loads.
+
+Static request/location blocks are split out of each response into
+raw.weather_static_blocks on the way in; raw.weather_data_full reassembles the
+complete documents.
+
+The same statement keeps `analytics.current_conditions` (latest observation
+per city) up to date, and the load sends a NOTIFY on CURRENT_CONDITIONS_CHANNEL
+when it changed, delivered to listeners once the caller commits.
+"""
+import csv
+import io
+import json
+import logging
+import os
+from itertools import islice
+
+from weather_pipeline.metrics import DB_ROUND_TRIPS, LOAD_ROWS
+from weather_pipeline.observations import OBSERVATION_COLUMNS, observation_select_list
+
+DEFAULT_BATCH_SIZE = 5000
+
+STAGE_TABLE = "weather_data_stage"
+
+# NOTIFY channel announcing changes to analytics.current_conditions
+CURRENT_CONDITIONS_CHANNEL = "weather_current_conditions"
+
+
+def get_load_batch_size():
+    """Number of records sent per COPY/merge cycle (WEATHER_LOAD_BATCH_SIZE)."""
+    return max(1, int(os.getenv("WEATHER_LOAD_BATCH_SIZE", DEFAULT_BATCH_SIZE)))
+
+
+def iter_batches(records, batch_size):
+    """
+    Yields lists of at most `batch_size` records from any iterable (lists or generators).
+    """
+    iterator = iter(records)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def records_to_csv(records):
+    """
+    Serialises a batch of records into an in-memory CSV buffer for COPY.
+
+    Args:
+        records (list[dict]): API responses carrying a `_metadata` block.
+
+    Returns:
+        io.StringIO: Buffer positioned at the start, one CSV row per record.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for data in records:
+        metadata = data.get("_metadata", {})
+        writer.writerow((
+            metadata.get("city_name"),
+            # Compact separators make the payload smaller on the wire and in COPY
+            json.dumps(data, separators=(",", ":")),
+            metadata.get("api_call_timestamp"),
+            metadata.get("ingestion_timestamp"),
+        ))
+    buffer.seek(0)
+    return buffer
+
+
+def bulk_load_records(conn, records, batch_size=None):
+    """
+    Loads records into raw.weather_data using COPY + a set-based merge.
+
+    This function:
+    1. Creates a temporary staging table that is dropped at commit.
+    2. For each batch: COPYs the rows into the staging table, inserts them into
+       raw.weather_data with ON CONFLICT DO NOTHING (storing their static blocks once
+       in raw.weather_static_blocks, writing the typed columns of the
+       new rows to raw.weather_observations and upserting each city's newest one
+       into analytics.current_conditions), then empties the staging table.
+    3. Queues a NOTIFY if any city's current conditions changed.
+    4. Leaves the commit to the caller, so the whole load stays one transaction
+       (NOTIFY is only delivered on commit).
+
+    Args:
+        conn: Open psycopg2 connection.
+        records (Iterable[dict]): API responses carrying a `_metadata` block.
+        batch_size (int, optional): Records per COPY/merge cycle.
+
+    Returns:
+        tuple[int, int]: (inserted, skipped) row counts; skipped rows already existed
+        or were duplicated within a batch.
+    """
+    batch_size = batch_size or get_load_batch_size()
+    inserted = 0
+    staged = 0
+    cities_updated = 0
+    current_columns = ", ".join(OBSERVATION_COLUMNS)
+    current_updates = ", ".join(f"{column} = EXCLUDED.{column}" for column in OBSERVATION_COLUMNS[1:])
+
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            CREATE TEMP TABLE IF NOT EXISTS {STAGE_TABLE} (
+                city_name TEXT,
+                api_response JSONB,
+                api_call_timestamp TIMESTAMP,
+                ingestion_timestamp TIMESTAMP
+            ) ON COMMIT DROP;
+        """)
+        DB_ROUND_TRIPS.labels("load").inc()
+
+        for batch in iter_batches(records, batch_size):
+            cur.copy_expert(
+                f"COPY {STAGE_TABLE} (city_name, api_response, api_call_timestamp, ingestion_timestamp) "
+                "FROM STDIN WITH (FORMAT csv)",
+                records_to_csv(batch)
+            )
+
+            # DISTINCT ON keeps a batch with the same observation twice from
+            # tripping over itself; ON CONFLICT skips rows already loaded.
+            # Each response is split (see "Static blocks" in sql/init_db.sql):
+            # its request and static location blocks are stored once per distinct
+            # content, and the raw row keeps only the per-reading payload.
+            # The rows that were actually inserted are parsed once, in the same
+            # statement and from the complete staged document, into the typed
+            # raw.weather_observations table, and each city's newest one replaces
+            # its current conditions unless those are newer.
+            cur.execute(f"""
+                WITH staged AS (
+                    SELECT DISTINCT ON (city_name, api_call_timestamp)
+                        city_name, api_response, api_call_timestamp, ingestion_timestamp
+                    FROM {STAGE_TABLE}
+                    ORDER BY city_name, api_call_timestamp, ingestion_timestamp
+                ),
+                blocks AS (
+                    INSERT INTO raw.weather_static_blocks (block_hash, block_type, block)
+                    SELECT DISTINCT raw.static_block_hash(block), block_type, block
+                    FROM staged
+                    CROSS JOIN LATERAL (VALUES
+                        ('request', api_response->'request'),
+                        ('location', raw.static_location(api_response))
+                    ) AS b (block_type, block)
+                    WHERE block IS NOT NULL
+                    ON CONFLICT (block_hash) DO NOTHING
+                ),
+                inserted AS (
+                    INSERT INTO raw.weather_data
+                    (city_name, api_response, request_hash, location_hash, api_call_timestamp, ingestion_timestamp)
+                    SELECT
+                        city_name,
+                        raw.reading_payload(api_response, city_name, api_call_timestamp, ingestion_timestamp),
+                        raw.static_block_hash(api_response->'request'),
+                        raw.static_block_hash(raw.static_location(api_response)),
+                        api_call_timestamp,
+                        ingestion_timestamp
+                    FROM staged
+                    ON CONFLICT (city_name, api_call_timestamp) DO NOTHING
+                    RETURNING id, city_name, api_call_timestamp
+                ),
+                parsed AS (
+                    SELECT i.id, s.city_name, s.api_response, s.api_call_timestamp, s.ingestion_timestamp
+                    FROM inserted i
+                    JOIN staged s ON s.city_name = i.city_name AND s.api_call_timestamp = i.api_call_timestamp
+                ),
+                observations AS (
+                    INSERT INTO raw.weather_observations ({current_columns})
+                    SELECT {observation_select_list("parsed")}
+                    FROM parsed
+                    RETURNING {current_columns}
+                ),
+                current_rows AS (
+                    INSERT INTO analytics.current_conditions AS cc ({current_columns})
+                    SELECT DISTINCT ON (city_name) {current_columns}
+                    FROM observations
+                    ORDER BY city_name, api_call_timestamp DESC
+                    ON CONFLICT (city_name) DO UPDATE SET {current_updates}, updated_at = NOW()
+                    WHERE EXCLUDED.api_call_timestamp > cc.api_call_timestamp
+                    RETURNING 1
+                )
+                SELECT (SELECT COUNT(*) FROM observations), (SELECT COUNT(*) FROM current_rows);
+            """)
+            batch_inserted, batch_cities = cur.fetchone()
+            inserted += batch_inserted
+            cities_updated += batch_cities
+            staged += len(batch)
+
+            cur.execute(f"TRUNCATE {STAGE_TABLE};")
+            # COPY, merge and TRUNCATE
+            DB_ROUND_TRIPS.labels("load").inc(3)
+            logging.info(f"Merged batch of {len(batch)} records ({inserted} inserted so far).")
+
+        if cities_updated:
+            cur.execute("SELECT pg_notify(%s, %s);", (CURRENT_CONDITIONS_CHANNEL, str(cities_updated)))
+            DB_ROUND_TRIPS.labels("load").inc()
+
+    LOAD_ROWS.labels("inserted").inc(inserted)
+    LOAD_ROWS.labels("skipped").inc(staged - inserted)
+    return inserted, staged - inserted
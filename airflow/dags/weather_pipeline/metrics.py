@@ -0,0 +1,188 @@
+"""
+Performance instrumentation for the pipeline tasks, exported in Prometheus format.
+
+Every Airflow task runs in its own short-lived process, so metrics are kept
+in a module-level registry and exported once when the task ends:
+
+- as a `.prom` file for the node-exporter textfile collector
+  (WEATHER_METRICS_TEXTFILE_DIR, one file per task and map index), and/or
+- pushed to a Prometheus Pushgateway (WEATHER_METRICS_PUSHGATEWAY, e.g. "localhost:9091").
+
+Latency histograms are not labelled by city: with thousands of cities that
+would explode the number of series. Per-city outliers are in the task logs.
+"""
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, push_to_gateway, write_to_textfile
+from prometheus_client.core import Metric
+
+DEFAULT_TEXTFILE_DIR = "/opt/airflow/data/metrics"
+
+REGISTRY = CollectorRegistry()
+
+CITY_FETCH_SECONDS = Histogram(
+    "weather_city_fetch_seconds",
+    "Time to fetch one city, retries and rate-limit waits included.",
+    ["outcome"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60),
+    registry=REGISTRY,
+)
+API_REQUEST_SECONDS = Histogram(
+    "weather_api_request_seconds",
+    "Latency of individual WeatherStack HTTP requests (retries are separate observations).",
+    ["outcome"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30),
+    registry=REGISTRY,
+)
+API_RETRIES = Counter(
+    "weather_api_retries_total",
+    "WeatherStack requests retried after a retryable failure.",
+    registry=REGISTRY,
+)
+API_ERRORS = Counter(
+    "weather_api_errors_total",
+    "Cities whose fetch failed, by error type.",
+    ["error_type"],
+    registry=REGISTRY,
+)
+API_PAYLOAD_BYTES = Counter(
+    "weather_api_payload_bytes_total",
+    "Bytes of WeatherStack response bodies received.",
+    registry=REGISTRY,
+)
+LOAD_ROWS = Counter(
+    "weather_load_rows_total",
+    "Records handled by the raw loader, by result (inserted or skipped).",
+    ["result"],
+    registry=REGISTRY,
+)
+DB_ROUND_TRIPS = Counter(
+    "weather_db_round_trips_total",
+    "Statements sent to PostgreSQL, by stage.",
+    ["stage"],
+    registry=REGISTRY,
+)
+STAGE_SECONDS = Gauge(
+    "weather_stage_duration_seconds",
+    "Wall-clock duration of the last run of a pipeline stage.",
+    ["stage"],
+    registry=REGISTRY,
+)
+STAGE_LAST_SUCCESS = Gauge(
+    "weather_stage_last_success_timestamp_seconds",
+    "Unix time of the last successful run of a pipeline stage.",
+    ["stage"],
+    registry=REGISTRY,
+)
+TASK_FAILURES = Counter(
+    "weather_task_failures_total",
+    "Airflow task failures reported by the failure callback.",
+    ["task_id"],
+    registry=REGISTRY,
+)
+STREAM_QUEUE_DEPTH = Gauge(
+    "weather_stream_queue_depth",
+    "Observations waiting in the streaming service's queue at the last flush.",
+    registry=REGISTRY,
+)
+DBT_MODEL_SECONDS = Gauge(
+    "weather_dbt_node_duration_seconds",
+    "Execution time of each dbt node (model, seed or test) in the last dbt invocation.",
+    ["command", "node", "status"],
+    registry=REGISTRY,
+)
+
+
+@contextmanager
+def track_stage(stage):
+    """
+    Records the wall time of a stage, and its success time if it does not raise.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+        STAGE_LAST_SUCCESS.labels(stage).set(time.time())
+    finally:
+        STAGE_SECONDS.labels(stage).set(time.perf_counter() - started)
+
+
+def record_dbt_run_results(command, path="/opt/dbt/target/run_results.json"):
+    """
+    Loads per-node timings from a dbt `run_results.json` into DBT_MODEL_SECONDS.
+
+    Args:
+        command (str): dbt command that produced the file, e.g. "run".
+        path (str): Location of run_results.json.
+    """
+    try:
+        with open(path) as f:
+            results = json.load(f).get("results", [])
+    except (OSError, ValueError) as e:
+        logging.warning(f"Could not read dbt run results from {path}: {e}")
+        return
+
+    for result in results:
+        node = result.get("unique_id", "unknown")
+        DBT_MODEL_SECONDS.labels(command, node, result.get("status", "unknown")).set(
+            result.get("execution_time") or 0
+        )
+
+
+class LabelledRegistry:
+    """
+    Read-only view of a registry that adds constant labels to every sample.
+
+    The textfile collector rejects a series that appears in two files, so each
+    task's file carries its own `task` / `map_index` labels.
+    """
+
+    def __init__(self, registry, labels):
+        self.registry = registry
+        self.labels = labels
+
+    def collect(self):
+        for metric in self.registry.collect():
+            labelled = Metric(metric.name, metric.documentation, metric.type, metric.unit)
+            for sample in metric.samples:
+                labelled.add_sample(sample.name, {**sample.labels, **self.labels}, sample.value,
+                                    sample.timestamp, sample.exemplar)
+            yield labelled
+
+
+def export_metrics(task_id, map_index=-1):
+    """
+    Writes the registry to the textfile directory and/or pushes it to a Pushgateway.
+
+    Exporting again from the same task (e.g. from the failure callback) replaces
+    the earlier export. Problems are logged, never raised: metrics must not fail a task.
+
+    Args:
+        task_id (str): Airflow task id (or the name of a command-line process).
+        map_index (int): Map index of a mapped task instance; -1 when not mapped.
+    """
+    labels = {"task": task_id, "map_index": str(map_index)}
+
+    textfile_dir = os.getenv("WEATHER_METRICS_TEXTFILE_DIR", DEFAULT_TEXTFILE_DIR)
+    if textfile_dir:
+        try:
+            os.makedirs(textfile_dir, exist_ok=True)
+            # write_to_textfile writes a temp file and renames it, so the collector
+            # never reads a partial file
+            write_to_textfile(
+                os.path.join(textfile_dir, f"weather_{task_id}_{map_index}.prom"),
+                LabelledRegistry(REGISTRY, labels)
+            )
+        except OSError as e:
+            logging.warning(f"Could not write metrics textfile: {e}")
+
+    gateway = os.getenv("WEATHER_METRICS_PUSHGATEWAY")
+    if gateway:
+        try:
+            # The grouping key becomes the labels of every pushed series
+            push_to_gateway(gateway, job="weather_pipeline", grouping_key=labels, registry=REGISTRY)
+        except Exception as e:
+            logging.warning(f"Could not push metrics to {gateway}: {e}")
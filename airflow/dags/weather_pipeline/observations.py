@@ -0,0 +1,122 @@
+"""
+Typed, columnar landing table for weather measurements.
+
+`raw.weather_data_full.api_response` keeps the full JSON document for audit, but
+parsing it with `->>` and casts on every read is expensive. At load time the
+measurements are also written once, as native numeric columns, to
+`raw.weather_observations` (one row per raw row, keyed by the raw id; the
+table itself is defined in `sql/init_db.sql`).
+Analytical scans read these compact fixed-width columns instead.
+
+Rows loaded before this table existed are filled in with:
+
+    python -m weather_pipeline.observations --batch-size 50000
+"""
+import argparse
+import logging
+
+from weather_pipeline.schema import ensure_raw_schema
+
+OBSERVATION_COLUMNS = (
+    "weather_data_id", "city_name", "api_call_timestamp", "ingestion_timestamp",
+    "temperature", "feels_like", "humidity", "pressure", "wind_speed", "wind_degree",
+    "wind_direction", "precipitation", "cloud_cover", "uv_index", "visibility",
+    "weather_description", "country", "region", "latitude", "longitude",
+)
+
+
+def observation_select_list(alias):
+    """
+    SELECT list that parses one raw row (`alias`) into the observation columns.
+
+    This is the only place the JSON paths are spelled out on the ingest side;
+    both the loader and the backfill use it.
+
+    Args:
+        alias (str): Alias of a relation with id, city_name, api_response and both timestamps.
+
+    Returns:
+        str: Comma-separated expressions matching OBSERVATION_COLUMNS.
+    """
+    current = f"{alias}.api_response->'current'"
+    location = f"{alias}.api_response->'location'"
+    return f"""
+        {alias}.id,
+        {alias}.city_name,
+        {alias}.api_call_timestamp,
+        {alias}.ingestion_timestamp,
+        ({current}->>'temperature')::real,
+        ({current}->>'feelslike')::real,
+        ({current}->>'humidity')::smallint,
+        ({current}->>'pressure')::smallint,
+        ({current}->>'wind_speed')::real,
+        ({current}->>'wind_degree')::smallint,
+        ({current}->>'wind_dir')::varchar(3),
+        ({current}->>'precip')::real,
+        ({current}->>'cloudcover')::smallint,
+        ({current}->>'uv_index')::smallint,
+        ({current}->>'visibility')::smallint,
+        {alias}.api_response #>> '{{current,weather_descriptions,0}}',
+        {location}->>'country',
+        {location}->>'region',
+        ({location}->>'lat')::double precision,
+        ({location}->>'lon')::double precision
+    """
+
+
+def backfill_observations(conn, batch_size=50000):
+    """
+    Parses raw rows that have no typed observation yet, one id range at a time.
+
+    Each batch is committed on its own, so the backfill can be interrupted and
+    re-run safely (already parsed rows are skipped).
+
+    Args:
+        conn: Open psycopg2 connection.
+        batch_size (int): Raw ids covered per batch.
+
+    Returns:
+        int: Number of observations written.
+    """
+    with conn.cursor() as cur:
+        ensure_raw_schema(cur)
+        cur.execute("SELECT coalesce(min(id), 0), coalesce(max(id), 0) FROM raw.weather_data;")
+        min_id, max_id = cur.fetchone()
+    conn.commit()
+
+    total = 0
+    for start in range(min_id, max_id + 1, batch_size):
+        end = start + batch_size - 1
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                INSERT INTO raw.weather_observations ({", ".join(OBSERVATION_COLUMNS)})
+                SELECT {observation_select_list("w")}
+                FROM raw.weather_data_full w
+                WHERE w.id BETWEEN %s AND %s
+                ON CONFLICT (weather_data_id, api_call_timestamp) DO NOTHING;
+            """, (start, end))
+            total += cur.rowcount
+        conn.commit()
+        logging.info(f"Backfilled ids {start}-{end} ({total} observations so far).")
+
+    return total
+
+
+def main():
+    from weather_pipeline.db import connect
+
+    parser = argparse.ArgumentParser(description="Backfill raw.weather_observations from raw.weather_data.")
+    parser.add_argument("--batch-size", type=int, default=50000, help="Raw ids per committed batch.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    conn = connect()
+    try:
+        total = backfill_observations(conn, args.batch_size)
+        logging.info(f"Backfill complete: {total} observations written.")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
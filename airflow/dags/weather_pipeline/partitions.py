@@ -0,0 +1,57 @@
+"""
+Partition maintenance for the monthly-partitioned raw tables.
+
+Pre-creates the partitions of the coming months and removes the ones that
+fell out of the retention window. The SQL functions doing the work are
+defined in `sql/init_db.sql`.
+"""
+import logging
+import os
+
+PARTITIONED_TABLES = ("raw.weather_data", "raw.weather_observations")
+
+DEFAULT_MONTHS_AHEAD = 3
+DEFAULT_RETENTION_MONTHS = 24
+
+
+def maintain_partitions(conn, months_ahead=None, retention_months=None, detach_only=None):
+    """
+    Creates future partitions and drops (or detaches) expired ones.
+
+    Args:
+        conn: Open psycopg2 connection; committed on success.
+        months_ahead (int, optional): Months to pre-create (WEATHER_PARTITION_MONTHS_AHEAD).
+        retention_months (int, optional): Full months of history to keep
+            (WEATHER_RAW_RETENTION_MONTHS); 0 keeps everything.
+        detach_only (bool, optional): Detach expired partitions instead of dropping them,
+            e.g. to archive them first (WEATHER_PARTITION_DETACH_ONLY).
+
+    Returns:
+        dict: Partitions created and removed per table.
+    """
+    if months_ahead is None:
+        months_ahead = int(os.getenv("WEATHER_PARTITION_MONTHS_AHEAD", DEFAULT_MONTHS_AHEAD))
+    if retention_months is None:
+        retention_months = int(os.getenv("WEATHER_RAW_RETENTION_MONTHS", DEFAULT_RETENTION_MONTHS))
+    if detach_only is None:
+        detach_only = os.getenv("WEATHER_PARTITION_DETACH_ONLY", "false").lower() == "true"
+
+    summary = {}
+    with conn.cursor() as cur:
+        for table in PARTITIONED_TABLES:
+            cur.execute("SELECT raw.create_monthly_partitions(%s::regclass, %s, 0);", (table, months_ahead))
+            created = cur.fetchone()[0]
+
+            removed = 0
+            if retention_months > 0:
+                cur.execute(
+                    "SELECT raw.drop_expired_partitions(%s::regclass, %s, %s);",
+                    (table, retention_months, detach_only)
+                )
+                removed = cur.fetchone()[0]
+
+            summary[table] = {"created": created, "removed": removed}
+            logging.info(f"{table}: created {created} partitions, "
+                         f"{'detached' if detach_only else 'dropped'} {removed}.")
+    conn.commit()
+    return summary
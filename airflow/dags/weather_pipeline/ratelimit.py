@@ -0,0 +1,48 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter.
+
+    Tokens are refilled continuously at `rate` tokens per second up to
+    `capacity`. Every API call takes one token, so the long-run request rate
+    never exceeds `rate`, while short bursts of up to `capacity` calls are
+    still allowed (useful when a pool of workers starts at the same time).
+
+    Args:
+        rate (float): Tokens added per second (the plan's requests-per-second cap).
+        capacity (float): Maximum number of tokens the bucket can hold.
+            Defaults to `rate`, i.e. at most one second worth of burst.
+    """
+
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError("rate must be greater than 0.")
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._last_refill = now
+
+    def acquire(self, tokens=1):
+        """
+        Blocks until `tokens` tokens are available, then consumes them.
+        """
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                # Time until enough tokens have accumulated
+                wait = (tokens - self._tokens) / self.rate
+            # Sleep outside the lock so other workers can check the bucket
+            time.sleep(wait)
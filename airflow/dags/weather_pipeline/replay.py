@@ -0,0 +1,419 @@
+"""
+Parallel replay of historical weather data, without calling the API.
+
+Two sources can be replayed:
+
+- `db`: re-parses the JSON kept in raw.weather_data (reassembled by the
+  raw.weather_data_full view) into raw.weather_observations.
+  History is split into time (or id) chunks; each chunk deletes and re-derives its
+  typed rows in one short transaction, so a replay never holds one huge
+  transaction or long locks on the warehouse. The same worker then rebuilds the
+  chunk's staging, fact and rollup rows with an incremental `dbt run` bounded to
+  the chunk (the `replay_window` var); dbt runs are serialised by an advisory
+  lock, so they never overlap each other or the hourly transform.
+- `files`: loads recorded responses (staging `.ndjson.gz` batches, NDJSON /
+  JSON-lines files or JSON arrays of WeatherStack responses) through the normal
+  bulk loader. Already loaded observations are skipped by the loader's ON
+  CONFLICT, and the next hourly dbt run picks up the new rows.
+
+Chunks run in a pool of worker processes, one database connection each.
+Finished chunks are recorded in a checkpoint file, so an interrupted replay
+picks up where it stopped when started again with the same arguments.
+
+    python -m weather_pipeline.replay db --since 2024-01-01 --until 2025-01-01 --workers 8
+    python -m weather_pipeline.replay files /opt/airflow/data/staging --workers 4
+"""
+import argparse
+import gzip
+import itertools
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+from weather_pipeline.cache import get_observation_time
+from weather_pipeline.observations import OBSERVATION_COLUMNS, observation_select_list
+from weather_pipeline.statefile import read_json, write_json
+
+DEFAULT_CHECKPOINT_PATH = "/opt/airflow/data/replay_checkpoint.json"
+DEFAULT_WORKERS = 4
+DEFAULT_CHUNK_HOURS = 24
+DEFAULT_CHUNK_IDS = 100000
+
+RECORD_FILE_SUFFIXES = (".ndjson.gz", ".ndjson", ".jsonl", ".jsonl.gz", ".json", ".json.gz")
+
+# One connection per worker process, opened by the pool initializer
+_worker_conn = None
+# dbt session of a worker process, parsed by its first chunk
+_worker_dbt = None
+
+
+class ReplayCheckpoint:
+    """
+    Set of finished chunk keys, persisted as JSON after every chunk.
+
+    A checkpoint only applies to the replay that wrote it: if `signature`
+    (the source and chunking arguments) differs, it starts empty.
+
+    Args:
+        path (str): Checkpoint file.
+        signature (dict): Arguments identifying the replay.
+    """
+
+    def __init__(self, path, signature):
+        self.path = path
+        self.signature = signature
+        self.done = {}
+
+    def load(self):
+        state = read_json(self.path, label="replay checkpoint")
+        if state is None:
+            return self
+
+        if state.get("signature") == self.signature:
+            self.done = state.get("done", {})
+        else:
+            logging.warning(f"Checkpoint {self.path} belongs to another replay; starting from scratch.")
+        return self
+
+    def is_done(self, key):
+        return key in self.done
+
+    def mark_done(self, key, rows):
+        self.done[key] = {"rows": rows, "finished_at": datetime.utcnow().isoformat()}
+        write_json(self.path, {"signature": self.signature, "done": self.done})
+
+
+def plan_db_chunks(conn, chunk_by="time", chunk_hours=DEFAULT_CHUNK_HOURS, chunk_ids=DEFAULT_CHUNK_IDS,
+                   since=None, until=None):
+    """
+    Splits the raw history between `since` and `until` into chunks.
+
+    Time chunks line up with the monthly partitions, so each chunk only touches
+    one partition of each table (as long as chunk_hours divides a day).
+
+    Returns:
+        list[dict]: {"key", "chunk_by", "start", "end"} with a half-open [start, end) range.
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT min(api_call_timestamp), max(api_call_timestamp), min(id), max(id)
+            FROM raw.weather_data
+            WHERE (%(since)s::timestamp IS NULL OR api_call_timestamp >= %(since)s)
+              AND (%(until)s::timestamp IS NULL OR api_call_timestamp < %(until)s);
+        """, {"since": since, "until": until})
+        min_ts, max_ts, min_id, max_id = cur.fetchone()
+    conn.commit()
+
+    if min_ts is None:
+        return []
+
+    chunks = []
+    if chunk_by == "id":
+        for start in range(min_id, max_id + 1, chunk_ids):
+            chunks.append({"key": f"id:{start}", "chunk_by": "id", "start": start, "end": start + chunk_ids,
+                           "since": since, "until": until})
+        return chunks
+
+    start = min_ts.replace(hour=0, minute=0, second=0, microsecond=0)
+    while start <= max_ts:
+        end = start + timedelta(hours=chunk_hours)
+        chunks.append({"key": f"time:{start.isoformat()}", "chunk_by": "time",
+                       "start": max(start, since) if since else start,
+                       "end": min(end, until) if until else end})
+        start = end
+    return chunks
+
+
+def _iter_documents(f):
+    """
+    Decodes a JSON array file (read whole) or a JSON-lines file (line by line).
+
+    Yields:
+        The decoded documents; None for a line that is not valid JSON.
+    """
+    first = f.read(1)
+    while first.isspace():
+        first = f.read(1)
+    if first == "[":
+        yield from json.loads(first + f.read())
+        return
+
+    for line in itertools.chain([first + f.readline()], f):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield None
+
+
+def iter_record_file(path):
+    """
+    Streams WeatherStack responses from a recorded file and gives each one a `_metadata` block.
+
+    The file holds one response per line (NDJSON / JSON lines) or a JSON array
+    of responses. Items that are not successful `current` responses (error
+    bodies, other JSON) are skipped.
+
+    Yields:
+        dict: Responses ready for `bulk_load_records`.
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    loaded_at = datetime.utcnow().isoformat()
+    skipped = 0
+    with opener(path, "rt", encoding="utf-8") as f:
+        for data in _iter_documents(f):
+            if not isinstance(data, dict) or "current" not in data:
+                skipped += 1
+                continue
+
+            if "_metadata" not in data:
+                # A raw API recording: rebuild the metadata the extract step would have added
+                observed_at = get_observation_time(data)
+                city = (data.get("location") or {}).get("name") or (data.get("request") or {}).get("query")
+                if observed_at is None or not city:
+                    skipped += 1
+                    continue
+                data["_metadata"] = {
+                    "city_name": city,
+                    "api_call_timestamp": observed_at.isoformat(),
+                    "request_timestamp": None,
+                    "ingestion_timestamp": loaded_at,
+                    "status_code": 200,
+                }
+            yield data
+
+    if skipped:
+        logging.info(f"Skipped {skipped} items of {path} that are not weather responses.")
+
+
+def find_record_files(paths):
+    """Expands directories into the recorded response files they contain, sorted by name."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(
+                os.path.join(path, name) for name in sorted(os.listdir(path))
+                if name.endswith(RECORD_FILE_SUFFIXES)
+            )
+        else:
+            files.append(path)
+    return [os.path.abspath(path) for path in files]
+
+
+def _init_worker():
+    global _worker_conn
+    from weather_pipeline.db import connect
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s [%(process)d] %(message)s")
+    _worker_conn = connect()
+
+
+def replay_db_chunk(chunk):
+    """
+    Re-derives the typed observations of one chunk in a single transaction, then
+    (unless chunk["marts"] is false) the dbt models built from them.
+
+    Returns:
+        tuple[str, int, float]: Chunk key, observations written and seconds taken.
+    """
+    started = time.perf_counter()
+    if chunk["chunk_by"] == "id":
+        obs_filter = "weather_data_id >= %(start)s AND weather_data_id < %(end)s"
+        raw_filter = "w.id >= %(start)s AND w.id < %(end)s"
+    else:
+        obs_filter = "api_call_timestamp >= %(start)s AND api_call_timestamp < %(end)s"
+        raw_filter = "w.api_call_timestamp >= %(start)s AND w.api_call_timestamp < %(end)s"
+    # Id chunks still honour the --since/--until window
+    window = """
+        AND (%(since)s::timestamp IS NULL OR {column} >= %(since)s)
+        AND (%(until)s::timestamp IS NULL OR {column} < %(until)s)
+    """
+    params = {"start": chunk["start"], "end": chunk["end"],
+              "since": chunk.get("since"), "until": chunk.get("until")}
+
+    try:
+        with _worker_conn.cursor() as cur:
+            cur.execute(
+                f"DELETE FROM raw.weather_observations WHERE {obs_filter}"
+                f"{window.format(column='api_call_timestamp')};",
+                params
+            )
+            cur.execute(f"""
+                INSERT INTO raw.weather_observations ({", ".join(OBSERVATION_COLUMNS)})
+                SELECT {observation_select_list("w")}
+                FROM raw.weather_data_full w
+                WHERE {raw_filter}{window.format(column='w.api_call_timestamp')}
+                -- The loader may have written the rows of a raw row committed after our DELETE
+                ON CONFLICT DO NOTHING;
+            """, params)
+            rows = cur.rowcount
+        _worker_conn.commit()
+    except Exception:
+        _worker_conn.rollback()
+        raise
+
+    if chunk.get("marts", True):
+        rebuild_chunk_marts(chunk)
+    return chunk["key"], rows, time.perf_counter() - started
+
+
+def rebuild_chunk_marts(chunk):
+    """
+    Rebuilds the staging, fact and rollup rows of a replayed chunk with an
+    incremental `dbt run` that also selects the chunk's range (see
+    replay_window_condition in dbt/macros/incremental.sql).
+    """
+    global _worker_dbt
+    from weather_pipeline.transform import DEFAULT_PROJECT_DIR, RAW_SELECTOR, DbtSession, dbt_lock
+
+    if _worker_dbt is None:
+        # A target directory per worker, so concurrent workers never share artifacts
+        _worker_dbt = DbtSession(os.getenv("WEATHER_DBT_PROJECT_DIR", DEFAULT_PROJECT_DIR),
+                                 target_path=f"target_replay_{os.getpid()}")
+        _worker_dbt.parse()
+    start, end = chunk["start"], chunk["end"]
+    if chunk["chunk_by"] == "time":
+        start, end = start.isoformat(), end.isoformat()
+    window = {"by": chunk["chunk_by"], "start": start, "end": end}
+    with dbt_lock(_worker_conn):
+        _worker_dbt.invoke("run", "--select", RAW_SELECTOR, "--vars", json.dumps({"replay_window": window}))
+
+
+def replay_file_chunk(path):
+    """
+    Loads one recorded response file through the bulk loader in a single transaction.
+
+    Returns:
+        tuple[str, int, float]: File path, rows inserted and seconds taken.
+    """
+    from weather_pipeline.load import bulk_load_records
+
+    started = time.perf_counter()
+    try:
+        inserted, skipped = bulk_load_records(_worker_conn, iter_record_file(path))
+        _worker_conn.commit()
+    except Exception:
+        _worker_conn.rollback()
+        raise
+    logging.info(f"Loaded {path}: {inserted} inserted, {skipped} already present.")
+    return path, inserted, time.perf_counter() - started
+
+
+def run_replay(work, chunks, checkpoint, workers=DEFAULT_WORKERS):
+    """
+    Runs `work(chunk)` for every unfinished chunk on a process pool.
+
+    A failed chunk does not stop the others; it is left out of the checkpoint
+    so the next run retries it.
+
+    Args:
+        work (callable): replay_db_chunk or replay_file_chunk.
+        chunks (list): Chunks as accepted by `work`; their key is chunk["key"] or the chunk itself.
+        checkpoint (ReplayCheckpoint): Finished chunks, updated as chunks complete.
+        workers (int): Worker processes.
+
+    Returns:
+        dict: chunks done/failed/skipped and total rows.
+    """
+    def key_of(chunk):
+        return chunk["key"] if isinstance(chunk, dict) else chunk
+
+    pending = [chunk for chunk in chunks if not checkpoint.is_done(key_of(chunk))]
+    summary = {"chunks": len(chunks), "skipped": len(chunks) - len(pending), "done": 0, "failed": 0, "rows": 0}
+    if summary["skipped"]:
+        logging.info(f"Resuming: {summary['skipped']} of {len(chunks)} chunks already replayed.")
+    if not pending:
+        return summary
+
+    with ProcessPoolExecutor(max_workers=max(1, min(workers, len(pending))), initializer=_init_worker) as pool:
+        futures = {pool.submit(work, chunk): key_of(chunk) for chunk in pending}
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                _, rows, seconds = future.result()
+            except Exception as e:
+                summary["failed"] += 1
+                logging.error(f"Chunk {key} failed: {e}")
+                continue
+            checkpoint.mark_done(key, rows)
+            summary["done"] += 1
+            summary["rows"] += rows
+            logging.info(f"Chunk {key}: {rows} rows in {seconds:.1f}s "
+                         f"({summary['done'] + summary['skipped']}/{len(chunks)}).")
+    return summary
+
+
+def main():
+    from weather_pipeline.db import connect
+    from weather_pipeline.metrics import export_metrics, track_stage
+    from weather_pipeline.schema import ensure_raw_schema
+
+    parser = argparse.ArgumentParser(description="Replay historical weather data without calling the API.")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEATHER_REPLAY_WORKERS", DEFAULT_WORKERS)))
+    parser.add_argument("--checkpoint", default=os.getenv("WEATHER_REPLAY_CHECKPOINT", DEFAULT_CHECKPOINT_PATH))
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and replay every chunk.")
+    sources = parser.add_subparsers(dest="source", required=True)
+
+    db = sources.add_parser("db", help="Re-derive raw.weather_observations from raw.weather_data.")
+    db.add_argument("--chunk-by", choices=("time", "id"), default="time")
+    db.add_argument("--chunk-hours", type=int, default=DEFAULT_CHUNK_HOURS)
+    db.add_argument("--chunk-ids", type=int, default=DEFAULT_CHUNK_IDS)
+    db.add_argument("--since", type=datetime.fromisoformat, help="First api_call_timestamp to replay.")
+    db.add_argument("--until", type=datetime.fromisoformat, help="Replay up to (excluding) this time.")
+    db.add_argument("--skip-marts", action="store_true",
+                    help="Only re-derive raw.weather_observations; rebuild the dbt models yourself.")
+
+    files = sources.add_parser("files", help="Load recorded API responses into the raw tables.")
+    files.add_argument("paths", nargs="+", help="Record files or directories of them.")
+    files.add_argument("--months-back", type=int, default=0,
+                       help="Create monthly partitions this far back before loading old recordings.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    conn = connect()
+    try:
+        with conn.cursor() as cur:
+            ensure_raw_schema(cur)
+            if args.source == "files" and args.months_back > 0:
+                for table in ("raw.weather_data", "raw.weather_observations"):
+                    cur.execute("SELECT raw.create_monthly_partitions(%s::regclass, 0, %s);",
+                                (table, args.months_back))
+        conn.commit()
+
+        if args.source == "db":
+            chunks = plan_db_chunks(conn, args.chunk_by, args.chunk_hours, args.chunk_ids, args.since, args.until)
+            for chunk in chunks:
+                chunk["marts"] = not args.skip_marts
+            signature = {"source": "db", "chunk_by": args.chunk_by, "chunk_hours": args.chunk_hours,
+                         "chunk_ids": args.chunk_ids, "since": str(args.since), "until": str(args.until),
+                         "marts": not args.skip_marts}
+            work = replay_db_chunk
+        else:
+            chunks = find_record_files(args.paths)
+            signature = {"source": "files"}
+            work = replay_file_chunk
+    finally:
+        conn.close()
+
+    checkpoint = ReplayCheckpoint(args.checkpoint, signature)
+    if not args.restart:
+        checkpoint.load()
+
+    logging.info(f"Replaying {len(chunks)} chunks with {args.workers} workers.")
+    try:
+        with track_stage("replay"):
+            summary = run_replay(work, chunks, checkpoint, args.workers)
+    finally:
+        export_metrics("replay")
+    logging.info(f"Replay finished: {json.dumps(summary)}")
+    if summary["failed"]:
+        raise SystemExit(f"{summary['failed']} chunks failed; run the same command again to retry them.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Ensures the raw tables exist, using `sql/init_db.sql` as the only schema definition.
+
+The Postgres container runs init_db.sql on first start. Tasks that write to the
+raw tables call `ensure_raw_schema` so a database created some other way is
+set up from that same file, rather than from a second copy of the DDL that can
+drift out of sync.
+
+Mapped load shards, the streaming service and replays can all find a fresh
+database at the same time. Concurrent CREATE TABLE ... PARTITION OF / CREATE
+FUNCTION statements fail with duplicate-object errors or deadlocks, so the
+script only runs under a transaction-level advisory lock, after checking again
+for the tables once the lock is held.
+"""
+import logging
+import os
+
+DEFAULT_SCHEMA_FILE = "/opt/sql/init_db.sql"
+
+# pg_advisory_xact_lock key serialising schema bootstraps ("weather" in ASCII)
+SCHEMA_LOCK_KEY = 0x77656174686572
+
+REQUIRED_TABLES = (
+    "raw.weather_data",
+    "raw.weather_observations",
+    "raw.weather_static_blocks",
+    "analytics.current_conditions",
+)
+
+
+def ensure_raw_schema(cur):
+    """
+    Runs init_db.sql if any of the raw tables (or the serving table they feed) is missing.
+
+    The common case (everything exists) costs one catalog query and takes no lock.
+    Otherwise the advisory lock is held until the caller's transaction ends, so the
+    caller should commit soon after; other sessions wait for the commit and then
+    find the tables.
+
+    Args:
+        cur: Open psycopg2 cursor in a transaction (the caller commits).
+    """
+    if _tables_exist(cur):
+        return
+
+    cur.execute("SELECT pg_advisory_xact_lock(%s);", (SCHEMA_LOCK_KEY,))
+    # Another session may have created them while we waited for the lock
+    if _tables_exist(cur):
+        return
+
+    path = os.getenv("WEATHER_SCHEMA_FILE", DEFAULT_SCHEMA_FILE)
+    logging.info(f"Raw tables missing; applying schema from {path}...")
+    with open(path) as f:
+        cur.execute(f.read())
+
+
+def _tables_exist(cur):
+    cur.execute(
+        "SELECT " + ", ".join("to_regclass(%s) IS NOT NULL" for _ in REQUIRED_TABLES) + ";",
+        REQUIRED_TABLES
+    )
+    return all(cur.fetchone())
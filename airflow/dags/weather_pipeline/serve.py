@@ -0,0 +1,251 @@
+"""
+Read API for the current weather conditions per city.
+
+Serves `analytics.current_conditions` (one row per city, kept up to date by
+the loader) as JSON, from an in-process cache:
+- the whole table is read at once (O(cities)) and kept for at most `ttl` seconds,
+- a listener thread runs `LISTEN weather_current_conditions` on its own
+  connection and drops the cache as soon as a load commits new readings, so
+  answers are fresh right after a load and the database is not queried between loads,
+- if the listener loses its connection, the TTL still bounds staleness while it reconnects.
+
+Endpoints:
+    GET /current          all cities
+    GET /current/<city>   one city (URL-encoded name), 404 if unknown
+    GET /health           cache and listener status
+
+    python -m weather_pipeline.serve
+"""
+import json
+import logging
+import os
+import select
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse
+
+from weather_pipeline.load import CURRENT_CONDITIONS_CHANNEL
+
+DEFAULT_PORT = 8090
+DEFAULT_CACHE_TTL_SECONDS = 60
+# How long the listener waits for a notification before checking for shutdown
+LISTEN_POLL_SECONDS = 5
+
+
+def get_serve_settings():
+    """
+    Reads the read API knobs from the environment.
+
+    Returns:
+        dict: port and ttl.
+    """
+    return {
+        "port": int(os.getenv("WEATHER_SERVE_PORT", DEFAULT_PORT)),
+        "ttl": float(os.getenv("WEATHER_SERVE_CACHE_TTL_SECONDS", DEFAULT_CACHE_TTL_SECONDS)),
+    }
+
+
+def fetch_current_conditions(conn):
+    """
+    Reads the whole serving table.
+
+    Returns:
+        dict[str, dict]: city name -> its current conditions (JSON-ready values).
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT * FROM analytics.current_conditions ORDER BY city_name;")
+        columns = [column.name for column in cur.description]
+        rows = cur.fetchall()
+    conn.commit()
+    conditions = {}
+    for row in rows:
+        record = {
+            column: value.isoformat() if hasattr(value, "isoformat") else value
+            for column, value in zip(columns, row)
+        }
+        conditions[record["city_name"]] = record
+    return conditions
+
+
+class CurrentConditionsCache:
+    """
+    TTL cache of the serving table, invalidated by NOTIFY.
+
+    Args:
+        load (callable): Returns the full {city: conditions} mapping.
+        ttl (float): Maximum age of the cached mapping in seconds.
+    """
+
+    def __init__(self, load, ttl=DEFAULT_CACHE_TTL_SECONDS):
+        self.load = load
+        self.ttl = ttl
+        self._data = None
+        self._loaded_at = 0.0
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self._data = None
+            self._generation += 1
+
+    def get(self):
+        """Returns the cached mapping, reloading it if it expired or was invalidated."""
+        with self._lock:
+            if self._data is not None and time.monotonic() - self._loaded_at < self.ttl:
+                return self._data
+            generation = self._generation
+        # Load outside the lock, so one slow query does not block requests served from a fresh cache
+        data = self.load()
+        with self._lock:
+            # An invalidation that arrived while loading may not be reflected in `data`: don't keep it
+            if generation == self._generation:
+                self._data = data
+                self._loaded_at = time.monotonic()
+        return data
+
+    def age(self):
+        with self._lock:
+            return None if self._data is None else time.monotonic() - self._loaded_at
+
+
+class NotificationListener(threading.Thread):
+    """
+    Invalidates the cache whenever the loader announces new current conditions.
+
+    Args:
+        cache (CurrentConditionsCache): Cache to invalidate.
+        connect (callable): Returns a new, dedicated psycopg2 connection.
+        channel (str): NOTIFY channel.
+    """
+
+    def __init__(self, cache, connect, channel=CURRENT_CONDITIONS_CHANNEL):
+        super().__init__(name="current-conditions-listener", daemon=True)
+        self.cache = cache
+        self.connect = connect
+        self.channel = channel
+        self.connected = False
+        self._stopping = threading.Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    def run(self):
+        delay = 1
+        while not self._stopping.is_set():
+            conn = None
+            try:
+                conn = self.connect()
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {self.channel};")
+                self.connected = True
+                # Anything committed while we were not listening is unknown: start over
+                self.cache.invalidate()
+                delay = 1
+                logging.info(f"Listening for notifications on {self.channel}.")
+                while not self._stopping.is_set():
+                    if select.select([conn], [], [], LISTEN_POLL_SECONDS) == ([], [], []):
+                        continue
+                    conn.poll()
+                    if conn.notifies:
+                        conn.notifies.clear()
+                        self.cache.invalidate()
+            except Exception as e:
+                logging.warning(f"Notification listener failed, retrying in {delay}s: {e}")
+                self._stopping.wait(delay)
+                delay = min(60, delay * 2)
+            finally:
+                self.connected = False
+                if conn is not None:
+                    conn.close()
+
+
+class CurrentConditionsServer(ThreadingHTTPServer):
+    """
+    Args:
+        address (tuple): (host, port); port 0 picks a free port.
+        cache (CurrentConditionsCache): Source of the answers.
+        listener (NotificationListener, optional): Reported by /health.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, cache, listener=None):
+        super().__init__(address, CurrentConditionsHandler)
+        self.cache = cache
+        self.listener = listener
+
+
+class CurrentConditionsHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+    def _send_json(self, status, body):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        path = urlparse(self.path).path.rstrip("/")
+        if path == "/health":
+            listener = self.server.listener
+            self._send_json(200, {
+                "status": "ok",
+                "cache_age_seconds": self.server.cache.age(),
+                "listening": listener.connected if listener is not None else False,
+            })
+            return
+
+        try:
+            if path == "/current":
+                self._send_json(200, list(self.server.cache.get().values()))
+            elif path.startswith("/current/"):
+                city = unquote(path[len("/current/"):])
+                conditions = self.server.cache.get().get(city)
+                if conditions is None:
+                    self._send_json(404, {"error": f"No current conditions for {city}."})
+                else:
+                    self._send_json(200, conditions)
+            else:
+                self._send_json(404, {"error": "Unknown endpoint."})
+        except Exception as e:
+            logging.error(f"Request {self.path} failed: {e}")
+            self._send_json(503, {"error": "Current conditions are unavailable."})
+
+
+def main():
+    from dotenv import load_dotenv
+
+    from weather_pipeline.db import connect, get_pool
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    settings = get_serve_settings()
+
+    def load():
+        with get_pool().connection() as conn:
+            return fetch_current_conditions(conn)
+
+    cache = CurrentConditionsCache(load, ttl=settings["ttl"])
+    listener = NotificationListener(cache, connect)
+    listener.start()
+    server = CurrentConditionsServer(("0.0.0.0", settings["port"]), cache, listener)
+    logging.info(f"Serving current conditions on port {settings['port']} (cache TTL {settings['ttl']}s).")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.stop()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
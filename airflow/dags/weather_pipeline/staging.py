@@ -0,0 +1,175 @@
+"""
+Local staging store for extracted API responses.
+
+Extract streams every response into a gzip-compressed NDJSON batch file as
+soon as it arrives, and only a small manifest (path, row count, checksum and
+time range) travels through XCom. The loader streams the file back, so neither
+task holds the whole batch in memory and the Airflow metadata DB stays small.
+
+Old batch files are removed by `cleanup_staging` once they are past the
+retention window.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime
+
+DEFAULT_STAGING_DIR = "/opt/airflow/data/staging"
+DEFAULT_RETENTION_HOURS = 72
+
+FILE_SUFFIX = ".ndjson.gz"
+
+
+def get_staging_dir():
+    return os.getenv("WEATHER_STAGING_DIR", DEFAULT_STAGING_DIR)
+
+
+class StagingWriter:
+    """
+    Writes records incrementally to a compressed NDJSON batch file.
+
+    The file is written under a temporary name and renamed on close, so a
+    half-written batch is never picked up by the loader.
+
+    Args:
+        directory (str, optional): Staging directory. Defaults to WEATHER_STAGING_DIR.
+        prefix (str): File name prefix, e.g. the task or shard name.
+    """
+
+    def __init__(self, directory=None, prefix="weather"):
+        self.directory = directory or get_staging_dir()
+        os.makedirs(self.directory, exist_ok=True)
+
+        name = f"{prefix}_{datetime.utcnow():%Y%m%dT%H%M%S}_{uuid.uuid4().hex[:8]}{FILE_SUFFIX}"
+        self.path = os.path.join(self.directory, name)
+        self._tmp_path = f"{self.path}.part"
+        self._file = gzip.open(self._tmp_path, "wt", encoding="utf-8")
+        self._sha256 = hashlib.sha256()
+        self.row_count = 0
+        self.min_timestamp = None
+        self.max_timestamp = None
+        self.manifest = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+        elif self.manifest is None:
+            self.close()
+
+    def write(self, record):
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        self._file.write(line)
+        # The checksum covers the uncompressed NDJSON, which is what the loader verifies
+        self._sha256.update(line.encode("utf-8"))
+        self.row_count += 1
+
+        timestamp = record.get("_metadata", {}).get("api_call_timestamp")
+        if timestamp:
+            if self.min_timestamp is None or timestamp < self.min_timestamp:
+                self.min_timestamp = timestamp
+            if self.max_timestamp is None or timestamp > self.max_timestamp:
+                self.max_timestamp = timestamp
+
+    def close(self):
+        """
+        Finalises the file and returns its manifest.
+
+        Returns:
+            dict: path, row_count, checksum, min/max api_call_timestamp and created_at.
+        """
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+        self.manifest = {
+            "path": self.path,
+            "row_count": self.row_count,
+            "checksum": f"sha256:{self._sha256.hexdigest()}",
+            "min_api_call_timestamp": self.min_timestamp,
+            "max_api_call_timestamp": self.max_timestamp,
+            "created_at": datetime.utcnow().isoformat(),
+        }
+        return self.manifest
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+
+def iter_staged_records(manifest, verify=True):
+    """
+    Streams the records of a staged batch file.
+
+    Args:
+        manifest (dict): Manifest returned by `StagingWriter.close`.
+        verify (bool): Check row count and checksum once the file is exhausted.
+
+    Yields:
+        dict: One API response per line.
+
+    Raises:
+        ValueError: If the file does not match its manifest. This is raised after
+            the last record, so callers loading inside a transaction should not
+            commit before the generator is exhausted.
+    """
+    sha256 = hashlib.sha256()
+    row_count = 0
+    with gzip.open(manifest["path"], "rt", encoding="utf-8") as f:
+        for line in f:
+            if verify:
+                sha256.update(line.encode("utf-8"))
+            row_count += 1
+            yield json.loads(line)
+
+    if verify:
+        checksum = f"sha256:{sha256.hexdigest()}"
+        if row_count != manifest["row_count"] or checksum != manifest["checksum"]:
+            raise ValueError(
+                f"Staged file {manifest['path']} does not match its manifest "
+                f"({row_count} rows, {checksum})."
+            )
+
+
+def cleanup_staging(directory=None, retention_hours=None):
+    """
+    Deletes staged batch files older than the retention window.
+
+    Files are kept for a while after loading so a failed load can be retried
+    and recent batches can be replayed without calling the API again.
+
+    Args:
+        directory (str, optional): Staging directory. Defaults to WEATHER_STAGING_DIR.
+        retention_hours (float, optional): Defaults to WEATHER_STAGING_RETENTION_HOURS.
+
+    Returns:
+        int: Number of files removed.
+    """
+    directory = directory or get_staging_dir()
+    if retention_hours is None:
+        retention_hours = float(os.getenv("WEATHER_STAGING_RETENTION_HOURS", DEFAULT_RETENTION_HOURS))
+    if not os.path.isdir(directory):
+        return 0
+
+    cutoff = time.time() - retention_hours * 3600
+    removed = 0
+    for name in os.listdir(directory):
+        if not (name.endswith(FILE_SUFFIX) or name.endswith(f"{FILE_SUFFIX}.part")):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except FileNotFoundError:
+            # Another task cleaned it up first
+            continue
+
+    if removed:
+        logging.info(f"Removed {removed} staged files older than {retention_hours}h from {directory}.")
+    return removed
@@ -0,0 +1,83 @@
+"""
+Small JSON files that carry state between task runs and processes.
+
+The observation cache, the freshness scheduler, the dbt transform state, the
+replay checkpoint and the Parquet export manifest all keep their state in such
+files. This module holds the file handling they share:
+- `read_json`: a missing file means "no state yet"; an unreadable one is logged
+  and treated the same way, unless the caller asks for the error,
+- `write_json` / `write_text`: atomic writes (a temporary file in the same
+  directory, then a rename), so readers never see a half-written file,
+- `locked`: an exclusive `fcntl` lock on `<path>.lock`, so processes doing a
+  read-modify-write cycle on the same file don't lose each other's updates.
+"""
+import fcntl
+import json
+import logging
+import os
+import tempfile
+from contextlib import contextmanager
+
+
+def read_json(path, default=None, label="state file", ignore_errors=True):
+    """
+    Reads a JSON state file.
+
+    Args:
+        path (str): File to read.
+        default: Returned when the file is missing (or unreadable, see `ignore_errors`).
+        label (str): What the file is, for the warning about an unreadable file.
+        ignore_errors (bool): Return `default` for a corrupt or unreadable file
+            instead of raising.
+
+    Returns:
+        The decoded JSON, or `default`.
+    """
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+    except (OSError, ValueError) as e:
+        if not ignore_errors:
+            raise
+        logging.warning(f"Ignoring unreadable {label} {path}: {e}")
+        return default
+
+
+def write_text(path, text):
+    """Atomically replaces `path` with `text`, creating its directory if needed."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    # A unique temporary name, so two writers never share one temporary file
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_json(path, data, **dump_kwargs):
+    """Atomically writes `data` as JSON; `dump_kwargs` go to `json.dumps`."""
+    write_text(path, json.dumps(data, **dump_kwargs))
+
+
+@contextmanager
+def locked(path):
+    """
+    Holds an exclusive lock for the state file `path` (on `<path>.lock`) for the block.
+
+    Only processes that also use `locked` are excluded; readers that just call
+    `read_json` never block and always see a complete file.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(f"{path}.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
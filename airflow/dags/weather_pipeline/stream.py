@@ -0,0 +1,362 @@
+"""
+Continuous micro-batch ingestion, as an alternative to waiting for the hourly DAG.
+
+A long-running service that reuses the extract and load code of the DAG:
+
+- a scheduler polls every city on its own interval: how often its observation
+  changes (as learned by the freshness scheduler) divided by its seed priority,
+  within [min_poll_seconds, max_poll_seconds]; cities with priority 0 are never
+  polled. First polls are staggered, so requests are spread out instead of
+  arriving in one burst. Fetches run on a thread pool from an asyncio loop,
+  through the same pooled, rate-limited WeatherStack client,
+- new observations go into a bounded in-memory queue; when it is full, pollers
+  wait, so a slow database slows down polling instead of growing memory,
+- a single flusher writes the queue to raw.weather_data with the bulk loader
+  every `flush_records` records or `flush_seconds` seconds, whichever comes first,
+- every `sync_seconds` the freshness scheduler state is updated: the calls sent
+  since the last sync are charged to the monthly quota the hourly DAG budgets
+  from, the change rates are learned from the flushed observations, and the
+  intervals pick up what the DAG learned meanwhile.
+
+On SIGTERM/SIGINT polling stops, in-flight fetches finish and everything still
+queued is flushed before exit. A batch the database keeps rejecting is spilled
+to a staging file instead of being dropped; load it later with
+`python -m weather_pipeline.replay files`.
+
+    python -m weather_pipeline.stream
+"""
+import asyncio
+import heapq
+import logging
+import os
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from weather_pipeline.cities import DEFAULT_PRIORITY, load_cities, load_city_priorities
+from weather_pipeline.client import WeatherStackClient
+from weather_pipeline.extract import fetch_city_weather, get_extract_settings
+from weather_pipeline.freshness import FreshnessScheduler
+from weather_pipeline.load import bulk_load_records
+from weather_pipeline.metrics import DB_ROUND_TRIPS, REGISTRY, STREAM_QUEUE_DEPTH
+from weather_pipeline.ratelimit import TokenBucket
+from weather_pipeline.schema import ensure_raw_schema
+from weather_pipeline.staging import StagingWriter
+
+DEFAULT_POLL_SECONDS = 900
+DEFAULT_MIN_POLL_SECONDS = 60
+DEFAULT_MAX_POLL_SECONDS = 6 * 3600
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_FLUSH_RECORDS = 1000
+DEFAULT_FLUSH_SECONDS = 5
+DEFAULT_FLUSH_RETRIES = 3
+DEFAULT_SYNC_SECONDS = 60
+
+# Marks the end of the stream for the flusher
+_END = object()
+
+
+def get_stream_settings():
+    """
+    Reads the streaming knobs from the environment.
+
+    Returns:
+        dict: poll_seconds, min_poll_seconds, max_poll_seconds, queue_size,
+            flush_records and flush_seconds.
+    """
+    return {
+        "poll_seconds": float(os.getenv("WEATHER_STREAM_POLL_SECONDS", DEFAULT_POLL_SECONDS)),
+        "min_poll_seconds": float(os.getenv("WEATHER_STREAM_MIN_POLL_SECONDS", DEFAULT_MIN_POLL_SECONDS)),
+        "max_poll_seconds": float(os.getenv("WEATHER_STREAM_MAX_POLL_SECONDS", DEFAULT_MAX_POLL_SECONDS)),
+        "queue_size": max(1, int(os.getenv("WEATHER_STREAM_QUEUE_SIZE", DEFAULT_QUEUE_SIZE))),
+        "flush_records": max(1, int(os.getenv("WEATHER_STREAM_FLUSH_RECORDS", DEFAULT_FLUSH_RECORDS))),
+        "flush_seconds": float(os.getenv("WEATHER_STREAM_FLUSH_SECONDS", DEFAULT_FLUSH_SECONDS)),
+    }
+
+
+class StreamingIngestor:
+    """
+    Polls cities continuously and loads their observations in micro-batches.
+
+    Args:
+        cities (list[str]): Cities to poll.
+        client (WeatherStackClient): Shared client; its pool should match `concurrency`.
+        connect (callable): Returns a new psycopg2 connection.
+        poll_seconds (float): Change interval assumed for a city the scheduler has no history for.
+        concurrency (int): Maximum fetches in flight.
+        queue_size (int): Observations buffered before pollers are paused.
+        flush_records (int): Flush as soon as this many observations are buffered.
+        flush_seconds (float): Flush at the latest this long after the first buffered one.
+        cache (ObservationCache, optional): Drops unchanged observations; updated after each flush.
+        priorities (dict[str, float], optional): Seed priorities; missing cities weigh
+            DEFAULT_PRIORITY, cities weighing 0 are not polled.
+        scheduler (FreshnessScheduler, optional): Shared scheduler state: learned change
+            intervals, and the monthly usage the calls are charged to.
+        min_poll_seconds (float): Shortest interval between two polls of the same city.
+        max_poll_seconds (float): Longest interval between two polls of the same city.
+        sync_seconds (float): Interval between two updates of the scheduler state.
+    """
+
+    def __init__(self, cities, client, connect, poll_seconds=DEFAULT_POLL_SECONDS, concurrency=8,
+                 queue_size=DEFAULT_QUEUE_SIZE, flush_records=DEFAULT_FLUSH_RECORDS,
+                 flush_seconds=DEFAULT_FLUSH_SECONDS, cache=None, priorities=None, scheduler=None,
+                 min_poll_seconds=DEFAULT_MIN_POLL_SECONDS, max_poll_seconds=DEFAULT_MAX_POLL_SECONDS,
+                 sync_seconds=DEFAULT_SYNC_SECONDS):
+        self.priorities = priorities or {}
+        self.cities = [city for city in cities if self.priorities.get(city, DEFAULT_PRIORITY) > 0]
+        self.client = client
+        self.connect = connect
+        self.poll_seconds = poll_seconds
+        self.min_poll_seconds = min_poll_seconds
+        self.max_poll_seconds = max(min_poll_seconds, max_poll_seconds)
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.flush_records = flush_records
+        self.flush_seconds = flush_seconds
+        self.cache = cache
+        self.scheduler = scheduler
+        self.sync_seconds = sync_seconds
+        self.conn = None
+        self.loaded = 0
+        self.charged = 0
+        # Latest flushed observation per city, learned at the next sync (DB thread only)
+        self._observed = {}
+
+    def request_stop(self):
+        if not self._stopping.is_set():
+            logging.info("Stop requested; finishing in-flight fetches and flushing the queue...")
+            self._stopping.set()
+
+    async def run(self):
+        """Runs until `request_stop` is called, then drains and flushes everything."""
+        self._loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        # Fetches wait on the network; the single DB thread keeps flushes in order
+        self._fetch_pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="stream-fetch")
+        self._db_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="stream-flush")
+
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            self._loop.add_signal_handler(sig, self.request_stop)
+
+        if self.scheduler is not None:
+            self.scheduler.load()
+        logging.info(
+            f"Streaming {len(self.cities)} cities every {self.min_poll_seconds}-{self.max_poll_seconds}s "
+            f"(flush every {self.flush_records} records or {self.flush_seconds}s)."
+        )
+        try:
+            await asyncio.gather(self._poll_loop(), self._flush_loop(), self._sync_loop())
+        finally:
+            self._fetch_pool.shutdown(wait=True)
+            self._db_pool.shutdown(wait=True)
+            self._sync_state()
+            if self.conn is not None:
+                self.conn.close()
+        logging.info(f"Streaming stopped after loading {self.loaded} observations.")
+
+    def poll_interval(self, city):
+        """
+        Seconds until `city` is polled again: its learned change interval divided
+        by its priority, within [min_poll_seconds, max_poll_seconds].
+
+        Polling about once per change keeps the chance of a new reading per call
+        high; a higher priority polls proportionally more often.
+        """
+        change_seconds = self.poll_seconds
+        if self.scheduler is not None:
+            change_seconds = self.scheduler.cities.get(city, {}).get("change_seconds", change_seconds)
+        priority = self.priorities.get(city, DEFAULT_PRIORITY)
+        return min(self.max_poll_seconds, max(self.min_poll_seconds, change_seconds / priority))
+
+    async def _poll_loop(self):
+        now = self._loop.time()
+        count = max(1, len(self.cities))
+        # Each city's first poll falls somewhere in its own interval, so the polls start spread out
+        schedule = [(now + self.poll_interval(city) * i / count, city) for i, city in enumerate(self.cities)]
+        heapq.heapify(schedule)
+        slots = asyncio.Semaphore(self.concurrency)
+        in_flight = set()
+
+        while schedule and not self._stopping.is_set():
+            due, city = schedule[0]
+            delay = due - self._loop.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await slots.acquire()
+            if self._stopping.is_set():
+                slots.release()
+                break
+            heapq.heapreplace(schedule, (due + self.poll_interval(city), city))
+            fetch = asyncio.ensure_future(self._poll_city(city, slots))
+            in_flight.add(fetch)
+            fetch.add_done_callback(in_flight.discard)
+
+        if in_flight:
+            await asyncio.gather(*in_flight, return_exceptions=True)
+        await self._queue.put(_END)
+
+    async def _sync_loop(self):
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.sync_seconds)
+            except asyncio.TimeoutError:
+                pass
+            # On the DB thread: it owns `_observed`, and the state file lock can block
+            await self._loop.run_in_executor(self._db_pool, self._sync_state)
+
+    def _sync_state(self):
+        """
+        Charges the calls sent since the previous sync, learns from the observations
+        flushed since then and reloads the state the DAG updates too. A failed sync
+        is retried at the next one.
+        """
+        if self.scheduler is None:
+            return
+        calls = self.client.calls_sent - self.charged
+        observed, self._observed = self._observed, {}
+        try:
+            with self.scheduler.transaction() as scheduler:
+                scheduler.charge(calls)
+                for city, observed_at in observed.items():
+                    scheduler.learn(city, observed_at)
+        except OSError as e:
+            logging.error(f"Could not update the scheduler state ({calls} API calls not charged yet): {e}")
+            for city, observed_at in observed.items():
+                self._observed.setdefault(city, observed_at)
+            return
+        self.charged += calls
+
+    async def _poll_city(self, city, slots):
+        try:
+            data = await self._loop.run_in_executor(self._fetch_pool, fetch_city_weather, self.client, city)
+            if data is None:
+                return
+            metadata = data["_metadata"]
+            if self.cache is not None and self.cache.is_unchanged(metadata["city_name"],
+                                                                  metadata["api_call_timestamp"]):
+                return
+            # Backpressure: blocks while the queue is full, and keeps holding the
+            # fetch slot meanwhile, so no new requests start either
+            await self._queue.put(data)
+        finally:
+            slots.release()
+
+    async def _flush_loop(self):
+        batch = []
+        deadline = None
+        while True:
+            try:
+                if batch:
+                    item = await asyncio.wait_for(self._queue.get(), max(0, deadline - self._loop.time()))
+                else:
+                    item = await self._queue.get()
+            except asyncio.TimeoutError:
+                item = None
+
+            if item is _END:
+                if batch:
+                    await self._loop.run_in_executor(self._db_pool, self._flush, batch)
+                return
+            if item is not None:
+                if not batch:
+                    deadline = self._loop.time() + self.flush_seconds
+                batch.append(item)
+
+            if batch and (len(batch) >= self.flush_records or self._loop.time() >= deadline):
+                STREAM_QUEUE_DEPTH.set(self._queue.qsize())
+                await self._loop.run_in_executor(self._db_pool, self._flush, batch)
+                batch = []
+
+    def _flush(self, batch):
+        """Writes one batch in a single transaction, spilling it to a file if the database keeps failing."""
+        for attempt in range(DEFAULT_FLUSH_RETRIES + 1):
+            try:
+                if self.conn is None or self.conn.closed:
+                    self.conn = self.connect()
+                    with self.conn.cursor() as cur:
+                        ensure_raw_schema(cur)
+                        DB_ROUND_TRIPS.labels("schema").inc()
+                    self.conn.commit()
+
+                started = time.perf_counter()
+                inserted, skipped = bulk_load_records(self.conn, batch)
+                self.conn.commit()
+                self.loaded += inserted
+                logging.info(f"Flushed {len(batch)} observations in {time.perf_counter() - started:.2f}s "
+                             f"({inserted} inserted, {skipped} already present).")
+                break
+            except Exception as e:
+                logging.error(f"Flush of {len(batch)} observations failed (attempt {attempt + 1}): {e}")
+                if self.conn is not None and not self.conn.closed:
+                    try:
+                        self.conn.rollback()
+                    except Exception:
+                        self.conn.close()
+                if attempt < DEFAULT_FLUSH_RETRIES:
+                    time.sleep(min(30, 2 ** attempt))
+        else:
+            with StagingWriter(prefix="stream_unflushed") as writer:
+                for data in batch:
+                    writer.write(data)
+                manifest = writer.close()
+            logging.error(f"Spilled {len(batch)} unflushed observations to {manifest['path']}.")
+            return
+
+        for data in batch:
+            metadata = data["_metadata"]
+            observed_at = self._observed.get(metadata["city_name"])
+            if observed_at is None or metadata["api_call_timestamp"] > observed_at:
+                self._observed[metadata["city_name"]] = metadata["api_call_timestamp"]
+        if self.cache is not None:
+            with self.cache.transaction() as cache:
+                for data in batch:
+                    metadata = data["_metadata"]
+                    cache.record(metadata["city_name"], metadata["api_call_timestamp"])
+
+
+def main():
+    from dotenv import load_dotenv
+    from prometheus_client import start_http_server
+
+    from weather_pipeline.cache import ObservationCache
+    from weather_pipeline.db import connect
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    extract_settings = get_extract_settings()
+    stream_settings = get_stream_settings()
+    concurrency = extract_settings["concurrency"]
+    # The hourly DAG leaves WEATHER_STREAM_RATE_LIMIT_RPS of the plan's cap to this service
+    rate_limit_rps = extract_settings["stream_rate_limit_rps"] or extract_settings["rate_limit_rps"]
+    if extract_settings["rate_limit_rps"] > 0 and not extract_settings["stream_rate_limit_rps"]:
+        logging.warning(
+            "WEATHER_STREAM_RATE_LIMIT_RPS is not set: this service uses the whole WEATHERSTACK_RATE_LIMIT_RPS, "
+            "so running it next to the DAG can exceed the plan's cap."
+        )
+
+    metrics_port = os.getenv("WEATHER_STREAM_METRICS_PORT")
+    if metrics_port:
+        start_http_server(int(metrics_port), registry=REGISTRY)
+
+    client = WeatherStackClient(
+        timeout=extract_settings["timeout"], pool_size=concurrency,
+        rate_limiter=TokenBucket(rate_limit_rps) if rate_limit_rps > 0 else None,
+    )
+    with client:
+        ingestor = StreamingIngestor(
+            load_cities(), client, connect, concurrency=concurrency,
+            cache=ObservationCache.from_env(), priorities=load_city_priorities(),
+            scheduler=FreshnessScheduler.from_env(), **stream_settings
+        )
+        asyncio.run(ingestor.run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+In-process, change-aware dbt execution for the hourly DAG.
+
+Running `dbt seed`, `dbt run`, `dbt test` and `dbt docs generate` as four CLI
+processes pays interpreter startup, adapter import and project parsing four
+times, and always does all the work. Instead, one task:
+- parses the project once with dbt's programmatic runner (`dbtRunner`) and
+  hands the parsed manifest to every following command,
+- seeds only the seed files whose checksum changed since the last successful seed,
+- runs and tests only the models downstream of new raw rows
+  (`raw.weather_observations` past the last transformed id) and of re-seeded
+  files; when nothing changed, it runs nothing,
+- scopes the tests of those models to the rows added since the previous
+  watermark (see macros/test_scope.sql); `run_test_sweep` checks the full
+  history on a slower schedule,
+- runs everything, and regenerates the docs, only when the project's definitions
+  (models, tests, macros, schema.yml, dbt_project.yml) changed.
+
+What was done last time is kept in a small JSON state file.
+"""
+import hashlib
+import json
+import logging
+import os
+from contextlib import contextmanager
+from datetime import datetime
+
+from weather_pipeline.db import connection
+from weather_pipeline.metrics import record_dbt_run_results
+from weather_pipeline.statefile import read_json, write_json
+
+DEFAULT_PROJECT_DIR = "/opt/dbt"
+DEFAULT_STATE_PATH = "/opt/airflow/data/dbt_state.json"
+# Every model that reads the typed raw table, directly or indirectly
+RAW_SELECTOR = "source:raw.weather_observations+"
+# Separate target directory, so a sweep never overwrites the hourly run's artifacts
+SWEEP_TARGET_PATH = "target_sweep"
+# Compare the rollups with the facts over all of history in the sweep
+SWEEP_ROLLUP_CHECK_HOURS = 1000000
+# pg_advisory_xact_lock key serialising dbt runs over the incremental models ("dbt" in ASCII)
+DBT_LOCK_KEY = 0x646274
+
+
+def load_state(path):
+    """Reads the transform state; a missing or corrupt file means nothing was done yet."""
+    return read_json(path, {}, label="dbt state")
+
+
+def save_state(path, state):
+    """Atomically writes the transform state."""
+    write_json(path, state, indent=2, sort_keys=True)
+
+
+def seed_checksums(manifest):
+    """
+    Returns:
+        dict[str, dict]: seed name -> {"checksum": ...} for every seed in the project.
+    """
+    return {
+        node.name: {"checksum": node.checksum.checksum}
+        for node in manifest.nodes.values() if node.resource_type == "seed"
+    }
+
+
+def definition_fingerprint(manifest, project_dir):
+    """
+    Hash of everything that defines the models and their docs.
+
+    Covers every node's file checksum, config and documentation, the sources,
+    all macros and dbt_project.yml (vars). Seed *contents* are tracked separately
+    by `seed_checksums`, so a changed cities.csv does not count as a definition change.
+    """
+    digest = hashlib.sha256()
+
+    def add(*parts):
+        digest.update(json.dumps(parts, sort_keys=True, default=str).encode())
+
+    for unique_id in sorted(manifest.nodes):
+        node = manifest.nodes[unique_id]
+        checksum = None if node.resource_type == "seed" else node.checksum.checksum
+        add(unique_id, checksum, node.config.to_dict(), node.description,
+            {name: column.description for name, column in node.columns.items()})
+    for unique_id in sorted(manifest.sources):
+        source = manifest.sources[unique_id]
+        add(unique_id, source.description,
+            {name: column.description for name, column in source.columns.items()})
+    for unique_id in sorted(manifest.macros):
+        add(unique_id, manifest.macros[unique_id].macro_sql)
+    with open(os.path.join(project_dir, "dbt_project.yml"), "rb") as f:
+        digest.update(f.read())
+    return digest.hexdigest()
+
+
+def raw_watermark(conn):
+    """Newest raw row the models can read (max raw.weather_observations.weather_data_id)."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT COALESCE(MAX(weather_data_id), 0) FROM raw.weather_observations;")
+        watermark = cur.fetchone()[0]
+    conn.commit()
+    return watermark
+
+
+def plan_transform(state, seeds, fingerprint, watermark, full_refresh=False, docs_exist=True):
+    """
+    Decides which dbt steps this run needs.
+
+    Args:
+        state (dict): What the last successful steps recorded (see `run_transform`).
+        seeds (dict): Current `seed_checksums`.
+        fingerprint (str): Current `definition_fingerprint`.
+        watermark (int): Current `raw_watermark`.
+        full_refresh (bool): Rebuild everything from scratch.
+        docs_exist (bool): Whether target/catalog.json exists.
+
+    Returns:
+        dict: "seed" (seed names to load), "select" (None for every model,
+            otherwise node selectors; empty means skip run and test),
+            "test_since_id" (raw id the tests are scoped to, None for full tests)
+            and "docs" (bool).
+    """
+    previous_seeds = state.get("seeds", {})
+    changed_seeds = sorted(
+        name for name, checksum in seeds.items()
+        if full_refresh or previous_seeds.get(name) != checksum
+    )
+
+    if full_refresh or state.get("run_fingerprint") != fingerprint:
+        select = None
+    else:
+        select = [f"{name}+" for name in changed_seeds]
+        if watermark > state.get("raw_watermark", -1):
+            select.insert(0, RAW_SELECTOR)
+
+    # Only rows past the previous watermark are new; re-seeding or a definition
+    # change can affect old rows too, so those runs test the full tables
+    test_since_id = None
+    if select is not None and not changed_seeds:
+        test_since_id = state.get("raw_watermark")
+
+    docs = full_refresh or not docs_exist or state.get("docs_fingerprint") != fingerprint
+    return {"seed": changed_seeds, "select": select, "test_since_id": test_since_id, "docs": docs}
+
+
+@contextmanager
+def dbt_lock(conn):
+    """
+    Holds an advisory lock on `conn` for the block, so two `dbt run`s never write
+    the same incremental models at once (their delete+insert and temporary
+    relations would collide): the hourly transform and `replay db` chunks.
+
+    The lock is transaction-level; `conn` must not be used for anything else meanwhile.
+    """
+    with conn.cursor() as cur:
+        # Waiting for a long dbt run is expected here
+        cur.execute("SET LOCAL statement_timeout = 0;")
+        cur.execute("SELECT pg_advisory_xact_lock(%s);", (DBT_LOCK_KEY,))
+    try:
+        yield
+    finally:
+        conn.rollback()
+
+
+class DbtSession:
+    """
+    Runs dbt commands in this process on one parsed manifest.
+
+    Args:
+        project_dir (str): dbt project (profiles.yml lives there too).
+        target_path (str): Artifact directory, relative to the project.
+    """
+
+    def __init__(self, project_dir=DEFAULT_PROJECT_DIR, target_path="target"):
+        self.project_dir = project_dir
+        self.target_path = target_path
+        self.manifest = None
+        self._runner = None
+
+    def parse(self):
+        """Parses the project once (partial parsing still applies) and keeps the manifest."""
+        from dbt.cli.main import dbtRunner
+
+        self.manifest = self._invoke(dbtRunner(), "parse").result
+        self._runner = dbtRunner(manifest=self.manifest)
+        return self.manifest
+
+    def invoke(self, command, *args):
+        """
+        Runs `dbt <command> <args>` on the parsed manifest and records its per-node timings.
+
+        Raises:
+            RuntimeError: If the command failed (an error, a failing model or test).
+        """
+        try:
+            return self._invoke(self._runner, command, *args)
+        finally:
+            record_dbt_run_results("_".join(command.split()),
+                                   os.path.join(self.project_dir, self.target_path, "run_results.json"))
+
+    def _invoke(self, runner, command, *args):
+        cli_args = [*command.split(), *args, "--project-dir", self.project_dir, "--profiles-dir", self.project_dir,
+                    "--target-path", self.target_path]
+        logging.info(f"dbt {' '.join(cli_args)}")
+        result = runner.invoke(cli_args)
+        if not result.success:
+            raise RuntimeError(f"dbt {command} failed: {result.exception or 'see the node results above'}")
+        return result
+
+
+def run_transform(full_refresh=False, project_dir=None, state_path=None):
+    """
+    Seeds, runs, tests and documents what changed since the last successful run.
+
+    Args:
+        full_refresh (bool): Reload every seed, rebuild every model and regenerate the docs.
+        project_dir (str, optional): dbt project; defaults to WEATHER_DBT_PROJECT_DIR or /opt/dbt.
+        state_path (str, optional): State file; defaults to WEATHER_DBT_STATE.
+
+    Returns:
+        dict: The executed plan.
+    """
+    project_dir = project_dir or os.getenv("WEATHER_DBT_PROJECT_DIR", DEFAULT_PROJECT_DIR)
+    state_path = state_path or os.getenv("WEATHER_DBT_STATE", DEFAULT_STATE_PATH)
+    state = load_state(state_path)
+
+    # Read before dbt runs: rows landing meanwhile are past the saved mark and picked up next time
+    with connection() as conn:
+        watermark = raw_watermark(conn)
+    session = DbtSession(project_dir)
+    manifest = session.parse()
+    seeds = seed_checksums(manifest)
+    fingerprint = definition_fingerprint(manifest, project_dir)
+    plan = plan_transform(state, seeds, fingerprint, watermark, full_refresh,
+                          docs_exist=os.path.exists(os.path.join(project_dir, "target", "catalog.json")))
+    logging.info(f"dbt plan: {plan}")
+
+    refresh = ["--full-refresh"] if full_refresh else []
+    if plan["seed"]:
+        session.invoke("seed", "--select", *plan["seed"], *refresh)
+        state["seeds"] = {**state.get("seeds", {}), **{name: seeds[name] for name in plan["seed"]}}
+        save_state(state_path, state)
+    else:
+        logging.info("Seeds unchanged; skipping dbt seed.")
+
+    if plan["select"] is None or plan["select"]:
+        select = [] if plan["select"] is None else ["--select", *plan["select"]]
+        with connection() as conn, dbt_lock(conn):
+            session.invoke("run", *select, *refresh)
+        if plan["test_since_id"] is None:
+            session.invoke("test", *select)
+        else:
+            session.invoke("test", *select, "--vars", json.dumps({"test_since_id": plan["test_since_id"]}))
+        state.update(run_fingerprint=fingerprint, raw_watermark=watermark,
+                     transformed_at=datetime.utcnow().isoformat())
+        save_state(state_path, state)
+    else:
+        logging.info(f"No new raw rows past id {watermark} and no definition changes; skipping dbt run and test.")
+
+    if plan["docs"]:
+        session.invoke("docs generate")
+        state["docs_fingerprint"] = fingerprint
+        save_state(state_path, state)
+    else:
+        logging.info("Model definitions unchanged; skipping dbt docs generate.")
+    return plan
+
+
+def run_test_sweep(project_dir=None):
+    """
+    Runs every data test over the full history (the hourly run only tests new rows).
+
+    Args:
+        project_dir (str, optional): dbt project; defaults to WEATHER_DBT_PROJECT_DIR or /opt/dbt.
+    """
+    project_dir = project_dir or os.getenv("WEATHER_DBT_PROJECT_DIR", DEFAULT_PROJECT_DIR)
+    session = DbtSession(project_dir, target_path=SWEEP_TARGET_PATH)
+    session.parse()
+    session.invoke("test", "--vars", json.dumps({"rollup_check_hours": SWEEP_ROLLUP_CHECK_HOURS}))
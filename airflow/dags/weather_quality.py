@@ -0,0 +1,53 @@
+from airflow import DAG
+from airflow.operators.python import PythonOperator
+from datetime import datetime, timedelta
+
+# Imports and .env loading happen in the task, not at parse time (see weather_etl.py)
+
+def run_full_test_sweep(**kwargs):
+    """
+    Runs every dbt data test over the full history.
+
+    The hourly pipeline only tests the rows added since its previous run
+    (watermark-scoped, see dbt/macros/test_scope.sql). This sweep catches what
+    a scoped test cannot see, e.g. a duplicate of an old row or a row committed
+    with an id below the watermark, and compares all rollups with the facts.
+
+    Args:
+        **kwargs: Airflow context arguments.
+    """
+    from dotenv import load_dotenv
+
+    from weather_pipeline.metrics import export_metrics, track_stage
+    from weather_pipeline.transform import run_test_sweep
+
+    load_dotenv()
+    try:
+        with track_stage("test_sweep"):
+            run_test_sweep()
+    finally:
+        export_metrics(kwargs["ti"].task_id, kwargs["ti"].map_index)
+
+default_args = {
+    'owner': 'airflow',
+    'retries': 1,
+    'retry_delay': timedelta(minutes=15),
+    'email_on_failure': False,
+}
+
+with DAG(
+    dag_id="weather_quality_sweep",
+    default_args=default_args,
+    description="Runs all dbt data tests over the full history of the weather marts",
+    schedule_interval="@daily",
+    start_date=datetime(2024, 1, 1),
+    catchup=False,
+    max_active_runs=1,
+    tags=['weather', 'quality'],
+) as dag:
+
+    # Daily: the hourly runs already gate each batch of new rows
+    full_test_sweep_task = PythonOperator(
+        task_id='run_full_test_sweep',
+        python_callable=run_full_test_sweep
+    )
@@ -0,0 +1,199 @@
+"""
+Insert/query benchmark for the raw.weather_data index set.
+
+Loads the same synthetic, time-ordered data into a scratch table once per
+index variant, and reports insert throughput, query latency and index size
+for each, so the write/read trade-off of an index change is visible:
+
+- legacy:  btree (city_name, ingestion_timestamp) + default GIN on api_response
+- current: BRIN on api_call_timestamp and ingestion_timestamp (sql/init_db.sql)
+
+Both variants also carry the UNIQUE (city_name, api_call_timestamp) btree.
+Rows are loaded the way the DAG loads them (COPY into a temp table, then
+INSERT ... SELECT ... ON CONFLICT DO NOTHING). The data is seeded, so runs are
+reproducible. Everything happens in the `bench_idx` schema, which is dropped
+at the end.
+
+Usage (needs the POSTGRES_* environment variables):
+    python benchmarks/bench_raw_indexes.py --cities 500 --hours 240 --output bench_indexes.json
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "airflow", "dags"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import city_names, make_record
+from weather_pipeline.db import connect
+from weather_pipeline.load import iter_batches, records_to_csv
+
+SCHEMA = "bench_idx"
+TABLE = f"{SCHEMA}.weather_data"
+
+VARIANTS = {
+    "legacy": [
+        f"CREATE INDEX ON {TABLE} (city_name, ingestion_timestamp)",
+        f"CREATE INDEX ON {TABLE} USING gin (api_response)",
+    ],
+    "current": [
+        f"CREATE INDEX ON {TABLE} USING brin (api_call_timestamp)",
+        f"CREATE INDEX ON {TABLE} USING brin (ingestion_timestamp)",
+    ],
+}
+
+# The access paths the pipeline actually uses
+QUERIES = {
+    # test_pipeline.check_data_freshness
+    "freshness_max_api_call": f"SELECT max(api_call_timestamp) FROM {TABLE}",
+    # dashboard: one city's last day
+    "city_last_24h": f"SELECT count(*), avg((api_response->'current'->>'temperature')::float) "
+                     f"FROM {TABLE} WHERE city_name = %(city)s AND api_call_timestamp >= %(since_24h)s",
+    # incremental dbt models: high-water mark on ingestion_timestamp
+    "incremental_window": f"SELECT count(*) FROM {TABLE} WHERE ingestion_timestamp > %(since_3h)s",
+    # time-bounded scan across all cities
+    "all_cities_last_hour": f"SELECT count(*) FROM {TABLE} WHERE api_call_timestamp >= %(since_1h)s",
+}
+
+
+def generate_records(cities, hours, start, seed):
+    """Hour by hour, every city: the order in which the hourly DAG ingests rows."""
+    rng = random.Random(seed)
+    for hour in range(hours):
+        observed_at = start + timedelta(hours=hour)
+        for city in cities:
+            yield make_record(city, observed_at, observed_at + timedelta(minutes=2), rng)
+
+
+def run_variant(conn, name, cities, hours, start, batch_size, repeat, seed):
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+        cur.execute(f"CREATE SCHEMA {SCHEMA};")
+        cur.execute(f"""
+            CREATE TABLE {TABLE} (
+                id BIGSERIAL PRIMARY KEY,
+                city_name VARCHAR(100) NOT NULL,
+                api_response JSONB NOT NULL,
+                ingestion_timestamp TIMESTAMP NOT NULL,
+                api_call_timestamp TIMESTAMP NOT NULL,
+                UNIQUE (city_name, api_call_timestamp)
+            );
+        """)
+        for statement in VARIANTS[name]:
+            cur.execute(statement)
+        cur.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS bench_stage (
+                city_name TEXT, api_response JSONB,
+                api_call_timestamp TIMESTAMP, ingestion_timestamp TIMESTAMP
+            );
+        """)
+    conn.commit()
+
+    rows = 0
+    load_seconds = 0.0
+    for batch in iter_batches(generate_records(cities, hours, start, seed), batch_size):
+        # Serialisation is the same for both variants, so it is kept out of the timing
+        buffer = records_to_csv(batch)
+        started = time.perf_counter()
+        with conn.cursor() as cur:
+            cur.copy_expert(
+                "COPY bench_stage (city_name, api_response, api_call_timestamp, ingestion_timestamp) "
+                "FROM STDIN WITH (FORMAT csv)", buffer
+            )
+            cur.execute(f"""
+                INSERT INTO {TABLE} (city_name, api_response, api_call_timestamp, ingestion_timestamp)
+                SELECT city_name, api_response, api_call_timestamp, ingestion_timestamp FROM bench_stage
+                ON CONFLICT (city_name, api_call_timestamp) DO NOTHING;
+            """)
+            rows += cur.rowcount
+            cur.execute("TRUNCATE bench_stage;")
+        conn.commit()
+        load_seconds += time.perf_counter() - started
+
+    # VACUUM cannot run inside a transaction block
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute(f"VACUUM ANALYZE {TABLE};")
+    conn.autocommit = False
+
+    end = start + timedelta(hours=hours)
+    params = {
+        "city": cities[len(cities) // 2],
+        "since_24h": end - timedelta(hours=24),
+        "since_3h": end - timedelta(hours=3),
+        "since_1h": end - timedelta(hours=1),
+    }
+    queries = {}
+    with conn.cursor() as cur:
+        for query_name, sql in QUERIES.items():
+            cur.execute(sql, params)  # warm-up
+            cur.fetchall()
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                cur.execute(sql, params)
+                cur.fetchall()
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            queries[query_name] = {
+                "median_ms": round(statistics.median(timings), 3),
+                "p95_ms": round(timings[max(0, int(len(timings) * 0.95) - 1)], 3),
+            }
+
+        cur.execute(f"SELECT pg_table_size('{TABLE}'), pg_indexes_size('{TABLE}');")
+        table_bytes, index_bytes = cur.fetchone()
+    conn.commit()
+
+    return {
+        "indexes": VARIANTS[name],
+        "rows_inserted": rows,
+        "load_seconds": round(load_seconds, 3),
+        "insert_rows_per_sec": round(rows / load_seconds, 1) if load_seconds else None,
+        "table_bytes": table_bytes,
+        "index_bytes": index_bytes,
+        "queries": queries,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark raw.weather_data index variants.")
+    parser.add_argument("--cities", type=int, default=500)
+    parser.add_argument("--hours", type=int, default=240, help="Hourly readings per city.")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=20, help="Executions per query.")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--variants", nargs="+", default=list(VARIANTS), choices=list(VARIANTS))
+    parser.add_argument("--output", help="Also write the JSON report to this file.")
+    args = parser.parse_args()
+
+    cities = city_names(args.cities)
+    start = datetime(2024, 1, 1)
+    conn = connect()
+    try:
+        report = {
+            "parameters": vars(args),
+            "variants": {
+                name: run_variant(conn, name, cities, args.hours, start, args.batch_size, args.repeat, args.seed)
+                for name in args.variants
+            },
+        }
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+        conn.commit()
+    finally:
+        conn.close()
+
+    output = json.dumps(report, indent=2, default=str)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Local mock of the WeatherStack `current` endpoint for offline benchmarks.
+
+Serves synthetic but realistically shaped payloads (see synthetic.py) for a
+universe of `--cities` city names, with configurable latency and error rates.
+Unknown cities get WeatherStack's `615 request_failed` error body, like the
+real API. Observations advance every `--observation-interval` minutes, so
+polling more often returns the same observation (as the real API does).
+
+Point the pipeline at it with WEATHERSTACK_BASE_URL=http://127.0.0.1:<port>.
+
+Usage:
+    python benchmarks/mock_weatherstack.py --port 8765 --cities 1000 --latency-ms 50
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from synthetic import city_names, make_response
+
+
+class MockWeatherStackServer(ThreadingHTTPServer):
+    """
+    Args:
+        address (tuple): (host, port); port 0 picks a free port.
+        cities (int): Size of the city universe (`city_names(cities)`).
+        latency_ms (float): Mean added latency per request.
+        jitter_ms (float): Uniform +/- jitter around the latency.
+        error_rate (float): Fraction of requests answered with an API error body (HTTP 200).
+        http_error_rate (float): Fraction of requests answered with HTTP 503.
+        observation_interval (int): Minutes between new observations of a city.
+        seed (int): Seed for the error and payload generators.
+    """
+
+    daemon_threads = True
+    # Thousands of keep-alive clients connect at once during large runs
+    request_queue_size = 1024
+
+    def __init__(self, address, cities=1000, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0,
+                 http_error_rate=0.0, observation_interval=15, seed=42):
+        super().__init__(address, MockWeatherStackHandler)
+        self.cities = set(city_names(cities))
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.http_error_rate = http_error_rate
+        self.observation_interval = observation_interval
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.request_count = 0
+
+    def observation_time(self):
+        now = datetime.utcnow()
+        minute = now.minute - now.minute % self.observation_interval
+        return now.replace(minute=minute, second=0, microsecond=0)
+
+
+class MockWeatherStackHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so the client's keep-alive connections are actually reused
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        # Per-request logging would dominate the benchmark's own output
+        pass
+
+    def _send_json(self, status, body):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _error_body(self, code, error_type, info):
+        return {"success": False, "error": {"code": code, "type": error_type, "info": info}}
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+
+        with server.rng_lock:
+            server.request_count += 1
+            latency = max(0.0, server.latency_ms + server.rng.uniform(-server.jitter_ms, server.jitter_ms))
+            roll = server.rng.random()
+            payload_seed = server.rng.random()
+        time.sleep(latency / 1000)
+
+        if url.path.rstrip("/") != "/current":
+            self._send_json(404, self._error_body(103, "invalid_api_function", "Unknown endpoint."))
+            return
+        if not params.get("access_key"):
+            self._send_json(200, self._error_body(101, "missing_access_key", "No access key supplied."))
+            return
+        if roll < server.http_error_rate:
+            self._send_json(503, {"message": "Service temporarily unavailable"})
+            return
+        if roll < server.http_error_rate + server.error_rate:
+            self._send_json(200, self._error_body(615, "request_failed", "Simulated API failure."))
+            return
+
+        query = (params.get("query") or [""])[0]
+        if not query:
+            self._send_json(200, self._error_body(601, "missing_query", "Please specify a valid location."))
+            return
+
+        rng = random.Random(payload_seed)
+        observed_at = server.observation_time()
+        responses = []
+        # Semicolon-separated queries are WeatherStack's bulk format; they get a JSON array
+        for city in query.split(";"):
+            if city in server.cities:
+                responses.append(make_response(city, observed_at, rng))
+            else:
+                responses.append(self._error_body(615, "request_failed", f"Unknown location {city}."))
+
+        self._send_json(200, responses if ";" in query else responses[0])
+
+
+def start_in_thread(**kwargs):
+    """
+    Starts a mock server on a free port in a background thread.
+
+    Returns:
+        MockWeatherStackServer: Call `shutdown()` when done; `server_address` has the port.
+    """
+    server = MockWeatherStackServer(("127.0.0.1", 0), **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a mock WeatherStack API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--cities", type=int, default=1000)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--http-error-rate", type=float, default=0.0)
+    parser.add_argument("--observation-interval", type=int, default=15)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    server = MockWeatherStackServer(
+        (args.host, args.port), cities=args.cities, latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms, error_rate=args.error_rate, http_error_rate=args.http_error_rate,
+        observation_interval=args.observation_interval, seed=args.seed,
+    )
+    print(f"Mock WeatherStack listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""
+Offline end-to-end throughput benchmark: extract -> load -> dbt.
+
+For every city count in --sizes this:
+1. starts the mock WeatherStack server (mock_weatherstack.py) in its own process,
+2. runs the real extract code against it, streaming into a staging file,
+3. bulk loads the staged file into a scratch database (--database, created if missing),
+4. runs `dbt seed` + `dbt run --full-refresh` on a temporary copy of the dbt
+   project whose cities seed matches the synthetic city universe,
+and reports per-stage wall time, rows/sec, peak RSS and database size growth
+as JSON. No network access is needed besides the local Postgres.
+
+Peak RSS of extract/load is this process's high-water mark at the end of the
+stage; for dbt it is the largest dbt child process.
+
+Usage (needs the POSTGRES_* environment variables and dbt on the PATH):
+    python benchmarks/run_benchmark.py --sizes 10 1000 10000 100000 --output bench_output.json
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, "airflow", "dags"))
+sys.path.insert(0, BENCH_DIR)
+
+from mock_weatherstack import MockWeatherStackServer
+from synthetic import city_names, city_profile
+from weather_pipeline.db import connect
+from weather_pipeline.extract import iter_city_weather
+from weather_pipeline.load import bulk_load_records
+from weather_pipeline.schema import ensure_raw_schema
+from weather_pipeline.staging import StagingWriter, iter_staged_records
+
+DEFAULT_SIZES = [10, 1000, 10000, 100000]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def serve_mock(port, options):
+    server = MockWeatherStackServer(("127.0.0.1", port), **options)
+    server.serve_forever()
+
+
+def wait_for_port(port, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Mock server did not start on port {port}.")
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    # ru_maxrss is in kilobytes on Linux
+    return round(resource.getrusage(who).ru_maxrss / 1024, 1)
+
+
+def database_size(database):
+    conn = connect(database=database)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_database_size(current_database());")
+            return cur.fetchone()[0]
+    finally:
+        conn.close()
+
+
+def ensure_database(database):
+    conn = connect(database="postgres")
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1 FROM pg_database WHERE datname = %s;", (database,))
+            if not cur.fetchone():
+                cur.execute(f'CREATE DATABASE "{database}";')
+    finally:
+        conn.close()
+
+
+def reset_database(database):
+    """Drops everything the pipeline created, then re-applies sql/init_db.sql."""
+    conn = connect(database=database)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("DROP SCHEMA IF EXISTS raw, staging, analytics CASCADE;")
+            ensure_raw_schema(cur)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def prepare_dbt_project(workdir, cities, database):
+    """Copies the dbt project and points its seed and profile at the benchmark."""
+    project_dir = os.path.join(workdir, "dbt")
+    shutil.copytree(
+        os.path.join(REPO_DIR, "dbt"), project_dir,
+        ignore=shutil.ignore_patterns("target", "logs", "dbt_packages")
+    )
+
+    with open(os.path.join(project_dir, "seeds", "cities.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["city_id", "city_name", "country", "latitude", "longitude"])
+        for city_id, city in enumerate(cities, start=1):
+            profile = city_profile(city)
+            writer.writerow([city_id, city, "Synthetica", profile["lat"], profile["lon"]])
+
+    with open(os.path.join(project_dir, "profiles.yml"), "w") as f:
+        f.write(f"""
+weather_pipeline:
+  target: bench
+  outputs:
+    bench:
+      type: postgres
+      host: "{os.getenv('POSTGRES_HOST', 'localhost')}"
+      port: {int(os.getenv('POSTGRES_PORT', '5432'))}
+      user: "{{{{ env_var('POSTGRES_USER') }}}}"
+      password: "{{{{ env_var('POSTGRES_PASSWORD') }}}}"
+      dbname: "{database}"
+      schema: staging
+      threads: 4
+""")
+    return project_dir
+
+
+def timed_stage(database, rows_fn):
+    """Runs `rows_fn`, returning its row count together with time and size metrics."""
+    size_before = database_size(database)
+    started = time.perf_counter()
+    rows = rows_fn()
+    seconds = time.perf_counter() - started
+    return {
+        "wall_seconds": round(seconds, 3),
+        "rows": rows,
+        "rows_per_sec": round(rows / seconds, 1) if seconds and rows else None,
+        "db_size_growth_bytes": database_size(database) - size_before,
+    }
+
+
+def run_size(size, args, workdir):
+    cities = city_names(size)
+    port = free_port()
+    mock = multiprocessing.Process(
+        target=serve_mock,
+        args=(port, {
+            "cities": size,
+            "latency_ms": args.latency_ms,
+            "jitter_ms": args.jitter_ms,
+            "error_rate": args.error_rate,
+            "http_error_rate": args.http_error_rate,
+            "seed": args.seed,
+        }),
+        daemon=True,
+    )
+    mock.start()
+    wait_for_port(port)
+    os.environ["WEATHERSTACK_BASE_URL"] = f"http://127.0.0.1:{port}"
+
+    result = {"cities": size, "stages": {}}
+    try:
+        reset_database(args.database)
+        staging_dir = os.path.join(workdir, f"staging_{size}")
+        manifest = {}
+
+        def extract():
+            with StagingWriter(directory=staging_dir, prefix="bench") as writer:
+                for data in iter_city_weather(cities, "benchmark-key", concurrency=args.concurrency,
+                                              rate_limit_rps=args.rate_limit_rps, bulk_size=args.bulk_size):
+                    writer.write(data)
+                manifest.update(writer.close())
+            return manifest["row_count"]
+
+        result["stages"]["extract"] = timed_stage(args.database, extract)
+        result["stages"]["extract"]["peak_rss_mb"] = peak_rss_mb()
+        result["stages"]["extract"]["staged_file_bytes"] = os.path.getsize(manifest["path"])
+
+        def load():
+            conn = connect(database=args.database)
+            try:
+                inserted, _ = bulk_load_records(conn, iter_staged_records(manifest))
+                conn.commit()
+                return inserted
+            finally:
+                conn.close()
+
+        result["stages"]["load"] = timed_stage(args.database, load)
+        result["stages"]["load"]["peak_rss_mb"] = peak_rss_mb()
+
+        if not args.skip_dbt:
+            project_dir = prepare_dbt_project(os.path.join(workdir, f"dbt_{size}"), cities, args.database)
+            for command in (["seed", "--full-refresh"], ["run", "--full-refresh"]):
+                stage = f"dbt_{command[0]}"
+
+                def dbt():
+                    subprocess.run(
+                        ["dbt", *command, "--project-dir", project_dir, "--profiles-dir", project_dir],
+                        check=True, stdout=subprocess.DEVNULL
+                    )
+                    return size
+
+                result["stages"][stage] = timed_stage(args.database, dbt)
+                result["stages"][stage]["peak_rss_mb"] = peak_rss_mb(resource.RUSAGE_CHILDREN)
+    finally:
+        mock.terminate()
+        mock.join()
+
+    result["total_wall_seconds"] = round(sum(s["wall_seconds"] for s in result["stages"].values()), 3)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline extract -> load -> dbt throughput benchmark.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="City counts to run.")
+    parser.add_argument("--database", default="weather_bench", help="Scratch database (wiped per size).")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--bulk-size", type=int, default=1, help="Cities per bulk request (1 = per-city).")
+    parser.add_argument("--rate-limit-rps", type=float, default=0, help="0 disables the client-side limiter.")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Mock server latency per request.")
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of API error bodies.")
+    parser.add_argument("--http-error-rate", type=float, default=0.0, help="Fraction of HTTP 503 responses.")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skip-dbt", action="store_true")
+    parser.add_argument("--output", help="Also write the JSON report to this file.")
+    args = parser.parse_args()
+
+    if args.database == os.getenv("POSTGRES_DB", "weather_db"):
+        parser.error("--database must be a scratch database; it is wiped for every size.")
+
+    os.environ.setdefault("WEATHER_SCHEMA_FILE", os.path.join(REPO_DIR, "sql", "init_db.sql"))
+    ensure_database(args.database)
+
+    report = {
+        "started_at": datetime.utcnow().isoformat(),
+        "parameters": vars(args),
+        "runs": [],
+    }
+    with tempfile.TemporaryDirectory(prefix="weather_bench_") as workdir:
+        for size in args.sizes:
+            print(f"Running benchmark for {size} cities...", file=sys.stderr)
+            report["runs"].append(run_size(size, args, workdir))
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Deterministic synthetic WeatherStack payloads for benchmarks.
+
+The documents mirror the shape of real `current` responses (request, location
+and current blocks), so JSON size and parsing cost are realistic.
+"""
+import calendar
+import random
+from datetime import timedelta
+
+CONDITIONS = [
+    (113, "Sunny"), (116, "Partly cloudy"), (119, "Cloudy"), (122, "Overcast"),
+    (143, "Mist"), (176, "Patchy rain possible"), (296, "Light rain"), (302, "Moderate rain"),
+]
+WIND_DIRECTIONS = ["N", "NNE", "NE", "ENE", "E", "ESE", "SE", "SSE",
+                   "S", "SSW", "SW", "WSW", "W", "WNW", "NW", "NNW"]
+SEED_CITIES = ["London", "New York", "Tokyo", "Mumbai", "Sydney"]
+
+
+def city_names(count):
+    """The seed cities first, then `City 00001`, `City 00002`, ..."""
+    names = SEED_CITIES[:count]
+    names += [f"City {i:05d}" for i in range(1, count - len(names) + 1)]
+    return names
+
+
+def city_profile(city):
+    """Stable per-city attributes (coordinates, UTC offset, base temperature)."""
+    rng = random.Random(city)
+    return {
+        "lat": round(rng.uniform(-60, 70), 3),
+        "lon": round(rng.uniform(-180, 180), 3),
+        "utc_offset": float(rng.randint(-10, 12)),
+        "base_temperature": rng.uniform(-5, 30),
+    }
+
+
+def make_response(city, observed_at, rng):
+    """
+    Builds one WeatherStack `current` response.
+
+    Args:
+        city (str): City name.
+        observed_at (datetime): Naive UTC observation time.
+        rng (random.Random): Source of randomness (seed it for reproducible runs).
+
+    Returns:
+        dict: Response without `_metadata`.
+    """
+    profile = city_profile(city)
+    local_time = observed_at + timedelta(hours=profile["utc_offset"])
+    code, description = rng.choice(CONDITIONS)
+    temperature = round(profile["base_temperature"] + rng.uniform(-6, 6))
+
+    return {
+        "request": {"type": "City", "query": city, "language": "en", "unit": "m"},
+        "location": {
+            "name": city,
+            "country": "Synthetica",
+            "region": f"Region {sum(map(ord, city)) % 50}",
+            "lat": str(profile["lat"]),
+            "lon": str(profile["lon"]),
+            "timezone_id": "Etc/Synthetic",
+            "localtime": local_time.strftime("%Y-%m-%d %H:%M"),
+            # WeatherStack encodes the location's local wall-clock time as an epoch
+            "localtime_epoch": calendar.timegm(local_time.timetuple()),
+            "utc_offset": str(profile["utc_offset"]),
+        },
+        "current": {
+            "observation_time": observed_at.strftime("%I:%M %p"),
+            "temperature": temperature,
+            "weather_code": code,
+            "weather_icons": [f"https://assets.weatherstack.com/images/wsymbols01_png_64/wsymbol_{code:04d}.png"],
+            "weather_descriptions": [description],
+            "wind_speed": rng.randint(0, 40),
+            "wind_degree": rng.randint(0, 359),
+            "wind_dir": rng.choice(WIND_DIRECTIONS),
+            "pressure": rng.randint(990, 1035),
+            "precip": round(rng.uniform(0, 3), 1) if code >= 176 else 0,
+            "humidity": rng.randint(20, 100),
+            "cloudcover": rng.randint(0, 100),
+            "feelslike": temperature + rng.randint(-3, 2),
+            "uv_index": rng.randint(0, 10),
+            "visibility": rng.randint(2, 10),
+            "is_day": "yes" if 6 <= local_time.hour < 18 else "no",
+        },
+    }
+
+
+def make_record(city, observed_at, ingested_at, rng):
+    """A response with the same `_metadata` block the extract task adds."""
+    data = make_response(city, observed_at, rng)
+    data["_metadata"] = {
+        "city_name": city,
+        "api_call_timestamp": observed_at.isoformat(),
+        "request_timestamp": ingested_at.isoformat(),
+        "ingestion_timestamp": ingested_at.isoformat(),
+        "status_code": 200,
+    }
+    return data
@@ -0,0 +1,52 @@
+
+{#
+    Incremental batch filter shared by the staging and mart models.
+
+    On incremental runs only rows past the model's high-water mark are selected:
+    - id_column (optional): rows with a larger id than the newest one already loaded
+      (this_id_column names the same id in the model itself, if it was renamed)
+    - timestamp_column: rows ingested within `incremental_lookback_hours` of the newest
+      ingestion_timestamp already loaded. The lookback re-reads recent rows so data
+      committed late (e.g. by a slower parallel shard) is still picked up.
+
+    Re-read rows are replaced rather than duplicated because every incremental
+    model declares a unique_key. A full rebuild is `dbt run --full-refresh`.
+
+    With the `replay_window` var set (see replay_window_condition below), the rows
+    of that window are selected as well, so a replay can rebuild just the range it
+    re-derived; replay_time_column names the observation time in the model's input.
+#}
+{% macro incremental_watermark_filter(timestamp_column='ingestion_timestamp', id_column=none, this_id_column=none,
+                                      replay_time_column=none) %}
+    {% if is_incremental() %}
+    where (
+        {% if replay_time_column and var('replay_window', none) %}
+        {{ replay_window_condition(replay_time_column, id_column) }}
+        or
+        {% endif %}
+        {% if id_column %}
+        {{ id_column }} > (select coalesce(max({{ this_id_column or id_column }}), 0) from {{ this }})
+        or
+        {% endif %}
+        {{ timestamp_column }} > (
+            select coalesce(max({{ timestamp_column }}), '-infinity'::timestamp)
+            from {{ this }}
+        ) - interval '{{ var("incremental_lookback_hours") }} hours'
+    )
+    {% endif %}
+{% endmacro %}
+
+{#
+    Condition selecting the rows of the `replay_window` var, set by
+    `python -m weather_pipeline.replay db` for each chunk it re-derived:
+    {"by": "time", "start": "<timestamp>", "end": "<timestamp>"} on the observation
+    time, or {"by": "id", "start": <id>, "end": <id>} on the raw id; both half-open.
+#}
+{% macro replay_window_condition(time_column, id_column) %}
+    {%- set window = var('replay_window') -%}
+    {%- if window.by == 'id' -%}
+    ({{ id_column }} >= {{ window.start | int }} and {{ id_column }} < {{ window.end | int }})
+    {%- else -%}
+    ({{ time_column }} >= '{{ window.start }}'::timestamp and {{ time_column }} < '{{ window.end }}'::timestamp)
+    {%- endif -%}
+{% endmacro %}
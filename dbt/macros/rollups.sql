@@ -0,0 +1,95 @@
+{#
+    Per-city weather rollup at the grain given by `bucket_expression` (an
+    expression over fact_weather columns), stored as `bucket_column`.
+
+    Only mergeable aggregates are stored (count, sum, sum of squares, min, max);
+    averages and standard deviations are derived from them. An incremental run
+    finds the (city, bucket) pairs touched by fact rows it may not have counted
+    yet, and re-aggregates just those buckets from fact_weather (delete+insert
+    on the model's unique_key). A fact row is treated as possibly new if
+    - its weather_id is above the highest one already rolled up, or
+    - it was ingested within `incremental_lookback_hours` of the newest
+      ingestion_timestamp already rolled up: the same window fact_weather
+      re-reads, so rows committed late with a lower raw id (a slower parallel
+      shard, the streaming service) are rolled up as soon as they reach the facts.
+    Re-aggregating whole buckets instead of adding deltas means a re-read
+    row is never counted twice and a late one is never missed. The buckets of
+    a replayed range (the `replay_window` var) are re-aggregated too.
+#}
+{% macro weather_rollup(bucket_expression, bucket_column) %}
+
+{% if is_incremental() %}
+with touched as (
+    select
+        city_id,
+        {{ bucket_expression }} as {{ bucket_column }},
+        min(time_key) as first_time_key
+    from {{ ref('fact_weather') }}
+    where weather_id > (select coalesce(max(max_weather_id), 0) from {{ this }})
+        -- NULL before max_ingestion_timestamp existed: the first run re-aggregates everything once
+        or ingestion_timestamp > (
+            select coalesce(max(max_ingestion_timestamp), '-infinity'::timestamp)
+            from {{ this }}
+        ) - interval '{{ var("incremental_lookback_hours") }} hours'
+        {% if var('replay_window', none) %}
+        or {{ replay_window_condition('api_call_timestamp', 'weather_id') }}
+        {% endif %}
+    group by city_id, {{ bucket_expression }}
+),
+
+{% else %}
+with
+{% endif %}
+buckets as (
+    select
+        city_id,
+        {{ bucket_expression }} as {{ bucket_column }},
+        count(*) as reading_count,
+        sum(temperature) as temperature_sum,
+        sum(temperature * temperature) as temperature_sum_sq,
+        min(temperature) as temperature_min,
+        max(temperature) as temperature_max,
+        sum(humidity) as humidity_sum,
+        min(humidity) as humidity_min,
+        max(humidity) as humidity_max,
+        coalesce(sum(precipitation), 0) as precipitation_sum,
+        max(weather_id) as max_weather_id,
+        max(ingestion_timestamp) as max_ingestion_timestamp
+    from {{ ref('fact_weather') }}
+    {% if is_incremental() %}
+    -- The time_key bound (start of the earliest touched day, which covers both
+    -- grains) lets the time_key index skip the history no touched bucket reaches.
+    -- With nothing touched it is NULL, so no fact row is read at all.
+    where time_key >= (select min(first_time_key) / 100 * 100 from touched)
+        and (city_id, {{ bucket_expression }}) in (
+            select city_id, {{ bucket_column }} from touched
+        )
+    {% endif %}
+    group by city_id, {{ bucket_expression }}
+)
+
+select
+    city_id,
+    {{ bucket_column }},
+    reading_count,
+    temperature_sum,
+    temperature_sum_sq,
+    temperature_min,
+    temperature_max,
+    humidity_sum,
+    humidity_min,
+    humidity_max,
+    precipitation_sum,
+    max_weather_id,
+    max_ingestion_timestamp,
+
+    -- Derived from the mergeable aggregates
+    temperature_sum / reading_count as avg_temperature,
+    sqrt(greatest(
+        temperature_sum_sq / reading_count - power(temperature_sum / reading_count, 2), 0
+    )) as stddev_temperature,
+    humidity_sum::float / reading_count as avg_humidity
+
+from buckets
+
+{% endmacro %}
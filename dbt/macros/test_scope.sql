@@ -0,0 +1,31 @@
+{#
+    Scopes generic tests (unique, not_null, relationships, ...) to new rows.
+
+    dbt wraps the model a generic test reads in get_where_subquery; this
+    override adds `<scope column> > test_since_id` for the models listed in
+    the `test_scope_columns` var, so the hourly run only checks the rows added
+    since the previous watermark instead of the full history. Set by the
+    dbt_transform task (weather_pipeline/transform.py); without the var every
+    test reads the whole table, as in the daily full sweep.
+
+    Relationship tests only filter the child side: new rows are still checked
+    against the complete parent table. A `where` test config keeps working and
+    is combined with the scope.
+#}
+{% macro get_where_subquery(relation) -%}
+    {%- set where = config.get('where', '') -%}
+    {%- set scope_column = var('test_scope_columns', {}).get(relation.identifier) -%}
+    {%- set since_id = var('test_since_id', none) -%}
+    {%- if scope_column and since_id is not none -%}
+        {%- set scope = scope_column ~ ' > ' ~ (since_id | int) -%}
+        {%- set where = '(' ~ where ~ ') and ' ~ scope if where else scope -%}
+    {%- endif -%}
+    {%- if where -%}
+        {%- set filtered -%}
+            (select * from {{ relation }} where {{ where }}) dbt_subquery
+        {%- endset -%}
+        {%- do return(filtered) -%}
+    {%- else -%}
+        {%- do return(relation) -%}
+    {%- endif -%}
+{%- endmacro %}
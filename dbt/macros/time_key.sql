@@ -0,0 +1,9 @@
+
+{#
+    Hour-grain integer key of a timestamp, formatted as YYYYMMDDHH (e.g. 2024031513).
+    It is readable, sorts chronologically and fits in a 4-byte integer, so fact rows
+    join and group on an int instead of a 32-character text hash.
+#}
+{% macro hour_time_key(timestamp_column) %}
+    to_char(date_trunc('hour', {{ timestamp_column }}), 'YYYYMMDDHH24')::integer
+{% endmacro %}
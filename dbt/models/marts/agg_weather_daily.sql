@@ -0,0 +1,17 @@
+
+{{
+    config(
+        materialized='incremental',
+        unique_key=['city_id', 'date_key'],
+        incremental_strategy='delete+insert',
+        on_schema_change='append_new_columns',
+        indexes=[
+            {'columns': ['city_id', 'date_key'], 'unique': True},
+            {'columns': ['date_key']}
+        ]
+    )
+}}
+
+-- Daily per-city rollup of fact_weather, re-aggregated only for the buckets new fact rows touch
+-- (see macros/rollups.sql). date_key is YYYYMMDD, i.e. time_key without the hour.
+{{ weather_rollup('time_key / 100', 'date_key') }}
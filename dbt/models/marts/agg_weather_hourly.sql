@@ -0,0 +1,17 @@
+
+{{
+    config(
+        materialized='incremental',
+        unique_key=['city_id', 'time_key'],
+        incremental_strategy='delete+insert',
+        on_schema_change='append_new_columns',
+        indexes=[
+            {'columns': ['city_id', 'time_key'], 'unique': True},
+            {'columns': ['time_key']}
+        ]
+    )
+}}
+
+-- Hourly per-city rollup of fact_weather, re-aggregated only for the buckets new fact rows touch
+-- (see macros/rollups.sql). Dashboard queries read this instead of the facts.
+{{ weather_rollup('time_key', 'time_key') }}
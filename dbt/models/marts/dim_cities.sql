@@ -1,10 +1,24 @@
 
+{{
+    config(
+        materialized='incremental',
+        unique_key='city_id',
+        incremental_strategy='delete+insert'
+    )
+}}
+
 with cities_seed as (
     select * from {{ ref('cities') }}
 ),
 
+-- Incremental: only cities seen in newly staged rows are (re)written.
 distinct_stage_cities as (
-    select distinct city_name from {{ ref('stg_weather') }}
+    select
+        city_name,
+        max(ingestion_timestamp) as ingestion_timestamp
+    from {{ ref('stg_weather') }}
+    {{ incremental_watermark_filter(timestamp_column='ingestion_timestamp') }}
+    group by city_name
 )
 
 select
@@ -12,6 +26,9 @@ select
     c.city_name,
     c.country,
     c.latitude,
-    c.longitude
+    c.longitude,
+
+    -- Watermark for incremental runs (last time the city was seen)
+    s.ingestion_timestamp
 from cities_seed c
 join distinct_stage_cities s on c.city_name = s.city_name
@@ -1,20 +1,43 @@
 
-with distinct_timestamps as (
-    select distinct api_call_timestamp as timestamp_value
-    from {{ ref('stg_weather') }}
+{{
+    config(
+        materialized='incremental',
+        unique_key='time_key',
+        incremental_strategy='delete+insert',
+        indexes=[
+            {'columns': ['time_key'], 'unique': True}
+        ]
+    )
+}}
+
+-- Calendar spine at hour grain, generated once from calendar_start to calendar_end
+-- (see dbt_project.yml) instead of being derived from the facts on every run.
+-- Incremental runs only append the hours past the current end of the table, which
+-- is nothing until calendar_end is moved further into the future.
+with hours as (
+    select generate_series(
+        {% if is_incremental() %}
+        (select max(timestamp) + interval '1 hour' from {{ this }}),
+        {% else %}
+        '{{ var("calendar_start") }}'::timestamp,
+        {% endif %}
+        '{{ var("calendar_end") }}'::timestamp,
+        interval '1 hour'
+    ) as timestamp_value
 )
 
 select
-    -- Surrogate key for time
-    md5(cast(timestamp_value as varchar)) as time_id,
+    -- Integer surrogate key for the hour: YYYYMMDDHH
+    {{ hour_time_key('timestamp_value') }} as time_key,
     timestamp_value as timestamp,
+    timestamp_value::date as date,
     
     -- Extract time attributes
-    extract(hour from timestamp_value) as hour,
-    extract(day from timestamp_value) as day,
-    extract(month from timestamp_value) as month,
-    extract(year from timestamp_value) as year,
-    extract(dow from timestamp_value) as day_of_week,
+    extract(hour from timestamp_value)::smallint as hour,
+    extract(day from timestamp_value)::smallint as day,
+    extract(month from timestamp_value)::smallint as month,
+    extract(year from timestamp_value)::smallint as year,
+    extract(dow from timestamp_value)::smallint as day_of_week,
     
     -- Boolean flags
     case 
@@ -26,4 +49,4 @@ select
     to_char(timestamp_value, 'Month') as month_name,
     to_char(timestamp_value, 'Day') as day_name
 
-from distinct_timestamps
+from hours
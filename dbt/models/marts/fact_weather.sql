@@ -1,23 +1,41 @@
+{{
+    config(
+        materialized='incremental',
+        unique_key='weather_id',
+        incremental_strategy='delete+insert',
+        indexes=[
+            {'columns': ['weather_id'], 'unique': True},
+            {'columns': ['time_key']},
+            {'columns': ['ingestion_timestamp']}
+        ]
+    )
+}}
+
+-- dim_time is a pre-generated calendar spine, so the time key is computed from
+-- the timestamp instead of looked up; this keeps dim_time built before the facts.
+-- depends_on: {{ ref('dim_time') }}
 
 with weather_data as (
     select * from {{ ref('stg_weather') }}
+    {{ incremental_watermark_filter(timestamp_column='ingestion_timestamp', id_column='id', this_id_column='weather_id',
+                                    replay_time_column='api_call_timestamp') }}
 ),
 
 cities as (
     select * from {{ ref('dim_cities') }}
-),
-
-time_dim as (
-    select * from {{ ref('dim_time') }}
 )
 
 select
-    -- Surrogate key for the fact table
-    md5(w.id || w.api_call_timestamp) as weather_id,
+    -- Surrogate key for the fact table: the raw row id (bigint), which is
+    -- already unique and much narrower than a text hash
+    w.id::bigint as weather_id,
     
-    -- Foreign Keys
+    -- Foreign Keys (integers)
     c.city_id,
-    t.time_id,
+    {{ hour_time_key('w.api_call_timestamp') }} as time_key,
+    
+    -- Exact observation time (time_key is hour grain)
+    w.api_call_timestamp,
     
     -- Measurements
     w.temperature,
@@ -39,4 +57,3 @@ select
 
 from weather_data w
 join cities c on w.city_name = c.city_name
-join time_dim t on w.api_call_timestamp = t.timestamp
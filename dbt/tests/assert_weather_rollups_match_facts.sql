@@ -0,0 +1,79 @@
+
+-- Consistency check: the incrementally maintained rollups must match the
+-- aggregates recomputed from fact_weather. Returns one row per mismatching
+-- bucket (so the test fails if anything is returned).
+-- Only the last `rollup_check_hours` are compared on normal runs; pass a large
+-- value (e.g. --vars '{rollup_check_hours: 1000000}') for a full-history check.
+
+{% set since_key %}
+    {{ hour_time_key("(now() at time zone 'utc') - interval '" ~ var('rollup_check_hours') ~ " hours'") }}
+{% endset %}
+
+with facts_hourly as (
+    select
+        city_id,
+        time_key,
+        count(*) as reading_count,
+        sum(temperature) as temperature_sum,
+        min(temperature) as temperature_min,
+        max(temperature) as temperature_max
+    from {{ ref('fact_weather') }}
+    where time_key >= {{ since_key }}
+    group by city_id, time_key
+),
+
+hourly as (
+    select * from {{ ref('agg_weather_hourly') }}
+    where time_key >= {{ since_key }}
+),
+
+hourly_mismatches as (
+    select
+        'agg_weather_hourly' as rollup,
+        coalesce(f.city_id, h.city_id) as city_id,
+        coalesce(f.time_key, h.time_key) as bucket
+    from facts_hourly f
+    full outer join hourly h
+        on h.city_id = f.city_id
+        and h.time_key = f.time_key
+    where f.city_id is null
+        or h.city_id is null
+        or f.reading_count <> h.reading_count
+        or abs(f.temperature_sum - h.temperature_sum) > 1e-6 * greatest(1, abs(f.temperature_sum))
+        or f.temperature_min <> h.temperature_min
+        or f.temperature_max <> h.temperature_max
+),
+
+-- The daily rollup must agree with the hourly one for every complete day in the window
+hourly_by_day as (
+    select
+        city_id,
+        time_key / 100 as date_key,
+        sum(reading_count) as reading_count,
+        sum(temperature_sum) as temperature_sum
+    from hourly
+    where time_key / 100 > {{ since_key }} / 100
+    group by city_id, time_key / 100
+),
+
+daily_mismatches as (
+    select
+        'agg_weather_daily' as rollup,
+        coalesce(h.city_id, d.city_id) as city_id,
+        coalesce(h.date_key, d.date_key) as bucket
+    from hourly_by_day h
+    full outer join (
+        select * from {{ ref('agg_weather_daily') }}
+        where date_key > {{ since_key }} / 100
+    ) d
+        on d.city_id = h.city_id
+        and d.date_key = h.date_key
+    where h.city_id is null
+        or d.city_id is null
+        or h.reading_count <> d.reading_count
+        or abs(h.temperature_sum - d.temperature_sum) > 1e-6 * greatest(1, abs(h.temperature_sum))
+)
+
+select * from hourly_mismatches
+union all
+select * from daily_mismatches
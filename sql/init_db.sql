@@ -23,34 +23,398 @@ CREATE SCHEMA IF NOT EXISTS analytics;
 -- 2. Resilience: If our transform logic changes, we can re-process historical data
 -- 3. Flexibility: We can extract new fields later without needing to backfill
 
+-- This file is the single authoritative definition of the raw tables: the
+-- loader runs it (see weather_pipeline/schema.py) when the tables are missing,
+-- instead of keeping its own CREATE TABLE.
+
+-- Rationale for partitioning by month on api_call_timestamp:
+-- 1. Time-bounded queries only scan the partitions of the months they touch
+-- 2. Retention is a metadata operation (DETACH/DROP a partition) instead of a huge DELETE
+-- 3. Each partition's indexes stay small
+-- Partitions are named <table>_pYYYYMM and pre-created by raw.create_monthly_partitions
+-- (run daily by the weather_partition_maintenance DAG). Rows outside every
+-- partition land in the DEFAULT partition instead of failing the load; they are
+-- moved out of it when their month's partition is created.
+
 CREATE TABLE IF NOT EXISTS raw.weather_data (
-    id SERIAL PRIMARY KEY,
+    -- BIGSERIAL rather than an identity column: PostgreSQL 15 does not support
+    -- identity columns on partitioned tables
+    id BIGSERIAL,
     
     -- Searchable metadata fields
-    city_name VARCHAR(100),
+    city_name VARCHAR(100) NOT NULL,
     
-    -- The complete API response stored as binary JSON for efficient querying
-    api_response JSONB,
+    -- The per-reading part of the API response (see "Static blocks" below);
+    -- raw.weather_data_full reconstructs the complete document
+    api_response JSONB NOT NULL,
+
+    -- raw.weather_static_blocks entries holding the response's 'request' and
+    -- static 'location' blocks. Both NULL: api_response is the complete document
+    -- (rows loaded before static blocks were split out, see migration 003).
+    request_hash UUID,
+    location_hash UUID,
     
     -- Timestamps for data lineage
-    ingestion_timestamp TIMESTAMP DEFAULT NOW(),  -- When we received the data
-    api_call_timestamp TIMESTAMP,                 -- When the API said the data was measured
+    ingestion_timestamp TIMESTAMP NOT NULL DEFAULT NOW(),  -- When we received the data
+    api_call_timestamp TIMESTAMP NOT NULL,                 -- When the API said the data was measured
     
     -- Metadata for auditing
-    source VARCHAR(50) DEFAULT 'weatherstack'
+    source VARCHAR(50) DEFAULT 'weatherstack',
+
+    -- Unique constraints on a partitioned table must include the partition key.
+    -- (city_name, api_call_timestamp) is what the loader's ON CONFLICT relies on.
+    PRIMARY KEY (id, api_call_timestamp),
+    UNIQUE (city_name, api_call_timestamp)
+) PARTITION BY RANGE (api_call_timestamp);
+
+CREATE TABLE IF NOT EXISTS raw.weather_data_default
+PARTITION OF raw.weather_data DEFAULT;
+
+-- Typed landing table: the measurements of every raw row, parsed once at load
+-- time into native numeric columns. Analytical scans (stg_weather) read these
+-- compact fixed-width columns instead of detoasting and parsing the JSONB of
+-- every row. The full document stays recoverable from raw.weather_data_full for audit.
+-- Existing rows can be backfilled with: python -m weather_pipeline.observations
+-- It is partitioned exactly like raw.weather_data so retention drops both together.
+CREATE TABLE IF NOT EXISTS raw.weather_observations (
+    weather_data_id BIGINT NOT NULL,   -- raw.weather_data.id
+    city_name TEXT NOT NULL,
+    api_call_timestamp TIMESTAMP NOT NULL,
+    ingestion_timestamp TIMESTAMP NOT NULL,
+    temperature REAL,
+    feels_like REAL,
+    humidity SMALLINT,
+    pressure SMALLINT,
+    wind_speed REAL,
+    wind_degree SMALLINT,
+    wind_direction VARCHAR(3),
+    precipitation REAL,
+    cloud_cover SMALLINT,
+    uv_index SMALLINT,
+    visibility SMALLINT,
+    weather_description TEXT,
+    country TEXT,
+    region TEXT,
+    latitude DOUBLE PRECISION,
+    longitude DOUBLE PRECISION,
+
+    PRIMARY KEY (weather_data_id, api_call_timestamp)
+) PARTITION BY RANGE (api_call_timestamp);
+
+CREATE TABLE IF NOT EXISTS raw.weather_observations_default
+PARTITION OF raw.weather_observations DEFAULT;
+
+-- ============================================================================
+-- 2a. STATIC BLOCKS
+-- ============================================================================
+
+-- Every WeatherStack response repeats a 'request' block and a 'location' block
+-- (name, country, region, lat/lon, timezone) that are identical for a city
+-- across thousands of readings, plus the '_metadata' block the extractor adds,
+-- which duplicates the row's own columns. Storing them on every row made the
+-- raw table grow several times faster than the measurements. Instead:
+-- * the 'request' block and the 'location' block minus its per-reading keys
+--   (localtime, localtime_epoch) are stored once per distinct content in
+--   raw.weather_static_blocks, keyed by an md5 hash of their text,
+-- * raw.weather_data.api_response keeps the rest: 'current', the per-reading
+--   location keys, and '_metadata' only when it cannot be rebuilt from the columns,
+-- * raw.weather_data_full reassembles the original document for audit and replays.
+-- The loader splits new rows (weather_pipeline/load.py); existing rows are
+-- converted by sql/migrations/003_split_raw_static_blocks.sql.
+
+CREATE TABLE IF NOT EXISTS raw.weather_static_blocks (
+    block_hash UUID PRIMARY KEY,        -- raw.static_block_hash(block)
+    block_type VARCHAR(20) NOT NULL,    -- 'request' or 'location'
+    block JSONB NOT NULL,
+    first_seen TIMESTAMP NOT NULL DEFAULT NOW()
 );
 
+-- Databases created before static blocks were split out
+ALTER TABLE raw.weather_data
+    ADD COLUMN IF NOT EXISTS request_hash UUID,
+    ADD COLUMN IF NOT EXISTS location_hash UUID;
+
+CREATE OR REPLACE FUNCTION raw.static_block_hash(block JSONB) RETURNS UUID
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT md5(block::text)::uuid
+$$;
+
+-- The 'location' block without the keys that change with every reading
+CREATE OR REPLACE FUNCTION raw.static_location(response JSONB) RETURNS JSONB
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT (response->'location') - 'localtime' - 'localtime_epoch'
+$$;
+
+-- The '_metadata' block the extractor writes for a row with these column values
+-- (weather_pipeline/extract.py: stamp_metadata)
+CREATE OR REPLACE FUNCTION raw.derived_metadata(
+    city_name TEXT,
+    api_call_timestamp TIMESTAMP,
+    ingestion_timestamp TIMESTAMP
+) RETURNS JSONB
+LANGUAGE sql STABLE PARALLEL SAFE AS $$
+    SELECT jsonb_build_object(
+        'city_name', city_name,
+        'api_call_timestamp', to_jsonb(api_call_timestamp),
+        'request_timestamp', to_jsonb(ingestion_timestamp),
+        'ingestion_timestamp', to_jsonb(ingestion_timestamp),
+        'status_code', 200
+    )
+$$;
+
+-- What raw.weather_data.api_response stores for a complete response.
+-- A response with neither a 'request' nor a 'location' block is kept whole, so
+-- "both hashes NULL" always means "api_response is the complete document".
+-- '_metadata' is dropped only when raw.derived_metadata rebuilds it exactly;
+-- a missing one is recorded as JSON null so it is not invented on the way back.
+CREATE OR REPLACE FUNCTION raw.reading_payload(
+    response JSONB,
+    city_name TEXT,
+    api_call_timestamp TIMESTAMP,
+    ingestion_timestamp TIMESTAMP
+) RETURNS JSONB
+LANGUAGE sql STABLE PARALLEL SAFE AS $$
+    SELECT CASE
+        WHEN response->'request' IS NULL AND response->'location' IS NULL THEN response
+        ELSE (response - 'request' - 'location' - '_metadata')
+            || CASE
+                WHEN response->'location' IS NULL THEN '{}'::jsonb
+                ELSE jsonb_build_object('location', (response->'location')
+                    - ARRAY(SELECT jsonb_object_keys(raw.static_location(response))))
+            END
+            || CASE
+                WHEN response->'_metadata'
+                     = raw.derived_metadata(city_name, api_call_timestamp, ingestion_timestamp)
+                    THEN '{}'::jsonb
+                ELSE jsonb_build_object('_metadata', COALESCE(response->'_metadata', 'null'::jsonb))
+            END
+    END
+$$;
+
+-- The documents exactly as received (plus '_metadata'), one row per raw.weather_data row.
+-- Audits and re-parsing (observations backfill, replay) read this view.
+CREATE OR REPLACE VIEW raw.weather_data_full AS
+SELECT
+    w.id,
+    w.city_name,
+    CASE
+        WHEN w.request_hash IS NULL AND w.location_hash IS NULL THEN w.api_response
+        ELSE (w.api_response - 'location' - '_metadata')
+            || CASE WHEN r.block IS NULL THEN '{}'::jsonb
+                    ELSE jsonb_build_object('request', r.block) END
+            || CASE WHEN l.block IS NULL THEN '{}'::jsonb
+                    ELSE jsonb_build_object('location', l.block || COALESCE(w.api_response->'location', '{}'::jsonb)) END
+            || CASE
+                WHEN NOT w.api_response ? '_metadata' THEN jsonb_build_object(
+                    '_metadata', raw.derived_metadata(w.city_name, w.api_call_timestamp, w.ingestion_timestamp))
+                WHEN w.api_response->'_metadata' = 'null'::jsonb THEN '{}'::jsonb
+                ELSE jsonb_build_object('_metadata', w.api_response->'_metadata')
+            END
+    END AS api_response,
+    w.ingestion_timestamp,
+    w.api_call_timestamp,
+    w.source
+FROM raw.weather_data w
+LEFT JOIN raw.weather_static_blocks r ON r.block_hash = w.request_hash
+LEFT JOIN raw.weather_static_blocks l ON l.block_hash = w.location_hash;
+
+-- ============================================================================
+-- 2b. PARTITION MANAGEMENT
+-- ============================================================================
+
+-- Creates the monthly partitions of `parent` from `months_back` months before
+-- the current month up to `months_ahead` months after it. Idempotent.
+-- Rows of a missing month that already sit in the DEFAULT partition would make
+-- CREATE TABLE ... PARTITION OF fail, so for such a month the partition is built
+-- as a plain table, the rows are moved into it out of the default partition,
+-- and it is then attached.
+-- Returns the number of partitions created.
+CREATE OR REPLACE FUNCTION raw.create_monthly_partitions(
+    parent REGCLASS,
+    months_ahead INTEGER DEFAULT 3,
+    months_back INTEGER DEFAULT 0
+) RETURNS INTEGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    parent_schema TEXT;
+    parent_name TEXT;
+    key_column TEXT;
+    default_partition REGCLASS;
+    month_start DATE;
+    month_end DATE;
+    partition_name TEXT;
+    has_default_rows BOOLEAN;
+    created INTEGER := 0;
+BEGIN
+    SELECT n.nspname, c.relname INTO parent_schema, parent_name
+    FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE c.oid = parent;
+
+    SELECT a.attname, NULLIF(pt.partdefid, 0)::regclass INTO key_column, default_partition
+    FROM pg_partitioned_table pt
+    JOIN pg_attribute a ON a.attrelid = pt.partrelid AND a.attnum = pt.partattrs[0]
+    WHERE pt.partrelid = parent;
+
+    FOR i IN -months_back..months_ahead LOOP
+        month_start := (date_trunc('month', now()) + make_interval(months => i))::date;
+        month_end := (month_start + INTERVAL '1 month')::date;
+        partition_name := format('%s_p%s', parent_name, to_char(month_start, 'YYYYMM'));
+
+        IF to_regclass(format('%I.%I', parent_schema, partition_name)) IS NULL THEN
+            has_default_rows := FALSE;
+            IF default_partition IS NOT NULL THEN
+                EXECUTE format('SELECT EXISTS (SELECT 1 FROM %s WHERE %I >= %L AND %I < %L)',
+                               default_partition, key_column, month_start, key_column, month_end)
+                INTO has_default_rows;
+            END IF;
+
+            IF has_default_rows THEN
+                EXECUTE format('CREATE TABLE %I.%I (LIKE %s INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+                               parent_schema, partition_name, parent);
+                EXECUTE format(
+                    'WITH moved AS (DELETE FROM %s WHERE %I >= %L AND %I < %L RETURNING *) '
+                    'INSERT INTO %I.%I SELECT * FROM moved',
+                    default_partition, key_column, month_start, key_column, month_end,
+                    parent_schema, partition_name
+                );
+                -- Attaching also creates the parent's indexes and constraints on the partition
+                EXECUTE format('ALTER TABLE %s ATTACH PARTITION %I.%I FOR VALUES FROM (%L) TO (%L)',
+                               parent, parent_schema, partition_name, month_start, month_end);
+            ELSE
+                EXECUTE format(
+                    'CREATE TABLE %I.%I PARTITION OF %s FOR VALUES FROM (%L) TO (%L)',
+                    parent_schema, partition_name, parent, month_start, month_end
+                );
+            END IF;
+            created := created + 1;
+        END IF;
+    END LOOP;
+
+    RETURN created;
+END;
+$$;
+
+-- Detaches (and unless detach_only, drops) the monthly partitions of `parent`
+-- that end before the start of the retention window. This is a catalog
+-- operation, so it is instant no matter how many rows a partition holds.
+-- Returns the number of partitions removed.
+CREATE OR REPLACE FUNCTION raw.drop_expired_partitions(
+    parent REGCLASS,
+    retention_months INTEGER,
+    detach_only BOOLEAN DEFAULT FALSE
+) RETURNS INTEGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    child RECORD;
+    cutoff DATE := (date_trunc('month', now()) - make_interval(months => retention_months))::date;
+    removed INTEGER := 0;
+BEGIN
+    FOR child IN
+        SELECT n.nspname AS schema_name,
+               c.relname AS partition_name,
+               to_date(substring(c.relname FROM '_p([0-9]{6})$'), 'YYYYMM') AS month_start
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE i.inhparent = parent
+          AND c.relname ~ '_p[0-9]{6}$'
+    LOOP
+        IF child.month_start + INTERVAL '1 month' <= cutoff THEN
+            EXECUTE format('ALTER TABLE %s DETACH PARTITION %I.%I',
+                           parent, child.schema_name, child.partition_name);
+            IF NOT detach_only THEN
+                EXECUTE format('DROP TABLE %I.%I', child.schema_name, child.partition_name);
+            END IF;
+            removed := removed + 1;
+        END IF;
+    END LOOP;
+
+    RETURN removed;
+END;
+$$;
+
+-- Partitions for last month, this month and the next three
+SELECT raw.create_monthly_partitions('raw.weather_data', 3, 1);
+SELECT raw.create_monthly_partitions('raw.weather_observations', 3, 1);
+
+-- ============================================================================
+-- 2c. SERVING TABLE
+-- ============================================================================
+
+-- Latest observation per city, upserted by the loader in the same transaction
+-- as the raw rows (weather_pipeline/load.py). "Current conditions" lookups and
+-- freshness checks read one row per city here instead of scanning history.
+-- After each commit that changed it, the loader sends a NOTIFY on channel
+-- 'weather_current_conditions' so readers (weather_pipeline/serve.py) can drop
+-- their caches.
+CREATE TABLE IF NOT EXISTS analytics.current_conditions (
+    city_name TEXT PRIMARY KEY,
+    weather_data_id BIGINT NOT NULL,   -- raw.weather_data.id of the reading
+    api_call_timestamp TIMESTAMP NOT NULL,
+    ingestion_timestamp TIMESTAMP NOT NULL,
+    temperature REAL,
+    feels_like REAL,
+    humidity SMALLINT,
+    pressure SMALLINT,
+    wind_speed REAL,
+    wind_degree SMALLINT,
+    wind_direction VARCHAR(3),
+    precipitation REAL,
+    cloud_cover SMALLINT,
+    uv_index SMALLINT,
+    visibility SMALLINT,
+    weather_description TEXT,
+    country TEXT,
+    region TEXT,
+    latitude DOUBLE PRECISION,
+    longitude DOUBLE PRECISION,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+-- Databases that already hold observations start from their latest reading per city
+INSERT INTO analytics.current_conditions (
+    city_name, weather_data_id, api_call_timestamp, ingestion_timestamp,
+    temperature, feels_like, humidity, pressure, wind_speed, wind_degree,
+    wind_direction, precipitation, cloud_cover, uv_index, visibility,
+    weather_description, country, region, latitude, longitude
+)
+SELECT DISTINCT ON (city_name)
+    city_name, weather_data_id, api_call_timestamp, ingestion_timestamp,
+    temperature, feels_like, humidity, pressure, wind_speed, wind_degree,
+    wind_direction, precipitation, cloud_cover, uv_index, visibility,
+    weather_description, country, region, latitude, longitude
+FROM raw.weather_observations
+ORDER BY city_name, api_call_timestamp DESC
+ON CONFLICT (city_name) DO NOTHING;
+
 -- ============================================================================
 -- 3. PERFORMANCE OPTIMIZATION
 -- ============================================================================
 
--- Index for efficient querying by city and time (common access patterns)
-CREATE INDEX IF NOT EXISTS idx_raw_weather_city_time 
-ON raw.weather_data(city_name, ingestion_timestamp);
+-- Indexes follow the queries we actually run, because every index is paid
+-- for on each ingested row (benchmarks/bench_raw_indexes.py measures the trade-off):
+--
+-- * (city_name, api_call_timestamp): covered by the UNIQUE constraint above, which
+--   is a btree. It serves the loader's ON CONFLICT and per-city lookups; no extra index.
+-- * api_call_timestamp: freshness checks and time-bounded queries. Rows arrive in
+--   roughly timestamp order, so a BRIN index (a few pages per partition) is enough
+--   and costs almost nothing on insert. Partition pruning does the coarse filtering.
+-- * ingestion_timestamp: the incremental dbt models' high-water-mark filter. Also
+--   append-only, so also BRIN.
+-- * No GIN index on api_response: no query filters inside the JSON document
+--   (the measurements are read from raw.weather_observations, and the static
+--   location data lives once per city in raw.weather_static_blocks). If one ever does,
+--   add an expression index on that path, or a jsonb_path_ops GIN index for
+--   containment (@>) queries, rather than a default-opclass GIN on the whole document.
+
+CREATE INDEX IF NOT EXISTS idx_raw_weather_api_call_brin
+ON raw.weather_data USING brin (api_call_timestamp);
+
+CREATE INDEX IF NOT EXISTS idx_raw_weather_ingestion_brin
+ON raw.weather_data USING brin (ingestion_timestamp);
 
--- GIN index allows high-speed querying within the JSONB structure itself
-CREATE INDEX IF NOT EXISTS idx_raw_weather_json 
-ON raw.weather_data USING gin (api_response);
+CREATE INDEX IF NOT EXISTS idx_raw_observations_ingestion_brin
+ON raw.weather_observations USING brin (ingestion_timestamp);
 
 -- ============================================================================
 -- 4. PERMISSIONS
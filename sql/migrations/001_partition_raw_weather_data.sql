@@ -0,0 +1,53 @@
+-- Migration: convert the unpartitioned raw tables into the monthly-partitioned
+-- layout defined in sql/init_db.sql.
+--
+-- Run with psql from the repository root (\ir resolves relative to this file):
+--   psql -U airflow -d weather_db -v ON_ERROR_STOP=1 -f sql/migrations/001_partition_raw_weather_data.sql
+--
+-- The old tables are kept as raw.*_legacy; drop them once the row counts check out.
+
+BEGIN;
+
+ALTER TABLE raw.weather_data RENAME TO weather_data_legacy;
+ALTER TABLE IF EXISTS raw.weather_observations RENAME TO weather_observations_legacy;
+
+-- Index names are unique per schema, so move the old ones out of the way
+ALTER INDEX IF EXISTS raw.idx_raw_weather_city_time RENAME TO idx_raw_weather_city_time_legacy;
+ALTER INDEX IF EXISTS raw.idx_raw_weather_json RENAME TO idx_raw_weather_json_legacy;
+
+-- Create the partitioned tables, partition functions and indexes
+\ir ../init_db.sql
+
+-- Partitions covering the whole legacy history
+DO $$
+DECLARE
+    oldest TIMESTAMP;
+    months_back INTEGER;
+BEGIN
+    SELECT min(api_call_timestamp) INTO oldest FROM raw.weather_data_legacy;
+    IF oldest IS NOT NULL THEN
+        months_back := (extract(year FROM age(date_trunc('month', now()), date_trunc('month', oldest))) * 12
+                        + extract(month FROM age(date_trunc('month', now()), date_trunc('month', oldest))))::int;
+        PERFORM raw.create_monthly_partitions('raw.weather_data', 3, months_back);
+        PERFORM raw.create_monthly_partitions('raw.weather_observations', 3, months_back);
+    END IF;
+END;
+$$;
+
+-- Rows without the columns the new constraints require cannot be carried over
+INSERT INTO raw.weather_data (id, city_name, api_response, ingestion_timestamp, api_call_timestamp, source)
+SELECT id, city_name, api_response, coalesce(ingestion_timestamp, api_call_timestamp), api_call_timestamp, source
+FROM raw.weather_data_legacy
+WHERE city_name IS NOT NULL AND api_response IS NOT NULL AND api_call_timestamp IS NOT NULL
+ORDER BY id
+ON CONFLICT DO NOTHING;
+
+SELECT setval(
+    pg_get_serial_sequence('raw.weather_data', 'id'),
+    (SELECT coalesce(max(id), 1) FROM raw.weather_data)
+);
+
+COMMIT;
+
+-- Typed observations are re-derived from the migrated rows afterwards:
+--   cd airflow/dags && python -m weather_pipeline.observations
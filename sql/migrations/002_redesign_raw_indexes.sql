@@ -0,0 +1,21 @@
+-- Migration: replace the original raw.weather_data indexes with the
+-- access-path-driven set defined in sql/init_db.sql.
+--
+--   psql -U airflow -d weather_db -v ON_ERROR_STOP=1 -f sql/migrations/002_redesign_raw_indexes.sql
+--
+-- * The default-opclass GIN index on the whole api_response document is dropped:
+--   no query filters inside the JSON, and it was the largest per-row write cost.
+-- * The (city_name, ingestion_timestamp) btree is dropped: lookups go through
+--   the (city_name, api_call_timestamp) unique constraint instead.
+
+DROP INDEX IF EXISTS raw.idx_raw_weather_json;
+DROP INDEX IF EXISTS raw.idx_raw_weather_city_time;
+
+CREATE INDEX IF NOT EXISTS idx_raw_weather_api_call_brin
+ON raw.weather_data USING brin (api_call_timestamp);
+
+CREATE INDEX IF NOT EXISTS idx_raw_weather_ingestion_brin
+ON raw.weather_data USING brin (ingestion_timestamp);
+
+CREATE INDEX IF NOT EXISTS idx_raw_observations_ingestion_brin
+ON raw.weather_observations USING brin (ingestion_timestamp);
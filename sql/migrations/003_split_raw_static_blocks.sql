@@ -0,0 +1,64 @@
+-- Migration: move the static 'request' and 'location' blocks of existing
+-- raw.weather_data rows into raw.weather_static_blocks, keeping only the
+-- per-reading payload in each row (see "Static blocks" in sql/init_db.sql).
+--
+-- Run with psql from the repository root (\ir resolves relative to this file),
+-- outside a transaction block: each batch commits on its own, so the migration
+-- can be interrupted and re-run (converted rows are skipped):
+--   psql -U airflow -d weather_db -v ON_ERROR_STOP=1 -f sql/migrations/003_split_raw_static_blocks.sql
+--
+-- Before/after, the reassembled documents can be compared with:
+--   SELECT count(*) FROM raw.weather_data_full f JOIN <backup> b USING (id) WHERE f.api_response <> b.api_response;
+--
+-- Updated rows leave dead tuples behind. Space is only returned to the operating
+-- system once each partition is rewritten, e.g. VACUUM FULL on one (closed)
+-- monthly partition at a time, or pg_repack to avoid the exclusive lock.
+
+-- Static blocks table, hash columns, split/reassembly functions and raw.weather_data_full
+\ir ../init_db.sql
+
+DO $$
+DECLARE
+    batch_size CONSTANT BIGINT := 50000;
+    min_id BIGINT;
+    max_id BIGINT;
+    batch_start BIGINT;
+    converted BIGINT;
+BEGIN
+    SELECT min(id), max(id) INTO min_id, max_id FROM raw.weather_data;
+    IF min_id IS NULL THEN
+        RETURN;
+    END IF;
+
+    batch_start := min_id;
+    WHILE batch_start <= max_id LOOP
+        INSERT INTO raw.weather_static_blocks (block_hash, block_type, block)
+        SELECT DISTINCT raw.static_block_hash(b.block), b.block_type, b.block
+        FROM raw.weather_data w
+        CROSS JOIN LATERAL (VALUES
+            ('request', w.api_response->'request'),
+            ('location', raw.static_location(w.api_response))
+        ) AS b (block_type, block)
+        WHERE w.id >= batch_start AND w.id < batch_start + batch_size
+          AND w.request_hash IS NULL AND w.location_hash IS NULL
+          AND b.block IS NOT NULL
+        ON CONFLICT (block_hash) DO NOTHING;
+
+        UPDATE raw.weather_data w
+        SET api_response = raw.reading_payload(w.api_response, w.city_name, w.api_call_timestamp, w.ingestion_timestamp),
+            request_hash = raw.static_block_hash(w.api_response->'request'),
+            location_hash = raw.static_block_hash(raw.static_location(w.api_response))
+        WHERE w.id >= batch_start AND w.id < batch_start + batch_size
+          AND w.request_hash IS NULL AND w.location_hash IS NULL
+          AND (w.api_response ? 'request' OR w.api_response ? 'location');
+        GET DIAGNOSTICS converted = ROW_COUNT;
+
+        COMMIT;
+        RAISE NOTICE 'Converted ids % - %: % rows', batch_start, batch_start + batch_size - 1, converted;
+        batch_start := batch_start + batch_size;
+    END LOOP;
+END;
+$$;
+
+ANALYZE raw.weather_data;
+ANALYZE raw.weather_static_blocks;
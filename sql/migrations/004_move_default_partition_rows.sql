@@ -0,0 +1,15 @@
+-- Migration: update raw.create_monthly_partitions so it moves rows already in
+-- the DEFAULT partition into the month partition it creates, instead of failing.
+--
+--   psql -U airflow -d weather_db -v ON_ERROR_STOP=1 -f sql/migrations/004_move_default_partition_rows.sql
+--
+-- init_db.sql is idempotent; re-running it replaces the partition functions.
+-- Afterwards, the rows still waiting in the default partitions are moved by:
+--   SELECT raw.create_monthly_partitions('raw.weather_data', 3, <months back>);
+--   SELECT raw.create_monthly_partitions('raw.weather_observations', 3, <months back>);
+
+BEGIN;
+
+\ir ../init_db.sql
+
+COMMIT;
@@ -1,8 +1,13 @@
 import os
-import requests
+import sys
 import json
+import requests
 from dotenv import load_dotenv
 
+# The WeatherStack client lives next to the DAGs so Airflow can import it too
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "airflow", "dags"))
+from weather_pipeline.client import WeatherStackAPIError, WeatherStackClient
+
 # Load environment variables
 load_dotenv()
 
@@ -12,22 +17,9 @@ def get_weather(city_name):
         print("Error: WEATHERSTACK_API_KEY not found in .env file.")
         return
 
-    base_url = "http://api.weatherstack.com/current"
-    params = {
-        "access_key": api_key,
-        "query": city_name
-    }
-
     try:
-        response = requests.get(base_url, params=params)
-        response.raise_for_status()
-
-        data = response.json()
-        
-        # Check for API-specific errors (WeatherStack returns 200 even for some errors)
-        if "error" in data:
-            print(f"API Error for {city_name}: {data['error']['info']}")
-            return
+        with WeatherStackClient(api_key) as client:
+            data = client.get_current(city_name)
 
         # Print full JSON response
         print(f"--- Full Response for {city_name} ---")
@@ -48,6 +40,9 @@ def get_weather(city_name):
         print(f"Humidity: {humidity}%")
         print(f"Weather: {description}")
         
+    except WeatherStackAPIError as e:
+        # WeatherStack returns 200 even for some errors; the client raises a typed error instead
+        print(f"API Error for {city_name}: {e.info}")
     except requests.exceptions.RequestException as e:
         print(f"Error fetching data for {city_name}: {e}")
 
@@ -1,31 +1,26 @@
 import os
 import sys
 import psycopg2
-from psycopg2 import sql
 import time
 
-# Get database connection details from environment variables
+# Share the pipeline's pooled database access (airflow/dags locally, /opt/airflow/dags in the container)
+_local_dags = os.path.join(os.path.dirname(os.path.abspath(__file__)), "airflow", "dags")
+sys.path.insert(0, _local_dags if os.path.isdir(_local_dags) else "/opt/airflow/dags")
+from weather_pipeline.db import get_connection_params, get_pool
+
+# Database connection details come from environment variables (POSTGRES_*, or
+# WEATHER_DB_HOST/WEATHER_DB_PORT to go through PgBouncer)
 # In Docker, these are injected from .env
 # If running locally, make sure these are set in your environment
-DB_HOST = os.getenv("POSTGRES_HOST", "localhost")
-DB_NAME = os.getenv("POSTGRES_DB", "weather_db")
-DB_USER = os.getenv("POSTGRES_USER", "airflow")
-DB_PASS = os.getenv("POSTGRES_PASSWORD", "airflow")
-DB_PORT = os.getenv("POSTGRES_PORT", "5432")
 
 def wait_for_db(retries=5, delay=2):
     """Wait for database to become available"""
-    print(f"Connecting to database {DB_NAME} at {DB_HOST}:{DB_PORT}...")
+    params = get_connection_params()
+    print(f"Connecting to database {params['database']} at {params['host']}:{params['port']}...")
     
     for i in range(retries):
         try:
-            conn = psycopg2.connect(
-                host=DB_HOST,
-                database=DB_NAME,
-                user=DB_USER,
-                password=DB_PASS,
-                port=DB_PORT
-            )
+            conn = get_pool().acquire()
             print("✅ Successfully connected to PostgreSQL!")
             return conn
         except psycopg2.OperationalError as e:
@@ -56,7 +51,7 @@ def check_schemas(cur):
 
 def check_tables(cur):
     """Verify that key tables exist"""
-    required_tables = [('raw', 'weather_data')]
+    required_tables = [('raw', 'weather_data'), ('analytics', 'current_conditions')]
     missing = []
     
     print("\nChecking tables...")
@@ -99,7 +94,7 @@ def main():
         sys.exit(1)
     finally:
         if conn:
-            conn.close()
+            get_pool().release(conn)
 
 if __name__ == "__main__":
     main()
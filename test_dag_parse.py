@@ -0,0 +1,148 @@
+"""
+DAG parse-time budget check.
+
+The scheduler re-imports every DAG file continuously, so anything slow at
+import time delays scheduling for all DAGs. For each file in the DAG folder
+this script, in a fresh interpreter per repetition (like the scheduler's DAG
+file processor, which already has Airflow loaded):
+1. imports Airflow (not timed),
+2. times parsing the file with a DagBag,
+3. reports heavy modules the file pulled in and each DAG's start_date.
+
+It fails if the median parse time is over the budget, if parsing raised, if a
+heavy module was imported at parse time, or if a start_date changes between parses.
+
+Usage (where Airflow is installed, e.g. inside the Airflow container):
+    python test_dag_parse.py --budget 0.5 --repeat 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# ANSI Colors
+GREEN = '\033[92m'
+RED = '\033[91m'
+YELLOW = '\033[93m'
+RESET = '\033[0m'
+
+DEFAULT_BUDGET_SECONDS = 0.5
+
+# Modules that only tasks need; importing them while parsing costs every parse
+HEAVY_MODULES = ("requests", "psycopg2", "dotenv", "pandas", "dbt", "prometheus_client", "pyarrow")
+
+PARSE_SNIPPET = """
+import json, sys, time
+from airflow.models.dagbag import DagBag
+
+before = set(sys.modules)
+started = time.perf_counter()
+bag = DagBag(dag_folder=sys.argv[1], include_examples=False, safe_mode=False)
+seconds = time.perf_counter() - started
+heavy = sorted({name.split(".")[0] for name in set(sys.modules) - before} & set(sys.argv[2].split(",")))
+print(json.dumps({
+    "seconds": seconds,
+    "dags": {dag_id: str(dag.start_date) for dag_id, dag in bag.dags.items()},
+    "errors": {path: str(error) for path, error in bag.import_errors.items()},
+    "heavy_modules": heavy,
+}))
+"""
+
+
+def print_pass(msg):
+    print(f"{GREEN}PASS: {msg}{RESET}")
+
+
+def print_fail(msg):
+    print(f"{RED}FAIL: {msg}{RESET}")
+
+
+def print_warn(msg):
+    print(f"{YELLOW}WARN: {msg}{RESET}")
+
+
+def default_dags_folder():
+    local = os.path.join(os.path.dirname(os.path.abspath(__file__)), "airflow", "dags")
+    return os.getenv("AIRFLOW__CORE__DAGS_FOLDER") or (local if os.path.isdir(local) else "/opt/airflow/dags")
+
+
+def parse_once(path):
+    result = subprocess.run(
+        [sys.executable, "-c", PARSE_SNIPPET, path, ",".join(HEAVY_MODULES)],
+        capture_output=True, text=True, cwd=os.path.dirname(path),
+        env={**os.environ, "PYTHONPATH": os.path.dirname(path)}
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else "parser crashed")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def check_dag_file(path, budget, repeat):
+    name = os.path.basename(path)
+    print(f"\n--- {name} ---")
+    try:
+        runs = [parse_once(path) for _ in range(repeat)]
+    except Exception as e:
+        print_fail(f"{name} could not be parsed: {e}")
+        return False
+
+    ok = True
+    median = statistics.median(run["seconds"] for run in runs)
+    if median <= budget:
+        print_pass(f"Median parse time {median * 1000:.0f} ms (budget {budget * 1000:.0f} ms)")
+    else:
+        print_fail(f"Median parse time {median * 1000:.0f} ms is over the budget of {budget * 1000:.0f} ms")
+        ok = False
+
+    if runs[0]["errors"]:
+        for error_path, error in runs[0]["errors"].items():
+            print_fail(f"Import error in {error_path}: {error}")
+        ok = False
+
+    if runs[0]["heavy_modules"]:
+        print_fail(f"Imported at parse time: {', '.join(runs[0]['heavy_modules'])} (import them inside the tasks)")
+        ok = False
+    else:
+        print_pass("No heavy modules imported at parse time")
+
+    for dag_id, start_date in runs[0]["dags"].items():
+        if all(run["dags"].get(dag_id) == start_date for run in runs):
+            print_pass(f"{dag_id}: start_date is stable ({start_date})")
+        else:
+            print_fail(f"{dag_id}: start_date changes between parses")
+            ok = False
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check DAG parse time against a budget.")
+    parser.add_argument("--dags-folder", default=default_dags_folder())
+    parser.add_argument("--budget", type=float,
+                        default=float(os.getenv("WEATHER_DAG_PARSE_BUDGET_SECONDS", DEFAULT_BUDGET_SECONDS)),
+                        help="Maximum median parse time per file, in seconds.")
+    parser.add_argument("--repeat", type=int, default=5, help="Parses per file.")
+    args = parser.parse_args()
+
+    print("==========================================")
+    print("        DAG PARSE TIME VALIDATION")
+    print("==========================================")
+    files = sorted(
+        os.path.join(args.dags_folder, name) for name in os.listdir(args.dags_folder)
+        if name.endswith(".py")
+    )
+    if not files:
+        print_warn(f"No DAG files found in {args.dags_folder}")
+        sys.exit(1)
+
+    results = [check_dag_file(path, args.budget, max(1, args.repeat)) for path in files]
+
+    print("\n==========================================")
+    print("           VALIDATION COMPLETE")
+    print("==========================================")
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == "__main__":
+    main()
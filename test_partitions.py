@@ -0,0 +1,118 @@
+"""
+Check of raw.create_monthly_partitions against rows waiting in the DEFAULT partition.
+
+Creating a month's partition while the default partition holds rows of that
+month must move those rows into the new partition instead of failing. The check
+builds a scratch partitioned table, runs the function from sql/init_db.sql on
+it and rolls everything back, so it leaves the database unchanged.
+
+Usage (against the pipeline database, e.g. inside the Airflow container):
+    python test_partitions.py
+"""
+import os
+import sys
+from datetime import date
+
+# Share the pipeline's pooled database access (airflow/dags locally, /opt/airflow/dags in the container)
+_local_dags = os.path.join(os.path.dirname(os.path.abspath(__file__)), "airflow", "dags")
+sys.path.insert(0, _local_dags if os.path.isdir(_local_dags) else "/opt/airflow/dags")
+from weather_pipeline.db import get_pool
+
+# ANSI Colors
+GREEN = '\033[92m'
+RED = '\033[91m'
+RESET = '\033[0m'
+
+TABLE = "raw.partition_check"
+
+
+def print_pass(msg):
+    print(f"{GREEN}PASS: {msg}{RESET}")
+
+
+def print_fail(msg):
+    print(f"{RED}FAIL: {msg}{RESET}")
+
+
+def add_months(day, months):
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def check_default_rows_are_moved(cur):
+    failures = 0
+    cur.execute(f"""
+        CREATE TABLE {TABLE} (
+            id BIGINT NOT NULL,
+            city_name TEXT NOT NULL,
+            api_call_timestamp TIMESTAMP NOT NULL,
+            PRIMARY KEY (id, api_call_timestamp),
+            UNIQUE (city_name, api_call_timestamp)
+        ) PARTITION BY RANGE (api_call_timestamp);
+        CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT;
+    """)
+    cur.execute("SELECT date_trunc('month', now())::date;")
+    this_month = cur.fetchone()[0]
+    next_month = add_months(this_month, 1)
+    far_future = add_months(this_month, 60)
+    # Rows of next month and of a month that gets no partition, both in the default partition
+    cur.execute(
+        f"INSERT INTO {TABLE} VALUES (1, 'London', %s), (2, 'Paris', %s), (3, 'Tokyo', %s);",
+        (next_month, add_months(this_month, 2), far_future)
+    )
+
+    cur.execute("SELECT raw.create_monthly_partitions(%s::regclass, 2, 0);", (TABLE,))
+    created = cur.fetchone()[0]
+    if created == 3:
+        print_pass("Created this month's and the next two months' partitions")
+    else:
+        print_fail(f"Expected 3 partitions, created {created}")
+        failures += 1
+
+    cur.execute(f"SELECT tableoid::regclass::text, id FROM {TABLE} ORDER BY id;")
+    placement = dict((row_id, partition) for partition, row_id in cur.fetchall())
+    expected = {
+        1: f"{TABLE}_p{next_month:%Y%m}",
+        2: f"{TABLE}_p{add_months(this_month, 2):%Y%m}",
+        3: f"{TABLE}_default",
+    }
+    if placement == expected:
+        print_pass("Rows moved out of the default partition into their month; other rows stayed")
+    else:
+        print_fail(f"Rows are in {placement}, expected {expected}")
+        failures += 1
+
+    # The attached partition carries the parent's unique constraint
+    cur.execute("SAVEPOINT duplicate_check;")
+    try:
+        cur.execute(f"INSERT INTO {TABLE} VALUES (4, 'London', %s);", (next_month,))
+        print_fail("Duplicate (city_name, api_call_timestamp) accepted by the moved partition")
+        failures += 1
+    except Exception:
+        print_pass("Moved partition enforces the parent's unique constraint")
+    cur.execute("ROLLBACK TO SAVEPOINT duplicate_check;")
+
+    cur.execute("SELECT raw.create_monthly_partitions(%s::regclass, 2, 0);", (TABLE,))
+    if cur.fetchone()[0] == 0:
+        print_pass("Second call is a no-op")
+    else:
+        print_fail("Second call created partitions again")
+        failures += 1
+    return failures
+
+
+def main():
+    pool = get_pool()
+    conn = pool.acquire()
+    try:
+        with conn.cursor() as cur:
+            failures = check_default_rows_are_moved(cur)
+    finally:
+        # Nothing of the check is kept
+        conn.rollback()
+        pool.release(conn)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
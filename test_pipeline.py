@@ -1,5 +1,4 @@
 import os
-import psycopg2
 import sys
 import subprocess
 from datetime import datetime, timedelta
@@ -7,6 +6,13 @@ from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv('/opt/airflow/.env')
+# Default to the compose service name when testing inside the container
+os.environ.setdefault('POSTGRES_HOST', 'postgres')
+
+# Share the pipeline's pooled database access (airflow/dags locally, /opt/airflow/dags in the container)
+_local_dags = os.path.join(os.path.dirname(os.path.abspath(__file__)), "airflow", "dags")
+sys.path.insert(0, _local_dags if os.path.isdir(_local_dags) else "/opt/airflow/dags")
+from weather_pipeline.db import get_pool
 
 # ANSI Colors
 GREEN = '\033[92m'
@@ -47,20 +53,8 @@ def check_docker_containers():
 def check_postgres_connection():
     print("\n--- 2. Checking PostgreSQL Connection ---")
     try:
-        # Try getting env vars, default to airflow/airflow for testing inside container
-        user = os.getenv('POSTGRES_USER', 'airflow')
-        password = os.getenv('POSTGRES_PASSWORD', 'airflow')
-        host = os.getenv('POSTGRES_HOST', 'postgres')
-        db = os.getenv('POSTGRES_DB', 'weather_db')
-        port = os.getenv('POSTGRES_PORT', '5432')
-
-        conn = psycopg2.connect(
-            user=user,
-            password=password,
-            host=host,
-            port=port,
-            database=db
-        )
+        # Same settings, pool and statement timeout as the DAG (POSTGRES_* / WEATHER_DB_* env vars)
+        conn = get_pool().acquire()
         print_pass("Successfully connected to PostgreSQL")
         return conn
     except Exception as e:
@@ -93,11 +87,12 @@ def check_data_freshness(conn):
     print("\n--- 4. Checking Data Freshness ---")
     try:
         with conn.cursor() as cur:
+            # One row per city (kept current by the loader), instead of scanning raw history
             cur.execute("""
-                SELECT MAX(api_call_timestamp) 
-                FROM raw.weather_data;
+                SELECT MAX(api_call_timestamp), COUNT(*)
+                FROM analytics.current_conditions;
             """)
-            last_run = cur.fetchone()[0]
+            last_run, city_count = cur.fetchone()
             
             if last_run:
                 # Assuming timestamp is in Postgres (naive or aware)
@@ -109,12 +104,13 @@ def check_data_freshness(conn):
                 
                 diff = now - last_run
                 if diff < timedelta(hours=2):
-                    print_pass(f"Data is fresh! Last run: {last_run} (Age: {diff})")
+                    print_pass(f"Data is fresh! Last run: {last_run} (Age: {diff}, {city_count} cities)")
                 else:
                     print_fail(f"Data is stale. Last run: {last_run} (Age: {diff})")
             else:
-                print_fail("No data found in raw.weather_data")
+                print_fail("No data found in analytics.current_conditions")
     except Exception as e:
+        conn.rollback()
         print_fail(f"Error checking freshness: {e}")
 
 def verify_models(conn):
@@ -126,10 +122,12 @@ def verify_models(conn):
     # We will look in 'staging' and 'public'.
     
     models = [
-        ('staging', 'stg_weather', 'view'),
+        ('staging', 'stg_weather', 'table'),
         ('staging', 'dim_cities', 'table'),
         ('staging', 'dim_time', 'table'),
-        ('staging', 'fact_weather', 'table')
+        ('staging', 'fact_weather', 'table'),
+        ('staging', 'agg_weather_hourly', 'table'),
+        ('staging', 'agg_weather_daily', 'table')
     ]
     
     with conn.cursor() as cur:
@@ -163,17 +161,18 @@ def verify_models(conn):
 
 def run_analytics_query(conn):
     print("\n--- 7. Sample Analytics Query ---")
+    # Reads the hourly rollup (a few rows per city) instead of aggregating the
+    # whole fact table; the average is derived from the stored sums and counts.
     query = """
     SELECT 
         c.city_name,
-        ROUND(AVG(f.temperature)::numeric, 2) as avg_temp_24h,
-        MAX(f.temperature) as max_temp,
-        MIN(f.temperature) as min_temp,
-        COUNT(*) as readings
-    FROM staging.fact_weather f
-    JOIN staging.dim_cities c ON f.city_id = c.city_id
-    JOIN staging.dim_time t ON f.time_id = t.time_id
-    WHERE t.timestamp >= NOW() - INTERVAL '24 hours'
+        ROUND((SUM(h.temperature_sum) / SUM(h.reading_count))::numeric, 2) as avg_temp_24h,
+        MAX(h.temperature_max) as max_temp,
+        MIN(h.temperature_min) as min_temp,
+        SUM(h.reading_count) as readings
+    FROM staging.agg_weather_hourly h
+    JOIN staging.dim_cities c ON h.city_id = c.city_id
+    WHERE h.time_key >= to_char(date_trunc('hour', NOW() - INTERVAL '24 hours'), 'YYYYMMDDHH24')::integer
     GROUP BY c.city_name
     ORDER BY avg_temp_24h DESC;
     """
@@ -217,7 +216,7 @@ def main():
         check_data_freshness(conn)
         verify_models(conn)
         run_analytics_query(conn)
-        conn.close()
+        get_pool().release(conn)
     else:
         print_fail("Stopping tests due to DB connection failure")
         sys.exit(1)
@@ -0,0 +1,126 @@
+"""
+Combined API request rate of the DAG shards.
+
+Every mapped city shard extracts in its own process with its own token bucket.
+This script plans shards the way plan_city_shards does, runs one bucket per
+shard that Airflow would run at the same time (plus the streaming service's
+bucket) flat out for a few seconds, and checks that together they never send
+more requests than WEATHERSTACK_RATE_LIMIT_RPS allows. It also checks that the
+DAG allows only one active run, since the split assumes a single run's shards.
+
+Usage (no API key or database needed):
+    python test_rate_limit.py --cities 10000 --rps 5 --max-parallel-shards 16 --stream-rps 1
+"""
+import argparse
+import ast
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "airflow", "dags"))
+from weather_pipeline.cities import plan_shards
+from weather_pipeline.extract import split_rate_limit
+from weather_pipeline.ratelimit import TokenBucket
+
+# ANSI Colors
+GREEN = '\033[92m'
+RED = '\033[91m'
+RESET = '\033[0m'
+
+
+def print_pass(msg):
+    print(f"{GREEN}PASS: {msg}{RESET}")
+
+
+def print_fail(msg):
+    print(f"{RED}FAIL: {msg}{RESET}")
+
+
+def drain(bucket, stop, counter, lock):
+    """Takes tokens as fast as the bucket allows until `stop` is set."""
+    while not stop.is_set():
+        bucket.acquire()
+        if stop.is_set():
+            return
+        with lock:
+            counter[0] += 1
+
+
+def measure_combined_rate(buckets, seconds):
+    """Returns the number of tokens all buckets handed out in `seconds`."""
+    stop = threading.Event()
+    counter = [0]
+    lock = threading.Lock()
+    threads = [threading.Thread(target=drain, args=(bucket, stop, counter, lock), daemon=True)
+               for bucket in buckets]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    with lock:
+        return counter[0]
+
+
+def dag_max_active_runs(path, dag_id="weather_etl_pipeline"):
+    """Reads max_active_runs from the DAG(...) call of `dag_id` without importing Airflow."""
+    with open(path) as f:
+        tree = ast.parse(f.read())
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call) and getattr(node.func, "id", None) == "DAG":
+            kwargs = {kw.arg: kw.value for kw in node.keywords}
+            if isinstance(kwargs.get("dag_id"), ast.Constant) and kwargs["dag_id"].value == dag_id:
+                value = kwargs.get("max_active_runs")
+                # Airflow's default (core.max_active_runs_per_dag) is 16
+                return value.value if isinstance(value, ast.Constant) else 16
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the combined request rate of parallel city shards.")
+    parser.add_argument("--cities", type=int, default=10000)
+    parser.add_argument("--shard-size", type=int, default=500)
+    parser.add_argument("--rps", type=float, default=5.0, help="WEATHERSTACK_RATE_LIMIT_RPS")
+    parser.add_argument("--max-parallel-shards", type=int, default=16, help="WEATHER_MAX_PARALLEL_SHARDS")
+    parser.add_argument("--stream-rps", type=float, default=1.0, help="WEATHER_STREAM_RATE_LIMIT_RPS")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    failures = 0
+    shards = plan_shards([f"city{i}" for i in range(args.cities)], shard_size=args.shard_size)
+    shard_rps = split_rate_limit(args.rps, len(shards), args.max_parallel_shards, args.stream_rps)
+    running = min(len(shards), args.max_parallel_shards)
+
+    planned = shard_rps * running + args.stream_rps
+    if planned <= args.rps + 1e-9:
+        print_pass(f"{running} parallel shards x {shard_rps:.3f} req/s + stream {args.stream_rps} req/s "
+                   f"= {planned:.3f} <= {args.rps} req/s")
+    else:
+        print_fail(f"Planned rates add up to {planned:.3f} req/s, over the {args.rps} req/s cap")
+        failures += 1
+
+    dag_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "airflow", "dags", "weather_etl.py")
+    active_runs = dag_max_active_runs(dag_path)
+    if active_runs == 1:
+        print_pass("weather_etl_pipeline allows one active run, so shards of two runs never overlap")
+    else:
+        print_fail(f"weather_etl_pipeline allows {active_runs} active runs; overlapping runs multiply the rate")
+        failures += 1
+
+    buckets = [TokenBucket(shard_rps) for _ in range(running)]
+    if args.stream_rps > 0:
+        buckets.append(TokenBucket(args.stream_rps))
+    sent = measure_combined_rate(buckets, args.seconds)
+    # Each bucket may start with a full burst; beyond that only the cap counts
+    allowed = args.rps * args.seconds + sum(bucket.capacity for bucket in buckets)
+    if sent <= allowed:
+        print_pass(f"{sent} requests in {args.seconds}s (at most {allowed:.0f} allowed)")
+    else:
+        print_fail(f"{sent} requests in {args.seconds}s, over the {allowed:.0f} allowed")
+        failures += 1
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())